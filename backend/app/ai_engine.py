@@ -149,15 +149,20 @@ def evaluate_tennis_mode(indicators: dict, config: Optional[BotConfig]) -> tuple
     return "HOLD", 0.0, reason + "Waiting for edge bounce"
 
 
-async def get_trading_recommendation(symbol: str, config: Optional[BotConfig] = None) -> dict:
+async def get_trading_recommendation(symbol: str, config: Optional[BotConfig] = None,
+                                     candles: Optional[List[dict]] = None,
+                                     ticker: Optional[dict] = None) -> dict:
     """
     Generate AI trading recommendation based on technical analysis
     Returns: action (BUY/SELL/HOLD), confidence, reasoning
+    Pass prefetched 1h `candles`/`ticker` to skip the market data calls.
     """
     try:
         # Fetch market data
-        candles = await get_candlestick_data(symbol, "1h", 100)
-        ticker = await get_current_price(symbol)
+        if candles is None:
+            candles = await get_candlestick_data(symbol, "1h", 100)
+        if ticker is None:
+            ticker = await get_current_price(symbol)
         
         # Calculate indicators
         indicators = await calculate_technical_indicators(candles)
@@ -448,12 +453,14 @@ async def get_advanced_analysis(symbol: str) -> dict:
         }
 
 
-async def calculate_risk_assessment(symbol: str, config: BotConfig) -> dict:
+async def calculate_risk_assessment(symbol: str, config: BotConfig, candles: Optional[List[dict]] = None) -> dict:
     """
     Calculate risk assessment for Gods Hand trading
+    Pass prefetched 1h `candles` to skip the market data call.
     """
     try:
-        candles = await get_candlestick_data(symbol, "1h", 100)
+        if candles is None:
+            candles = await get_candlestick_data(symbol, "1h", 100)
         indicators = await calculate_technical_indicators(candles)
         
         # Calculate volatility risk
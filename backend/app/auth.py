@@ -9,8 +9,10 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.db import get_db
+from app.db_async import ASYNC_DB_REQUESTS, get_async_db
 from app.models import User
 
 # Security Configuration
@@ -72,25 +74,37 @@ def verify_token(token: str, token_type: str = "access"):
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    """Get current user from token"""
-    token = credentials.credentials
-    payload = verify_token(token, "access")
-    
+def _user_from_token(credentials: HTTPAuthorizationCredentials) -> int:
+    payload = verify_token(credentials.credentials, "access")
     user_id: int = payload.get("user_id")
     if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token payload")
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    return user_id
+
+
+def _user_dict(user: Optional[User]) -> dict:
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    
     return user.to_dict()
 
 
+if ASYNC_DB_REQUESTS:
+    async def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: AsyncSession = Depends(get_async_db)
+    ):
+        """Get current user from token (async session, shared with the handler's get_request_db)"""
+        return _user_dict(await db.get(User, _user_from_token(credentials)))
+else:
+    def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: Session = Depends(get_db)
+    ):
+        """Get current user from token. Sync on SQLite: it runs in the threadpool, so the
+        request session's connection is checked out off the event loop"""
+        return _user_dict(db.get(User, _user_from_token(credentials)))
+
+
 def get_current_active_user(current_user: dict = Depends(get_current_user)):
     """Ensure user is active"""
     if not current_user.get("is_active"):
@@ -0,0 +1,161 @@
+"""
+Account Balance Cache
+/api/account/balance is polled by several dashboard components at once. Each
+miss costs a signed get_account plus tickers (live) or a performance pass
+(paper), so results are cached per (user, fiat currency):
+
+- short TTL (BALANCE_CACHE_TTL_SECONDS) bounds price staleness
+- single-flight: concurrent misses for the same key share one refresh
+- committing a Trade, BotConfig or User (API keys) change for a user drops
+  their entries immediately; a refresh that started before the change is not
+  stored
+- optional background refresher (BALANCE_REFRESH_SECONDS > 0) re-fetches
+  balances of users who asked within BALANCE_ACTIVE_SECONDS, so open
+  dashboards keep hitting a warm cache
+
+With pool workers, trades recorded in other processes only show up after the
+TTL. Commits also invalidate from other threads (the SQLite writer thread,
+threadpool request handlers), so every change to `entries` holds `_lock`.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+
+BALANCE_CACHE_TTL_SECONDS = float(os.getenv("BALANCE_CACHE_TTL_SECONDS", "5"))
+BALANCE_REFRESH_SECONDS = float(os.getenv("BALANCE_REFRESH_SECONDS", "0"))
+BALANCE_ACTIVE_SECONDS = float(os.getenv("BALANCE_ACTIVE_SECONDS", "60"))
+_DIRTY = "balance_cache_dirty_users"
+
+Key = Tuple[int, str]
+
+
+class BalanceCache:
+    def __init__(self, ttl: float = BALANCE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.entries: Dict[Key, Tuple[float, dict]] = {}   # key -> (fetched_at, balance)
+        self.versions: Dict[int, int] = {}                  # user_id -> invalidation counter
+        self.inflight: Dict[Key, asyncio.Task] = {}
+        self.last_requested: Dict[Key, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self._refresher: Optional[asyncio.Task] = None
+        # Guards entries/versions: invalidate() runs on whichever thread committed
+        self._lock = threading.Lock()
+
+    async def get(self, user_id: int, fiat_currency: str = "USD") -> dict:
+        key = (user_id, fiat_currency)
+        now = time.monotonic()
+        self.last_requested[key] = now
+        cached = self.entries.get(key)
+        if cached and now - cached[0] < self.ttl:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        return await self._refresh(key)
+
+    async def _refresh(self, key: Key) -> dict:
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self.inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self.inflight.pop(k, None) if self.inflight.get(k) is t else None)
+        # shield: a caller that disconnects must not cancel the refresh others wait on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Key) -> dict:
+        from app.db import SessionLocal
+        from app.market import get_account_balance
+
+        user_id, fiat_currency = key
+        version = self.versions.get(user_id, 0)
+        db = SessionLocal()
+        try:
+            balance = await get_account_balance(db, user_id, fiat_currency)
+        finally:
+            db.close()
+        with self._lock:
+            if self.versions.get(user_id, 0) == version:
+                self.entries[key] = (time.monotonic(), balance)
+        return balance
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+            for key in [k for k in self.entries if k[0] == user_id]:
+                del self.entries[key]
+
+    # ----- background refresher -----
+
+    def start(self, interval: float = BALANCE_REFRESH_SECONDS):
+        if interval > 0 and self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop(interval))
+            print(f"💰 Balance refresher started (every {interval:.0f}s for active dashboards)")
+
+    async def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, requested_at in list(self.last_requested.items()):
+                if now - requested_at > BALANCE_ACTIVE_SECONDS:
+                    self.last_requested.pop(key, None)
+                    with self._lock:
+                        self.entries.pop(key, None)
+                    continue
+                try:
+                    await self._refresh(key)
+                except Exception as e:
+                    print(f"⚠️ Background balance refresh failed for user {key[0]}: {e}")
+
+    def status(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "inflight": len(self.inflight),
+            "active_dashboards": len(self.last_requested),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_seconds": self.ttl,
+            "background_refresh": self._refresher is not None,
+        }
+
+    # ----- session hooks -----
+
+    def after_flush(self, session, flush_context):
+        from app.models import BotConfig, Trade, User
+
+        users = session.info.setdefault(_DIRTY, set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (Trade, BotConfig)):
+                users.add(obj.user_id)
+            elif isinstance(obj, User):
+                users.add(obj.id)
+
+    def after_commit(self, session):
+        for user_id in session.info.pop(_DIRTY, ()):
+            self.invalidate(user_id)
+
+    def after_rollback(self, session):
+        session.info.pop(_DIRTY, None)
+
+
+balance_cache = BalanceCache()
+
+
+def install(session_factory):
+    """Attach the invalidation hooks to a sessionmaker (done for SessionLocal in app/models.py)."""
+    event.listen(session_factory, "after_flush", balance_cache.after_flush)
+    event.listen(session_factory, "after_commit", balance_cache.after_commit)
+    event.listen(session_factory, "after_soft_rollback", lambda session, previous: balance_cache.after_rollback(session))
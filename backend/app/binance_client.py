@@ -11,9 +11,13 @@ import requests
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# (connect, read) seconds; a hung call must not block its caller forever
+BINANCE_REQUEST_TIMEOUT_SECONDS = float(os.getenv("BINANCE_REQUEST_TIMEOUT_SECONDS", "10"))
+
 
 class BinanceThailandClient:
     """
@@ -74,6 +78,7 @@ class BinanceThailandClient:
                 url = f"{url}?{full_query}"
         
         try:
+            kwargs.setdefault('timeout', (5, BINANCE_REQUEST_TIMEOUT_SECONDS))
             response = self.session.request(method, url, **kwargs)
             response.raise_for_status()
             return response.json()
@@ -139,7 +144,8 @@ class BinanceThailandClient:
                      quantity: Optional[float] = None, 
                      quote_order_qty: Optional[float] = None,
                      price: Optional[float] = None,
-                     time_in_force: str = 'GTC') -> Dict:
+                     time_in_force: str = 'GTC',
+                     client_order_id: Optional[str] = None) -> Dict:
         """
         Create new order
         
@@ -151,6 +157,7 @@ class BinanceThailandClient:
             quote_order_qty: Quote asset quantity (for MARKET buy orders)
             price: Order price (required for LIMIT orders)
             time_in_force: 'GTC', 'IOC', 'FOK'
+            client_order_id: Our own id (newClientOrderId); lets a retry find the original order
         """
         params = {
             'symbol': symbol,
@@ -166,6 +173,8 @@ class BinanceThailandClient:
             params['price'] = price
         if order_type.upper() == 'LIMIT':
             params['timeInForce'] = time_in_force
+        if client_order_id:
+            params['newClientOrderId'] = client_order_id
         
         return self._request('POST', '/api/v1/order', signed=True, params=params)
     
@@ -214,12 +223,14 @@ class BinanceThailandClient:
         }
         return self._request('DELETE', '/api/v1/order', signed=True, params=params)
     
-    def get_order(self, symbol: str, order_id: int) -> Dict:
-        """Query order status"""
-        params = {
-            'symbol': symbol,
-            'orderId': order_id
-        }
+    def get_order(self, symbol: str, order_id: Optional[int] = None,
+                  client_order_id: Optional[str] = None) -> Dict:
+        """Query order status by exchange order id or by our client order id"""
+        params = {'symbol': symbol}
+        if order_id is not None:
+            params['orderId'] = order_id
+        else:
+            params['origClientOrderId'] = client_order_id
         return self._request('GET', '/api/v1/order', signed=True, params=params)
     
     def get_open_orders(self, symbol: Optional[str] = None) -> List[Dict]:
@@ -366,7 +377,7 @@ class BinanceThMarketData:
         """
         self._check_rate_limit()
         
-        cache_key = f"{symbol}_{timeframe}_{limit}"
+        cache_key = f"{symbol}_{timeframe}_{limit}_{since}"
         now = datetime.now()
         cache_duration = self.ohlcv_cache_durations.get(timeframe, 300)
         
@@ -0,0 +1,404 @@
+"""
+Sharded Bot-Runner Pool
+Runs Gods Hand loops across N worker processes so evaluation throughput
+scales with CPU cores instead of being capped by one event loop.
+
+Coordination happens entirely through the database so it works for
+workers spawned by the API process, by `python -m app.bot_pool`, or by
+several uvicorn workers on the same box:
+
+- Every worker registers a row in `bot_workers` and heartbeats it together
+  with its load and tick-latency stats.
+- Live workers (fresh heartbeat) form a consistent-hash ring; each
+  `user_id:symbol` key maps to exactly one worker, so a worker joining or
+  dying only moves ~1/N of the users.
+- A lease in `bot_assignments` guarantees a user's loop never runs on two
+  workers at once while ring views converge during a rebalance.
+
+Enable with BOT_POOL_WORKERS=<n> (0 keeps the classic in-process loops).
+"""
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from app.db import SessionLocal
+
+
+BOT_POOL_WORKERS = int(os.getenv("BOT_POOL_WORKERS", "0"))
+HEARTBEAT_SECONDS = float(os.getenv("BOT_POOL_HEARTBEAT_SECONDS", "5"))
+# A worker whose heartbeat is older than this is considered dead
+WORKER_TTL_SECONDS = float(os.getenv("BOT_POOL_WORKER_TTL_SECONDS", str(HEARTBEAT_SECONDS * 3)))
+LEASE_SECONDS = WORKER_TTL_SECONDS
+VIRTUAL_NODES = int(os.getenv("BOT_POOL_VIRTUAL_NODES", "64"))
+DEFAULT_INTERVAL_SECONDS = int(os.getenv("BOT_POOL_INTERVAL_SECONDS", "60"))
+
+
+def pool_enabled() -> bool:
+    """True when Gods Hand loops are owned by the sharded worker pool."""
+    return BOT_POOL_WORKERS > 0 or os.getenv("BOT_POOL_ROLE") == "worker"
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes (bisect lookup, O(log n))."""
+
+    def __init__(self, nodes: List[str], replicas: int = VIRTUAL_NODES):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._owners: List[str] = []
+        points = []
+        for node in nodes:
+            for i in range(replicas):
+                points.append((_hash(f"{node}#{i}"), node))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._owners = [p[1] for p in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[idx]
+
+
+def shard_key(user_id: int, symbol: Optional[str]) -> str:
+    return f"{user_id}:{symbol or ''}"
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class BotPoolWorker:
+    """One worker process: owns a shard of users and runs their Gods Hand loops."""
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.tasks: Dict[int, asyncio.Task] = {}
+        # user_id -> monotonic time our lease runs out unless renewed
+        self._lease_expiry: Dict[int, float] = {}
+        self._running = True
+        self._last_cpu = time.process_time()
+        self._last_wall = time.monotonic()
+
+    # ----- registration / stats -----
+
+    def _publish_heartbeat(self, db):
+        from app.models import BotWorker
+        from app.bots import loop_tick_stats, loop_tick_counts
+
+        now_wall = time.monotonic()
+        now_cpu = time.process_time()
+        wall_delta = max(1e-6, now_wall - self._last_wall)
+        cpu_percent = (now_cpu - self._last_cpu) / wall_delta * 100.0
+        self._last_wall, self._last_cpu = now_wall, now_cpu
+
+        samples = []
+        tick_count = 0
+        for user_id in self.tasks:
+            samples.extend(loop_tick_stats.get(user_id, ()))
+            tick_count += loop_tick_counts.get(user_id, 0)
+        samples.sort()
+
+        row = db.query(BotWorker).filter(BotWorker.worker_id == self.worker_id).first()
+        if not row:
+            row = BotWorker(
+                worker_id=self.worker_id,
+                pid=os.getpid(),
+                hostname=socket.gethostname(),
+                started_at=datetime.utcnow(),
+            )
+            db.add(row)
+        row.heartbeat_at = datetime.utcnow()
+        row.assigned_count = len(self.tasks)
+        row.cpu_percent = round(cpu_percent, 1)
+        row.tick_count = tick_count
+        row.tick_p50_ms = round(_percentile(samples, 50), 1)
+        row.tick_p95_ms = round(_percentile(samples, 95), 1)
+        row.tick_max_ms = round(samples[-1], 1) if samples else 0.0
+        db.commit()
+
+    def _live_workers(self, db) -> List[str]:
+        from app.models import BotWorker
+        cutoff = datetime.utcnow() - timedelta(seconds=WORKER_TTL_SECONDS)
+        rows = db.query(BotWorker.worker_id).filter(BotWorker.heartbeat_at >= cutoff).all()
+        # Garbage-collect long-dead workers so the table doesn't grow forever
+        db.query(BotWorker).filter(
+            BotWorker.heartbeat_at < datetime.utcnow() - timedelta(seconds=WORKER_TTL_SECONDS * 10)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return sorted(r[0] for r in rows)
+
+    # ----- leases -----
+
+    def _claim(self, db, user_id: int) -> bool:
+        """Compare-and-set the user's lease to this worker."""
+        from app.models import BotAssignment
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=LEASE_SECONDS)
+        updated = db.query(BotAssignment).filter(
+            BotAssignment.user_id == user_id,
+            or_(
+                BotAssignment.worker_id == self.worker_id,
+                BotAssignment.worker_id.is_(None),
+                BotAssignment.lease_until < now,
+            )
+        ).update({"worker_id": self.worker_id, "lease_until": lease_until}, synchronize_session=False)
+        if updated:
+            db.commit()
+            return True
+        exists = db.query(BotAssignment.user_id).filter(BotAssignment.user_id == user_id).first()
+        if exists:
+            db.rollback()
+            return False
+        try:
+            db.add(BotAssignment(user_id=user_id, worker_id=self.worker_id, lease_until=lease_until))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    def _release(self, db, user_id: int):
+        from app.models import BotAssignment
+        db.query(BotAssignment).filter(
+            BotAssignment.user_id == user_id,
+            BotAssignment.worker_id == self.worker_id,
+        ).update({"worker_id": None, "lease_until": None}, synchronize_session=False)
+        db.commit()
+
+    # ----- task management -----
+
+    def _interval_for(self, db, user_id: int) -> int:
+        from app.models import BotAssignment
+        row = db.query(BotAssignment).filter(BotAssignment.user_id == user_id).first()
+        return (row.interval_seconds if row and row.interval_seconds else DEFAULT_INTERVAL_SECONDS)
+
+    def _start_loop(self, db, user_id: int):
+        from app.bots import _gods_hand_loop, bot_status
+        interval = self._interval_for(db, user_id)
+        bot_status[f"gods_hand_{user_id}"] = "running"
+        self.tasks[user_id] = asyncio.create_task(_gods_hand_loop(user_id, interval))
+        print(f"🧩 Worker {self.worker_id} took over user {user_id} (interval={interval}s)")
+
+    async def _stop_loop(self, user_id: int):
+        from app.bots import bot_status
+        task = self.tasks.pop(user_id, None)
+        self._lease_expiry.pop(user_id, None)
+        bot_status[f"gods_hand_{user_id}"] = "stopped"
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        print(f"🧩 Worker {self.worker_id} released user {user_id}")
+
+    async def reconcile(self):
+        """One heartbeat: publish stats, rebuild the ring, start/stop owned loops."""
+        from app.models import BotConfig
+        db = SessionLocal()
+        try:
+            self._publish_heartbeat(db)
+            ring = HashRing(self._live_workers(db))
+
+            enabled = db.query(BotConfig.user_id, BotConfig.symbol).filter(
+                BotConfig.gods_hand_enabled == True  # noqa: E712
+            ).all()
+            wanted = {
+                user_id for user_id, symbol in enabled
+                if ring.owner(shard_key(user_id, symbol)) == self.worker_id
+            }
+
+            # Loops that ended on their own (kill-switch, fatal error) stay stopped
+            for user_id, task in list(self.tasks.items()):
+                if task.done():
+                    self.tasks.pop(user_id, None)
+                    self._lease_expiry.pop(user_id, None)
+                    self._release(db, user_id)
+
+            for user_id in list(self.tasks):
+                if user_id not in wanted:
+                    await self._stop_loop(user_id)
+                    self._release(db, user_id)
+
+            for user_id in wanted:
+                if self._claim(db, user_id):
+                    self._lease_expiry[user_id] = time.monotonic() + LEASE_SECONDS
+                    if user_id not in self.tasks:
+                        self._start_loop(db, user_id)
+                elif user_id in self.tasks:
+                    # Another worker holds the lease now (ours lapsed): never run the loop twice
+                    print(f"🧩 Worker {self.worker_id} lost the lease for user {user_id}")
+                    await self._stop_loop(user_id)
+        finally:
+            db.close()
+
+    async def _stop_expired(self):
+        """Stop loops whose lease could not be renewed in time (e.g. the DB was unreachable)."""
+        now = time.monotonic()
+        for user_id in list(self.tasks):
+            if self._lease_expiry.get(user_id, now) <= now:
+                print(f"🧩 Worker {self.worker_id} lease for user {user_id} expired unrenewed")
+                await self._stop_loop(user_id)
+
+    async def run(self):
+        from app.log_writer import log_writer
+        print(f"🧩 Bot pool worker {self.worker_id} starting (pid={os.getpid()})")
+        log_writer.start()
+        try:
+            while self._running:
+                started = time.monotonic()
+                try:
+                    await self.reconcile()
+                except Exception as e:
+                    print(f"⚠️ Bot pool worker {self.worker_id} reconcile error: {e}")
+                await self._stop_expired()
+                await asyncio.sleep(max(0.0, HEARTBEAT_SECONDS - (time.monotonic() - started)))
+        finally:
+            await self.shutdown()
+            await log_writer.stop()
+
+    async def shutdown(self):
+        from app.models import BotWorker
+        for user_id in list(self.tasks):
+            await self._stop_loop(user_id)
+        db = SessionLocal()
+        try:
+            from app.models import BotAssignment
+            db.query(BotAssignment).filter(BotAssignment.worker_id == self.worker_id).update(
+                {"worker_id": None, "lease_until": None}, synchronize_session=False
+            )
+            db.query(BotWorker).filter(BotWorker.worker_id == self.worker_id).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            print(f"⚠️ Bot pool worker {self.worker_id} cleanup failed: {e}")
+        finally:
+            db.close()
+        print(f"🧩 Bot pool worker {self.worker_id} stopped")
+
+
+def run_worker(worker_id: str):
+    """Process entry point for a pool worker."""
+    import signal
+    os.environ["BOT_POOL_ROLE"] = "worker"
+    # terminate() sends SIGTERM; turn it into KeyboardInterrupt so leases are released
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(BotPoolWorker(worker_id).run())
+    except KeyboardInterrupt:
+        pass
+
+
+class BotPoolSupervisor:
+    """Spawns N worker processes on this box and respawns any that die."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: Dict[str, multiprocessing.Process] = {}
+        self._monitor: Optional[asyncio.Task] = None
+
+    def _spawn(self, worker_id: str):
+        proc = self._ctx.Process(target=run_worker, args=(worker_id,), daemon=True, name=worker_id)
+        proc.start()
+        self._procs[worker_id] = proc
+
+    def start(self):
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        for i in range(self.workers):
+            self._spawn(f"{prefix}-w{i}")
+        print(f"🧩 Bot pool started with {self.workers} worker process(es)")
+        try:
+            self._monitor = asyncio.get_running_loop().create_task(self._watch())
+        except RuntimeError:
+            self._monitor = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            for worker_id, proc in list(self._procs.items()):
+                if not proc.is_alive():
+                    print(f"⚠️ Bot pool worker {worker_id} died (exit={proc.exitcode}), respawning")
+                    self._spawn(worker_id)
+
+    def stop(self, timeout: float = 10.0):
+        if self._monitor:
+            self._monitor.cancel()
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        for proc in self._procs.values():
+            proc.join(timeout)
+        self._procs.clear()
+
+
+def get_pool_status(db) -> dict:
+    """Pool snapshot for the status endpoint: live workers, their stats and shard sizes."""
+    from app.models import BotWorker, BotAssignment
+    cutoff = datetime.utcnow() - timedelta(seconds=WORKER_TTL_SECONDS)
+    workers = db.query(BotWorker).order_by(BotWorker.worker_id).all()
+    assignments = db.query(BotAssignment).filter(BotAssignment.worker_id.isnot(None)).all()
+    return {
+        "enabled": pool_enabled(),
+        "configured_workers": BOT_POOL_WORKERS,
+        "workers": [
+            {**w.to_dict(), "alive": bool(w.heartbeat_at and w.heartbeat_at >= cutoff)}
+            for w in workers
+        ],
+        "assignments": [
+            {
+                "user_id": a.user_id,
+                "worker_id": a.worker_id,
+                "lease_until": a.lease_until.isoformat() if a.lease_until else None,
+            }
+            for a in assignments
+        ],
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description="Run Gods Hand bot-runner pool workers")
+    parser.add_argument("--workers", type=int, default=max(1, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    from app.db import Base, engine
+    import app.models  # noqa: F401  (register tables)
+    Base.metadata.create_all(bind=engine)
+
+    supervisor = BotPoolSupervisor(args.workers)
+
+    async def _main():
+        supervisor.start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+        await stop.wait()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        supervisor.stop()
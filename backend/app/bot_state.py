@@ -0,0 +1,171 @@
+"""
+Bot Runtime State (warm restart)
+Gods Hand loops checkpoint their in-memory state to bot_runtime_states every
+iteration: whether the loop is running, its interval, kill-switch breach
+history, last decision, scheduler state and the cached position. On startup
+the loops that were running are resumed with staggered start times, and each
+loop restores its state instead of re-deriving everything from scratch.
+
+The cached position is keyed by the ledger row's updated_at
+(positions.updated_at, bumped on every insert, edit or delete of a completed
+trade and on config-driven rebuilds), so it is reused only while the
+materialized position hasn't changed.
+
+Not persisted: indicator warm-up state (the candle window behind RSI, MACD,
+SMAs and ATR). A resumed loop refetches candles and recomputes indicators on
+its first iteration. The scheduler restores only its counters, last snapshot
+and last delay/ATR; its mode and interval are re-read from the config.
+"""
+import asyncio
+import json
+import os
+import random
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+# Seconds between resumed loops (plus up to the same again as jitter)
+RESUME_STAGGER_SECONDS = float(os.getenv("BOT_RESUME_STAGGER_SECONDS", "2"))
+
+# user_id -> (symbol, ledger updated_at, position)
+position_cache: Dict[int, Tuple[str, Optional[datetime], dict]] = {}
+
+
+def _cache_hit(user_id: int, symbol: str, version: Optional[datetime]) -> Optional[dict]:
+    cached = position_cache.get(user_id)
+    if version is not None and cached and cached[0] == symbol and cached[1] == version:
+        return cached[2]
+    return None
+
+
+def get_cached_position(user_id: int, symbol: str, db: Session) -> dict:
+    """Position from cache if the ledger row hasn't changed since it was computed."""
+    from app.models import Position
+    from app.position_tracker import get_current_position
+
+    version = db.query(Position.updated_at).filter(
+        Position.user_id == user_id, Position.symbol == symbol
+    ).scalar()
+    position = _cache_hit(user_id, symbol, version)
+    if position is None:
+        position = get_current_position(user_id, symbol, db)
+        position_cache[user_id] = (symbol, version, position)
+    return position
+
+
+async def get_cached_position_async(user_id: int, symbol: str, db: AsyncSession) -> dict:
+    """get_cached_position on an AsyncSession: the ledger version probe is awaited, a miss replays via run_sync."""
+    from app.models import Position
+    from app.position_tracker import get_current_position
+
+    version = (await db.execute(
+        select(Position.updated_at).where(Position.user_id == user_id, Position.symbol == symbol)
+    )).scalar()
+    position = _cache_hit(user_id, symbol, version)
+    if position is None:
+        position = await db.run_sync(lambda session: get_current_position(user_id, symbol, session))
+        position_cache[user_id] = (symbol, version, position)
+    return position
+
+
+def checkpoint(db: Session, user_id: int, interval_seconds: int, iteration: int,
+               scheduler=None, last_decision: Optional[dict] = None):
+    """Upsert the loop's runtime state. Failures are logged, never raised."""
+    from app.models import BotRuntimeState
+    from app.bots import kill_switch_breach_history
+
+    try:
+        state = db.query(BotRuntimeState).filter(BotRuntimeState.user_id == user_id).first()
+        if not state:
+            state = BotRuntimeState(user_id=user_id, bot_type="gods_hand")
+            db.add(state)
+        state.running = True
+        state.interval_seconds = interval_seconds
+        state.iteration = iteration
+        state.breach_history = json.dumps([t.isoformat() for t in kill_switch_breach_history.get(user_id, [])])
+        if last_decision is not None:
+            state.last_decision = json.dumps(last_decision, default=str)
+        if scheduler is not None:
+            state.scheduler_state = json.dumps(scheduler.export_state())
+        cached = position_cache.get(user_id)
+        if cached:
+            version = cached[1].isoformat() if cached[1] else None
+            state.cached_position = json.dumps({"symbol": cached[0], "ledger_version": version, "position": cached[2]})
+        state.checkpointed_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Could not checkpoint bot state for user {user_id}: {e}")
+
+
+def mark_stopped(db: Session, user_id: int):
+    """Loop stopped on purpose (user stop / kill-switch): don't resume it on restart."""
+    from app.models import BotRuntimeState
+
+    state = db.query(BotRuntimeState).filter(BotRuntimeState.user_id == user_id).first()
+    if state and state.running:
+        state.running = False
+        state.checkpointed_at = datetime.utcnow()
+        db.commit()
+
+
+def restore(db: Session, user_id: int, scheduler=None) -> Optional[dict]:
+    """Load the last checkpoint into memory; returns the last decision if any."""
+    from app.models import BotRuntimeState
+    from app.bots import kill_switch_breach_history
+
+    state = db.query(BotRuntimeState).filter(BotRuntimeState.user_id == user_id).first()
+    if not state:
+        return None
+    if state.breach_history:
+        kill_switch_breach_history[user_id] = [datetime.fromisoformat(t) for t in json.loads(state.breach_history)]
+    if scheduler is not None and state.scheduler_state:
+        scheduler.restore_state(json.loads(state.scheduler_state))
+    if state.cached_position:
+        cached = json.loads(state.cached_position)
+        if cached.get("ledger_version"):  # checkpoints keyed by trade id are dropped
+            version = datetime.fromisoformat(cached["ledger_version"])
+            position_cache[user_id] = (cached["symbol"], version, cached["position"])
+    return json.loads(state.last_decision) if state.last_decision else None
+
+
+async def resume_running_bots():
+    """Restart every loop that was running at shutdown, spread out over time."""
+    from app.db import SessionLocal
+    from app.models import BotConfig, BotRuntimeState
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(BotRuntimeState.user_id, BotRuntimeState.interval_seconds)
+            .join(BotConfig, BotConfig.user_id == BotRuntimeState.user_id)
+            .filter(BotRuntimeState.running == True, BotConfig.gods_hand_enabled == True)
+            .order_by(BotRuntimeState.user_id)
+            .all()
+        )
+    finally:
+        db.close()
+
+    if not rows:
+        return
+    print(f"♻️ Resuming {len(rows)} Gods Hand loop(s), staggered by ~{RESUME_STAGGER_SECONDS}s")
+    for i, (user_id, interval_seconds) in enumerate(rows):
+        delay = i * RESUME_STAGGER_SECONDS + random.uniform(0, RESUME_STAGGER_SECONDS)
+        asyncio.create_task(_resume_one(user_id, interval_seconds or 60, delay))
+
+
+async def _resume_one(user_id: int, interval_seconds: int, delay: float):
+    from app.bots import bot_status, bot_tasks, _gods_hand_loop
+
+    await asyncio.sleep(delay)
+    key = f"gods_hand_{user_id}"
+    task = bot_tasks.get(key)
+    if task is not None and not task.done():
+        return  # user restarted it manually in the meantime
+    bot_status[key] = "running"
+    bot_tasks[key] = asyncio.create_task(_gods_hand_loop(user_id, interval_seconds))
+    print(f"♻️ Resumed Gods Hand loop for user {user_id} (interval={interval_seconds}s)")
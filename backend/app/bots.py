@@ -3,16 +3,20 @@ Trading Bots Service
 Grid Bot, DCA Bot, and Gods Hand Autonomous Trading
 """
 import asyncio
+import time
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Deque, Dict, Optional
 from sqlalchemy.orm import Session
 from app.models import BotConfig, Trade
-from app.market import get_current_price, execute_market_trade
+from app.market import get_current_price
 from app.ai_engine import get_trading_recommendation, calculate_risk_assessment
 from app.logging_models import Log, LogCategory, LogLevel
 from app.position_tracker import get_current_position, calculate_incremental_amount, calculate_position_pl
 import json
-from app.db import get_db
+from app.db import get_db, write_queue
+from app.db_async import AsyncSessionLocal
 from app.email_utils import send_gmail, format_trade_email
 from app.notification_limiter import can_send_notification, mark_notification_sent
 
@@ -22,17 +26,31 @@ bot_status = {}
 bot_tasks = {}
 # Consecutive breach tracking: user_id -> list of timestamps when breach occurred
 kill_switch_breach_history = {}
+# Loop tick latency (ms) per user: recent samples + lifetime count, published by the bot pool
+loop_tick_stats: Dict[int, Deque[float]] = {}
+loop_tick_counts: Dict[int, int] = {}
 
 
-async def log_and_broadcast(db: Session, log: Log):
-    """Helper to save log to DB and broadcast via WebSocket"""
-    db.add(log)
-    db.commit()
-    db.refresh(log)
+def record_loop_tick(user_id: int, elapsed_ms: float):
+    """Record how long one Gods Hand loop iteration took (excluding the sleep)."""
+    if user_id not in loop_tick_stats:
+        loop_tick_stats[user_id] = deque(maxlen=200)
+    loop_tick_stats[user_id].append(elapsed_ms)
+    loop_tick_counts[user_id] = loop_tick_counts.get(user_id, 0) + 1
+
+
+async def log_and_broadcast(db: Session, log: Log, wait: bool = False, view: Optional[dict] = None):
+    """Queue the log for a batched insert (app/log_writer.py) and push it to the user's WebSocket right away.
+    Does not commit `db`. wait=True returns once the log is stored (log.id set).
+    `view` is pushed instead of log.to_dict() (e.g. the rendered decision text of a compact log)."""
+    from app.log_writer import log_writer
+    log_writer.submit(log)
+    if wait:
+        await log_writer.flush()
     try:
         from app.websocket_manager import ws_manager
         if log.user_id:
-            await ws_manager.broadcast_log(log.user_id, log.to_dict())
+            await ws_manager.broadcast_log(log.user_id, view or log.to_dict())
     except Exception as e:
         print(f"⚠️ Log broadcast failed: {e}")
 
@@ -40,88 +58,40 @@ async def log_and_broadcast(db: Session, log: Log):
 async def start_grid_bot(user_id: int, config: BotConfig, db: Session) -> dict:
     """
     Start Grid Trading Bot
-    Places buy/sell orders at predefined price levels
+    Places a buy/sell ladder at predefined price levels and keeps it running
+    on price ticks (see app/grid_engine.py)
     """
-    if f"grid_{user_id}" in bot_status:
+    if bot_status.get(f"grid_{user_id}") == "running":
         return {"status": "error", "message": "Grid bot already running"}
     
-    bot_status[f"grid_{user_id}"] = "running"
-    
     try:
+        from app.grid_engine import grid_manager
+
         symbol = config.symbol
         lower_price = config.grid_lower_price
         upper_price = config.grid_upper_price
         levels = config.grid_levels
-        budget = config.budget
-        
-        # Calculate grid levels
-        price_step = (upper_price - lower_price) / levels
-        grid_levels_prices = [lower_price + i * price_step for i in range(levels + 1)]
-        
-        # Calculate amount per level
-        amount_per_level = budget / levels
+
+        if not lower_price or not upper_price or lower_price >= upper_price or not levels or levels < 1:
+            return {"status": "error", "message": "Grid requires lower_price < upper_price and at least 1 level"}
         
         # Get current price
         ticker = await get_current_price(symbol)
         current_price = ticker['last']
         
-        # Paper trading simulation
-        if config.paper_trading:
-            trades_placed = []
-            
-            # Place buy orders below current price
-            for price in grid_levels_prices:
-                if price < current_price:
-                    trade = Trade(
-                        user_id=user_id,
-                        symbol=symbol,
-                        side="BUY",
-                        amount=amount_per_level / price,
-                        price=price,
-                        filled_price=price,
-                        status="completed_paper",
-                        bot_type="grid",
-                        timestamp=datetime.utcnow()
-                    )
-                    db.add(trade)
-                    trades_placed.append({"side": "BUY", "price": price})
-                
-                # Place sell orders above current price
-                elif price > current_price:
-                    trade = Trade(
-                        user_id=user_id,
-                        symbol=symbol,
-                        side="SELL",
-                        amount=amount_per_level / price,
-                        price=price,
-                        filled_price=price,
-                        status="completed_paper",
-                        bot_type="grid",
-                        timestamp=datetime.utcnow()
-                    )
-                    db.add(trade)
-                    trades_placed.append({"side": "SELL", "price": price})
-            
-            db.commit()
-            
-            return {
-                "status": "success",
-                "mode": "paper",
-                "symbol": symbol,
-                "grid_levels": grid_levels_prices,
-                "trades_placed": len(trades_placed),
-                "message": f"Grid bot started (paper trading) with {levels} levels"
-            }
-        
-        else:
-            # Real trading (simplified - full implementation requires order monitoring)
-            return {
-                "status": "success",
-                "mode": "live",
-                "symbol": symbol,
-                "message": "Grid bot started (live trading)",
-                "note": "Full implementation requires continuous order monitoring"
-            }
+        bot_status[f"grid_{user_id}"] = "running"
+        engine = await grid_manager.start(user_id, config, current_price)
+        placed = sum(1 for order in engine.orders if order)
+        mode = "paper" if config.paper_trading else "live"
+
+        return {
+            "status": "success",
+            "mode": mode,
+            "symbol": symbol,
+            "grid_levels": engine.index.prices,
+            "orders_placed": placed,
+            "message": f"Grid bot started ({mode} trading) with {levels} levels"
+        }
             
     except Exception as e:
         bot_status[f"grid_{user_id}"] = "error"
@@ -131,72 +101,72 @@ async def start_grid_bot(user_id: int, config: BotConfig, db: Session) -> dict:
 async def start_dca_bot(user_id: int, config: BotConfig, db: Session) -> dict:
     """
     Start DCA (Dollar Cost Averaging) Bot
-    Buys at regular intervals regardless of price
+    Buys now, then keeps buying every interval via the DCA scheduler
     """
-    if f"dca_{user_id}" in bot_status:
+    if bot_status.get(f"dca_{user_id}") == "running":
         return {"status": "error", "message": "DCA bot already running"}
     
-    bot_status[f"dca_{user_id}"] = "running"
-    
     try:
+        from app.models import DcaSchedule
+        from app.dca_scheduler import dca_scheduler, execute_dca_buy
+
         symbol = config.symbol
-        amount_per_period = config.dca_amount_per_period
-        interval_days = config.dca_interval_days
+        interval_days = config.dca_interval_days or 1
         
         # Get current price
         ticker = await get_current_price(symbol)
         current_price = ticker['last']
         
-        # Calculate buy amount
-        buy_amount = amount_per_period / current_price
+        # First period's buy right away (one order per start request)
+        result = await execute_dca_buy(user_id, config, current_price, db,
+                                       intent_key=f"dca:{user_id}:start:{datetime.utcnow().isoformat()}")
+
+        # Persist the recurring job; the scheduler picks it up from here
+        now = datetime.utcnow()
+        next_buy = now + timedelta(days=interval_days)
+        schedule = db.query(DcaSchedule).filter(DcaSchedule.user_id == user_id).first()
+        if not schedule:
+            schedule = DcaSchedule(user_id=user_id, runs_completed=0, runs_missed=0)
+            db.add(schedule)
+        schedule.enabled = True
+        schedule.interval_seconds = int(interval_days * 86400)
+        schedule.next_run_at = next_buy
+        schedule.last_run_at = now
+        schedule.runs_completed = (schedule.runs_completed or 0) + 1
+        schedule.last_error = None
+        db.commit()
+
+        dca_scheduler.schedule(user_id, next_buy)
+        bot_status[f"dca_{user_id}"] = "running"
         
-        if config.paper_trading:
-            # Execute paper trade
-            trade = Trade(
-                user_id=user_id,
-                symbol=symbol,
-                side="BUY",
-                amount=buy_amount,
-                price=current_price,
-                filled_price=current_price,
-                status="completed_paper",
-                bot_type="dca",
-                timestamp=datetime.utcnow()
-            )
-            db.add(trade)
-            db.commit()
-            
-            next_buy = datetime.utcnow() + timedelta(days=interval_days)
-            
-            return {
-                "status": "success",
-                "mode": "paper",
-                "symbol": symbol,
-                "amount": buy_amount,
-                "price": current_price,
-                "next_buy": next_buy.isoformat(),
-                "message": f"DCA buy executed (paper). Next buy in {interval_days} days"
-            }
-        else:
-            # Real trading
-            result = await execute_market_trade(user_id, symbol, "BUY", buy_amount, db)
-            
-            return {
-                "status": "success",
-                "mode": "live",
-                "result": result,
-                "message": "DCA buy executed (live)"
-            }
+        return {
+            "status": "success",
+            "mode": result["mode"],
+            "symbol": symbol,
+            "amount": result.get("amount"),
+            "price": current_price,
+            "result": result,
+            "next_buy": next_buy.isoformat(),
+            "message": f"DCA buy executed ({result['mode']}). Next buy in {interval_days} days"
+        }
             
     except Exception as e:
         bot_status[f"dca_{user_id}"] = "error"
         return {"status": "error", "message": str(e)}
 
 
-async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
-    """Execute one Gods Hand iteration with incremental position building."""
+async def gods_hand_once(user_id: int, config: BotConfig, db: Session, market: Optional[dict] = None) -> dict:
+    """Execute one Gods Hand iteration with incremental position building.
+    `market` may carry prefetched {'candles', 'ticker'} for config.symbol (portfolio mode).
+    """
+    started = time.perf_counter()
+    decision = None
     try:
         symbol = config.symbol
+        market = market or {}
+        # Written on this decision's AI_THINKING and AI_ACTION logs (/api/logs/ai-actions joins on it)
+        # and on its row in the decisions table
+        decision_id = uuid.uuid4().hex
 
         # Check if Gods Mode (advanced AI) is enabled
         use_gods_mode = config.gods_mode_enabled if hasattr(config, 'gods_mode_enabled') else False
@@ -208,7 +178,7 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
             
             # Get sufficient candles for Gods Mode (needs 50+)
             try:
-                candles = await get_candlestick_data(symbol, timeframe='1h', limit=100)
+                candles = market.get('candles') or await get_candlestick_data(symbol, timeframe='1h', limit=100)
             except Exception as e:
                 print(f"⚠️ Failed to fetch candles for Gods Mode: {e}")
                 # Fallback to standard AI if candles fail
@@ -249,22 +219,25 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                 }
                 
                 # Calculate risk assessment (still need for position sizing)
-                risk_assessment = await calculate_risk_assessment(symbol, config)
+                risk_assessment = await calculate_risk_assessment(symbol, config, candles=candles)
         
         if not use_gods_mode:
             # Use standard AI recommendation
-            recommendation = await get_trading_recommendation(symbol, config)
-            risk_assessment = await calculate_risk_assessment(symbol, config)
+            recommendation = await get_trading_recommendation(
+                symbol, config, candles=market.get('candles'), ticker=market.get('ticker')
+            )
+            risk_assessment = await calculate_risk_assessment(symbol, config, candles=market.get('candles'))
 
         action = recommendation.get('action', 'HOLD')
         confidence = recommendation.get('confidence', 0.0)
+        ai_action = action  # before stop-loss / take-profit overrides
 
         # Get current position including fees
         current_position = get_current_position(user_id, symbol, db)
 
         # Paper trading initial state: Apply 50/50 split if no trades yet
         if current_position.get('_paper_initial'):
-            budget = current_position.get('_budget', config.budget)
+            budget = config.budget  # per-symbol share in portfolio mode
             current_price = risk_assessment['current_price']
             
             # Start with 50% in BTC, 50% in USDT
@@ -366,55 +339,74 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
 
         # Check if using Gods Mode
         is_gods_mode = recommendation.get('gods_mode', False)
-        mode_label = "GODS MODE (Meta-Model AI)" if is_gods_mode else "Standard AI"
 
         # Derive position metrics safely (keys may not exist yet in early cycles)
         max_pos = float(max_position_size or 0.0)
         current_val = float(current_position.get('position_value_usd', 0.0))
         fill_percent = (current_val / max_pos * 100) if max_pos > 0 else 0.0
-        available_to_add = max(0.0, max_pos - current_val)
         step_amount = float(incremental_calc.get('step_amount_usd', incremental_calc.get('suggested_amount_usd', 0.0)))
 
-        decision_summary = (
-            f"AI DECISION CALCULATION for {symbol} ({mode_label})\n\n"
-            f"-- AI Recommendation: {action} @{confidence:.2f}\n"
-            f"   Signals analyzed: {len(signal_breakdown)}\n"
-            + ("".join([f"   • {s}\n" for s in signal_breakdown[:5]]) or "   • (no signals logged)\n")
-            + f"\n-- Confidence: BUY={buy_signals}, SELL={sell_signals}, HOLD={hold_signals}\n"
-            f"   - Confidence: {confidence:.3f} (average of {len(signal_breakdown)} factors)\n\n"
-            f"Final Decision: {action} @ {confidence:.0%} confidence\n\n"
-            f"-- Position Setup for {symbol}:\n"
-            f"   - Max Position Size: ${max_pos:.2f}\n"
-            f"   - Current Held (cost basis value): ${current_val:.2f} ({fill_percent:.1f}%)\n"
-            f"   - Available Capacity: ${available_to_add:.2f}\n"
-            f"   - Incremental Trade (step): ${step_amount:.2f}\n"
+        # Typed decision record (app/decisions.py); the thinking log keeps one line
+        # and the full text is rendered from the record when viewed
+        from app.decisions import DecisionRecord, render_summary, summary_line
+        indicators = recommendation.get('indicators') or {}
+        gods_debug = recommendation.get('_gods_debug') or {}
+        model_b = gods_debug.get('model_b') or {}
+        decision = DecisionRecord(
+            started,
+            extras={
+                "signals": signal_breakdown,
+                "reasoning": recommendation.get('reasoning'),
+                "risk": {k: risk_assessment.get(k) for k in ('risk_score', 'risk_level', 'suggested_position_size', 'estimated_fees')},
+                "position": {k: current_position.get(k) for k in ('quantity', 'cost_basis', 'average_price', 'trades_count')},
+                "incremental_reason": incremental_calc.get('reason'),
+                "step_settings": {"entry_step_percent": config.entry_step_percent, "exit_step_percent": config.exit_step_percent},
+                **({"gods_mode": gods_debug} if is_gods_mode else {}),
+            },
+            decision_id=decision_id,
+            user_id=user_id,
+            symbol=symbol,
+            paper_trading=bool(config.paper_trading),
+            gods_mode=bool(is_gods_mode),
+            ai_action=ai_action,
+            action=action,
+            confidence=float(confidence),
+            buy_signals=buy_signals,
+            sell_signals=sell_signals,
+            hold_signals=hold_signals,
+            price=current_price,
+            rsi=indicators.get('rsi', (model_b.get('features') or {}).get('rsi')),
+            macd=indicators.get('macd'),
+            sma_20=indicators.get('sma_20'),
+            sma_50=indicators.get('sma_50'),
+            adx=indicators.get('adx'),
+            volatility=risk_assessment.get('volatility'),
+            regime=model_b.get('regime'),
+            max_position_usd=max_pos,
+            position_value_usd=current_val,
+            step_percent=step_percent,
+            step_amount_usd=step_amount,
+            fill_before=fill_percent,
+            fill_after=incremental_calc.get('after_fill_percent'),
         )
+        decision_view = decision.view()
 
         # Log AI thinking with position info
         thinking_log = Log(
-            timestamp=datetime.utcnow(),
+            timestamp=decision.columns["timestamp"],
             category=LogCategory.AI_THINKING,
             level=LogLevel.INFO,
-            message=decision_summary,
-            details=json.dumps({
-                "recommendation": recommendation,
-                "risk_assessment": risk_assessment,
-                "signal_breakdown": signal_breakdown,
-                "confidence_calculation": f"Average of {len(signal_breakdown)} indicator signals",
-                "current_position": current_position,
-                "incremental_calculation": incremental_calc,
-                "step_settings": {
-                    "entry_step_percent": config.entry_step_percent,
-                    "exit_step_percent": config.exit_step_percent
-                }
-            }, indent=2),
+            message=summary_line(decision_view),
             user_id=user_id,
             symbol=symbol,
             bot_type="gods_hand",
+            decision_id=decision_id,
             ai_recommendation=action,
             ai_confidence=str(confidence),
         )
-        await log_and_broadcast(db, thinking_log)
+        await log_and_broadcast(db, thinking_log, view=dict(
+            thinking_log.to_dict(), message=render_summary(decision_view), details=json.dumps(decision_view, default=str)
+        ))
 
         # Confidence gate
         if confidence < config.min_confidence:
@@ -431,12 +423,14 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                 user_id=user_id,
                 symbol=symbol,
                 bot_type="gods_hand",
+                decision_id=decision_id,
                 ai_recommendation=action,
                 ai_confidence=str(confidence),
                 ai_executed="no",
                 execution_reason=f"Confidence {confidence} below minimum {config.min_confidence}"
             )
             await log_and_broadcast(db, action_log)
+            await decision.finish(False, "low_confidence")
             # Notify on AI failure/skipped action (once per hour)
             maybe_send_notification(
                 subject=f"Gods Hand: AI Skipped Action for {symbol}",
@@ -484,12 +478,14 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                 user_id=user_id,
                 symbol=symbol,
                 bot_type="gods_hand",
+                decision_id=decision_id,
                 ai_recommendation=action,
                 ai_confidence=str(confidence),
                 ai_executed="no",
                 execution_reason=incremental_calc['reason']
             )
             await log_and_broadcast(db, action_log)
+            await decision.finish(False, "position_limit")
             # Notify on AI failure/skipped action (once per hour)
             maybe_send_notification(
                 subject=f"Gods Hand: Position Limit for {symbol}",
@@ -530,19 +526,13 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                 crypto_amount = current_position['quantity'] * sell_percent
 
             if config.paper_trading:
-                trade = Trade(
-                    user_id=user_id,
-                    symbol=symbol,
-                    side=action,
-                    amount=crypto_amount,
-                    price=current_price,
-                    filled_price=current_price,
-                    status="completed_paper",
-                    bot_type="gods_hand",
-                    timestamp=datetime.utcnow()
+                from app.fill_simulator import record_paper_trade
+                trade, fill = await record_paper_trade(
+                    db, user_id, symbol, action, current_price, "gods_hand", quantity=crypto_amount
                 )
-                db.add(trade)
-                db.commit()
+                if trade is None:
+                    await decision.finish(False, "no_depth")
+                    return {"status": "skipped", "action": action, "reason": "No order book depth to fill paper order"}
 
                 action_log = Log(
                     timestamp=datetime.utcnow(),
@@ -550,9 +540,10 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                     level=LogLevel.INFO,
                     message=f"Gods Hand executed {action} {step_percent}% step (paper)",
                     details=json.dumps({
-                        "crypto_amount": crypto_amount,
+                        "crypto_amount": fill.filled_quantity,
                         "usd_value": step_amount_usd,
                         "price": current_price,
+                        "fill": fill.to_dict(),
                         "position_before": f"{incremental_calc['current_fill_percent']:.1f}%",
                         "position_after": f"{incremental_calc['after_fill_percent']:.1f}%",
                         "incremental_reason": incremental_calc['reason'],
@@ -561,11 +552,13 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                     user_id=user_id,
                     symbol=symbol,
                     bot_type="gods_hand",
+                    decision_id=decision_id,
                     ai_recommendation=action,
                     ai_confidence=str(confidence),
                     ai_executed="yes",
                 )
                 await log_and_broadcast(db, action_log)
+                await decision.finish(True, fill=fill.to_dict(), trade_id=trade.id)
                 
                 # Calculate P/L and account balance for email
                 updated_position = get_current_position(user_id, symbol, db)
@@ -622,67 +615,26 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                     "message": f"Gods Hand executed {action} {step_percent}% step (paper trading)"
                 }
             else:
-                # Live trading
-                try:
-                    result = await execute_market_trade(user_id, symbol, action, crypto_amount, db)
-                except Exception as e:
-                    error_msg = str(e)
-                    # Check for insufficient balance error (Binance code -2010)
-                    if "-2010" in error_msg or "insufficient balance" in error_msg.lower():
-                        print(f"⚠️ Insufficient balance for {action} {symbol}: {error_msg}")
-                        
-                        # Log gentle warning
-                        warning_log = Log(
-                            timestamp=datetime.utcnow(),
-                            category=LogCategory.AI_ACTION,
-                            level=LogLevel.WARNING,
-                            message=f"Gods Hand skipped {action}: Insufficient balance",
-                            details=json.dumps({
-                                "reason": "insufficient_balance",
-                                "error": error_msg,
-                                "attempted_amount": crypto_amount,
-                                "attempted_value_usd": step_amount_usd
-                            }),
-                            user_id=user_id,
-                            symbol=symbol,
-                            bot_type="gods_hand",
-                            ai_recommendation=action,
-                            ai_confidence=str(confidence),
-                            ai_executed="no",
-                            execution_reason="Insufficient balance"
-                        )
-                        await log_and_broadcast(db, warning_log)
-                        
-                        # Notify user (rate limited)
-                        maybe_send_notification(
-                            subject=f"Gods Hand: Insufficient Balance for {symbol}",
-                            body=f"AI attempted to {action} but account has insufficient balance.\n\nError: {error_msg}",
-                            trigger='failure',
-                            notification_type='insufficient_balance',
-                            cooldown_hours=1
-                        )
-                        
-                        return {
-                            "status": "skipped",
-                            "mode": "live",
-                            "action": action,
-                            "symbol": symbol,
-                            "reason": "Insufficient balance",
-                            "message": "Trade skipped due to insufficient balance"
-                        }
-                    else:
-                        # Re-raise other errors to be caught by the main try/except
-                        raise e
+                # Live trading: hand the order to the pipeline and carry on; it confirms
+                # the fill and records the Trade (insufficient balance is logged and emailed there)
+                from app.order_pipeline import order_pipeline
+                from sqlalchemy import func
+                last_trade_id = db.query(func.max(Trade.id)).filter(
+                    Trade.user_id == user_id, Trade.symbol == symbol
+                ).scalar()
+                # Same decision on the same position -> same client order id, never a second order
+                intent_key = f"gods_hand:{symbol}:{action}:{last_trade_id or 0}"
+                order = await order_pipeline.submit(user_id, symbol, action, crypto_amount, "gods_hand", intent_key)
 
                 action_log = Log(
                     timestamp=datetime.utcnow(),
                     category=LogCategory.AI_ACTION,
                     level=LogLevel.INFO,
-                    message=f"Gods Hand executed {action} {step_percent}% step (live)",
+                    message=f"Gods Hand submitted {action} {step_percent}% step (live)",
                     details=json.dumps({
                         "crypto_amount": crypto_amount,
                         "usd_value": step_amount_usd,
-                        "result": result,
+                        "order": order,
                         "position_before": f"{incremental_calc['current_fill_percent']:.1f}%",
                         "position_after": f"{incremental_calc['after_fill_percent']:.1f}%",
                         "incremental_reason": incremental_calc['reason']
@@ -690,30 +642,14 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                     user_id=user_id,
                     symbol=symbol,
                     bot_type="gods_hand",
+                    decision_id=decision_id,
                     ai_recommendation=action,
                     ai_confidence=str(confidence),
-                    ai_executed="yes",
+                    ai_executed="submitted",
+                    execution_reason="Order queued; the order pipeline logs the fill or failure",
                 )
                 await log_and_broadcast(db, action_log)
-                
-                # Persist live trade record for performance stats
-                try:
-                    live_trade = Trade(
-                        user_id=user_id,
-                        symbol=symbol,
-                        side=action,
-                        amount=crypto_amount,
-                        price=result.get('price') or current_price,
-                        filled_price=(result.get('price') or current_price),
-                        status=result.get('status') or 'completed_live',
-                        bot_type='gods_hand',
-                        timestamp=datetime.utcnow()
-                    )
-                    db.add(live_trade)
-                    db.commit()
-                except Exception:
-                    # Do not fail loop if persisting trade fails
-                    pass
+                await decision.finish(False, "submitted", client_order_id=order["client_order_id"], order=order)
 
                 return {
                     "status": "success",
@@ -722,15 +658,15 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                     "symbol": symbol,
                     "crypto_amount": crypto_amount,
                     "usd_value": step_amount_usd,
-                    "price": result.get('price') or current_price,
+                    "price": current_price,
                     "confidence": confidence,
                     "position_fill_before": incremental_calc['current_fill_percent'],
                     "position_fill_after": incremental_calc['after_fill_percent'],
                     "recommendation": recommendation,
                     "risk_assessment": risk_assessment,
                     "current_position": current_position,
-                    "trade_result": result,
-                    "message": f"Gods Hand executed {action} {step_percent}% step (live trading)"
+                    "order": order,
+                    "message": f"Gods Hand submitted {action} {step_percent}% step (live trading)"
                 }
         else:
             # 🔍 DEBUG: HOLD path
@@ -746,12 +682,14 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
                 user_id=user_id,
                 symbol=symbol,
                 bot_type="gods_hand",
+                decision_id=decision_id,
                 ai_recommendation="HOLD",
                 ai_confidence=str(confidence),
                 ai_executed="no",
                 execution_reason="Recommendation HOLD"
             )
             await log_and_broadcast(db, action_log)
+            await decision.finish(False, "hold")
             # Notify on AI failure/skipped action (once per hour)
             maybe_send_notification(
                 subject=f"Gods Hand: AI HOLD for {symbol}",
@@ -775,12 +713,64 @@ async def gods_hand_once(user_id: int, config: BotConfig, db: Session) -> dict:
         print(f"❌ Critical Error in gods_hand_once: {str(e)}")
         import traceback
         traceback.print_exc()
+        if decision is not None:
+            await decision.finish(False, "error", error=str(e))
         return {
             "status": "error",
             "message": f"Critical error: {str(e)}"
         }
 
 
+async def trigger_kill_switch(user_id: int, config: BotConfig, db: Session, message: str, details: dict):
+    """Stop the Gods Hand loop, start the kill-switch cooldown and notify the user."""
+    key = f"gods_hand_{user_id}"
+    bot_status[key] = "stopped"
+
+    # Update last trigger timestamp
+    values = {"kill_switch_last_trigger": datetime.utcnow()}
+    # Pool workers restart every enabled config, so disable it to keep the bot stopped
+    from app.bot_pool import pool_enabled
+    if pool_enabled():
+        values["gods_hand_enabled"] = False
+    from app import bot_state
+
+    def stop(session):
+        session.query(BotConfig).filter(BotConfig.user_id == user_id).update(values)
+        bot_state.mark_stopped(session, user_id)
+    await write_queue.run(stop)
+    # Keep the caller's copy in step without making it dirty
+    from sqlalchemy.orm.attributes import set_committed_value
+    for name, value in values.items():
+        set_committed_value(config, name, value)
+
+    # Clear breach history
+    kill_switch_breach_history[user_id] = []
+
+    err_log = Log(
+        timestamp=datetime.utcnow(),
+        category=LogCategory.BOT,
+        level=LogLevel.WARNING,
+        message=message,
+        details=json.dumps(details),
+        user_id=user_id,
+        bot_type="gods_hand",
+    )
+    await log_and_broadcast(db, err_log, wait=True)  # the client dedupes kill-switch alerts by log id
+
+    # Broadcast via WebSocket for instant notification
+    try:
+        from app.websocket_manager import ws_manager
+        await ws_manager.broadcast_kill_switch(user_id, err_log.to_dict())
+    except Exception as ws_err:
+        print(f"⚠️ Failed to broadcast kill-switch via WebSocket: {ws_err}")
+
+
+async def _sleep_until_next_tick(user_id: int, scheduler):
+    """Record how long this iteration's work took, then sleep until its planned deadline."""
+    record_loop_tick(user_id, scheduler.elapsed_ms())
+    await scheduler.wait()
+
+
 async def _gods_hand_loop(user_id: int, interval_seconds: int):
     """Background loop to run Gods Hand periodically until stopped."""
     import logging
@@ -790,41 +780,79 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
     bot_status[key] = "running"
     print(f"🚀 _gods_hand_loop STARTED for user {user_id}, interval={interval_seconds}s")
     logger.info(f"_gods_hand_loop started for user {user_id}, interval={interval_seconds}s")
-    snapshot_counter = 0  # Track iterations for periodic snapshots
     iteration = 0
+    from app.scheduling import get_scheduler, CANDLE_TIMEFRAME
+    from app import bot_state
+    scheduler = get_scheduler(user_id, interval_seconds)
+    last_decision = None
+
+    # Warm restart: pick up breach history, scheduler state and cached position
+    dbr = next(get_db())
+    try:
+        last_decision = bot_state.restore(dbr, user_id, scheduler)
+    except Exception as e:
+        print(f"⚠️ Could not restore bot state for user {user_id}: {e}")
+    finally:
+        dbr.close()
+
     try:
         while bot_status.get(key) == "running":
             iteration += 1
+            scheduler.begin_iteration()
             print(f"🔄 Gods Hand loop iteration {iteration} for user {user_id} - status: {bot_status.get(key)}")
             logger.info(f"Gods Hand loop iteration {iteration} for user {user_id}")
-            # Fresh DB session each iteration
+            # Fresh DB sessions each iteration: dbi for the decision pipeline (it mutates
+            # config), adb for the per-iteration reads/writes that don't block the event loop
             dbi = next(get_db())
+            adb = AsyncSessionLocal()
             try:
                 config = dbi.query(BotConfig).filter(BotConfig.user_id == user_id).first()
                 if not config or not config.gods_hand_enabled:
                     print(f"⚠️ Config not found or gods_hand disabled for user {user_id}")
                     logger.warning(f"Config not found or gods_hand disabled for user {user_id}")
-                    await asyncio.sleep(interval_seconds)
+                    await _sleep_until_next_tick(user_id, scheduler)
                     continue
+                scheduler.configure(config)
                 
                 print(f"📊 Checking unrealized P/L for user {user_id}...")
                 # Kill-switch: check UNREALIZED P/L based on current position value
                 # This is better than daily realized P/L because it monitors actual portfolio value
                 
-                from app.position_tracker import get_current_position, calculate_position_pl
-                from app.market import get_current_price
+                from app.position_tracker import calculate_position_pl
+                from app.market import get_current_price, get_candlestick_data
                 
+                from app.portfolio import portfolio_mode, parse_portfolio_symbols, fetch_portfolio_market, portfolio_pl, portfolio_once
+
+                portfolio = portfolio_mode(config)
+                portfolio_market = None
+                current_pos = {}
+                current_price = 0.0
                 try:
-                    # Get current position
-                    current_pos = get_current_position(user_id, config.symbol, dbi)
-                    
-                    # Get current market price
-                    ticker = await get_current_price(config.symbol)
-                    current_price = ticker.get('last', 0)
-                    
-                    # Calculate unrealized P/L
-                    pl_data = calculate_position_pl(current_pos, current_price)
+                    if portfolio:
+                        # Portfolio: market data for all symbols at once, one combined P/L
+                        portfolio_market = await fetch_portfolio_market(parse_portfolio_symbols(config.portfolio_symbols))
+                        pl_data, positions = portfolio_pl(user_id, config, dbi, portfolio_market)
+                        current_pos = {"quantity": sum(p.get('quantity', 0.0) for p in positions.values())}
+                    else:
+                        # Get current position (cached until a new trade is recorded)
+                        current_pos = await bot_state.get_cached_position_async(user_id, config.symbol, adb)
+                        
+                        # Get current market price
+                        ticker = await get_current_price(config.symbol)
+                        current_price = ticker.get('last', 0)
+                        
+                        # Calculate unrealized P/L
+                        pl_data = calculate_position_pl(current_pos, current_price)
                     unrealized_pl_percent = pl_data['pl_percent']
+
+                    # Between iterations the risk engine checks stop/TP/kill-switch on every tick
+                    from app.risk_engine import risk_engine
+                    if portfolio:
+                        for symbol, position in positions.items():
+                            risk_engine.sync(user_id, config, position, kill_switch=False, symbol=symbol,
+                                             interval_seconds=scheduler.interval_seconds)
+                    else:
+                        risk_engine.sync(user_id, config, current_pos, interval_seconds=scheduler.interval_seconds)
                     
                     print(f"💰 Unrealized P/L: {unrealized_pl_percent:.2f}% (limit: -{config.max_daily_loss}%)")
                     print(f"   Position value: ${pl_data['current_value']:,.2f}")
@@ -848,6 +876,7 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
                             "position_value": pl_data['current_value'],
                             "cost_basis": pl_data['cost_basis'],
                             "current_price": current_price,
+                            "portfolio": list(portfolio_market) if portfolio else None,
                             "limit": config.max_daily_loss
                         }),
                         user_id=user_id,
@@ -859,6 +888,16 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
                 except Exception as e:
                     print(f"⚠️ Could not calculate P/L: {str(e)}")
                     unrealized_pl_percent = 0.0
+
+                # Candles for the scheduling policy (same key as the AI engine, so it hits the cache)
+                candles = None
+                if not portfolio and (scheduler.mode != "fixed" or scheduler.skip_unchanged):
+                    try:
+                        candles = await get_candlestick_data(config.symbol, CANDLE_TIMEFRAME, 100)
+                    except Exception as e:
+                        print(f"⚠️ Could not fetch candles for scheduling: {str(e)}")
+                has_position = float(current_pos.get('quantity', 0.0) or 0.0) > 0
+                scheduler.plan(config, candles, unrealized_pl_percent, has_position)
                 
                 # Use baseline if set: compare delta from baseline
                 baseline = config.kill_switch_baseline
@@ -887,7 +926,7 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
                         )
                         await log_and_broadcast(dbi, cooldown_log)
                         
-                        await asyncio.sleep(interval_seconds)
+                        await _sleep_until_next_tick(user_id, scheduler)
                         continue
 
                 # Track breaches: require N consecutive breaches
@@ -908,26 +947,15 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
                     if consecutive_breaches < required_breaches:
                         # Not enough consecutive breaches yet
                         print(f"💡 Continuing... need {required_breaches - consecutive_breaches} more consecutive breach(es)")
-                        await asyncio.sleep(interval_seconds)
+                        await _sleep_until_next_tick(user_id, scheduler)
                         continue
                     
                     # Trigger kill-switch after N consecutive breaches
                     print(f"🚨 KILL-SWITCH TRIGGERED after {consecutive_breaches} consecutive breaches!")
-                    bot_status[key] = "stopped"
-                    
-                    # Update last trigger timestamp
-                    config.kill_switch_last_trigger = datetime.utcnow()
-                    dbi.commit()
-                    
-                    # Clear breach history
-                    kill_switch_breach_history[user_id] = []
-                    
-                    err_log = Log(
-                        timestamp=datetime.utcnow(),
-                        category=LogCategory.BOT,
-                        level=LogLevel.WARNING,
-                        message=f"Gods Hand KILL-SWITCH: Unrealized loss {unrealized_pl_percent:.2f}% exceeds limit {config.max_daily_loss}% ({consecutive_breaches} consecutive breaches)",
-                        details=json.dumps({
+                    await trigger_kill_switch(
+                        user_id, config, dbi,
+                        f"Gods Hand KILL-SWITCH: Unrealized loss {unrealized_pl_percent:.2f}% exceeds limit {config.max_daily_loss}% ({consecutive_breaches} consecutive breaches)",
+                        {
                             "unrealized_pl_percent": unrealized_pl_percent,
                             "effective_pl_percent": effective_pl,
                             "baseline_pl_percent": baseline,
@@ -938,38 +966,44 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
                             "current_price": current_price,
                             "max_daily_loss": config.max_daily_loss,
                             "cooldown_minutes": config.kill_switch_cooldown_minutes
-                        }),
-                        user_id=user_id,
-                        bot_type="gods_hand",
+                        },
                     )
-                    await log_and_broadcast(dbi, err_log)
-                    
-                    # Broadcast via WebSocket for instant notification
-                    try:
-                        from app.websocket_manager import ws_manager
-                        await ws_manager.broadcast_kill_switch(user_id, err_log.to_dict())
-                    except Exception as ws_err:
-                        print(f"⚠️ Failed to broadcast kill-switch via WebSocket: {ws_err}")
-                    
                     break
                 else:
                     # No breach, clear history
                     if user_id in kill_switch_breach_history:
                         kill_switch_breach_history[user_id] = []
                 
-                print(f"🤖 Calling gods_hand_once...")
-                await gods_hand_once(user_id, config, dbi)
-                print(f"✅ gods_hand_once completed")
+                market_snapshot = scheduler.snapshot(candles, current_price, current_pos, config) if candles else None
+                if market_snapshot is None or scheduler.should_evaluate(market_snapshot):
+                    print(f"🤖 Calling gods_hand_once...")
+                    if portfolio:
+                        once_result = await portfolio_once(user_id, config, portfolio_market)
+                    else:
+                        once_result = await gods_hand_once(user_id, config, dbi)
+                    last_decision = {
+                        "status": once_result.get("status"),
+                        "action": once_result.get("action"),
+                        "confidence": once_result.get("confidence"),
+                        "iteration": iteration,
+                        "timestamp": datetime.utcnow().isoformat(),
+                    }
+                    scheduler.mark_executed(market_snapshot)
+                    print(f"✅ gods_hand_once completed")
+                else:
+                    scheduler.mark_skipped()
+                    print(f"⏭️ Market snapshot unchanged since last decision - skipping AI evaluation")
                 
-                # Save paper trading snapshot every 10 iterations (if paper trading)
+                # Save paper trading snapshot when performance changed (if paper trading)
                 if config.paper_trading:
-                    snapshot_counter += 1
-                    if snapshot_counter >= 10:
-                        print(f"📸 Saving paper trading snapshot...")
-                        from app.paper_trading_tracker import save_paper_snapshot
-                        save_paper_snapshot(user_id, config.symbol, 'gods_hand', dbi)
-                        snapshot_counter = 0
-                        print(f"✅ Snapshot saved")
+                    from app.paper_trading_tracker import save_paper_snapshot
+                    # Plain values only: config belongs to dbi, the unit runs on the writer's thread/session
+                    snapshot_symbol, snapshot_price = config.symbol, current_price or None
+                    snapshot = await write_queue.run(
+                        lambda session: save_paper_snapshot(user_id, snapshot_symbol, 'gods_hand', session, current_price=snapshot_price)
+                    )
+                    if snapshot:
+                        print(f"📸 Paper trading snapshot saved")
                         
             except Exception as e:
                 # Log loop error
@@ -986,10 +1020,13 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
                 )
                 await log_and_broadcast(dbi, err_log)
             finally:
+                if bot_status.get(key) == "running":
+                    await write_queue.run(bot_state.checkpoint, user_id, interval_seconds, iteration, scheduler, last_decision)
+                await adb.close()
                 dbi.close()
 
-            print(f"💤 Sleeping for {interval_seconds}s...")
-            await asyncio.sleep(interval_seconds)
+            print(f"💤 Sleeping for {scheduler.last_delay_seconds}s ({scheduler.last_reason})...")
+            await _sleep_until_next_tick(user_id, scheduler)
             print(f"⏰ Woke up! Checking status... bot_status[{key}] = {bot_status.get(key)}")
         
         # If we exit the loop, print why
@@ -1004,6 +1041,8 @@ async def _gods_hand_loop(user_id: int, interval_seconds: int):
     finally:
         print(f"⏹️ Gods Hand loop STOPPED for user {user_id}")
         bot_status[key] = "stopped"
+        from app.risk_engine import risk_engine
+        risk_engine.unregister(user_id)
 
 
 async def start_gods_hand_entry(user_id: int, db: Session, continuous: bool = True, interval_seconds: int = 60) -> dict:
@@ -1036,13 +1075,33 @@ async def start_gods_hand_entry(user_id: int, db: Session, continuous: bool = Tr
         config.gods_hand_enabled = True
         db.commit()
 
-    # Immediate one-off run to provide UI feedback
-    logger.info(f"Running gods_hand_once for user {user_id}")
-    result = await gods_hand_once(user_id, config, db)
-    logger.info(f"gods_hand_once result: {result.get('status', 'unknown')}")
+    from app.bot_pool import pool_enabled
+    if continuous and pool_enabled():
+        # The owning worker runs the first evaluation; running it here as well could
+        # act twice on the same market (and outside the worker's lease)
+        result = {"status": "queued", "message": "Gods Hand handed to the bot pool; first run on the next heartbeat"}
+    else:
+        # Immediate one-off run to provide UI feedback
+        logger.info(f"Running gods_hand_once for user {user_id}")
+        result = await gods_hand_once(user_id, config, db)
+        logger.info(f"gods_hand_once result: {result.get('status', 'unknown')}")
 
     # Start background loop if requested
-    if continuous:
+    if continuous and pool_enabled():
+        # A pool worker owns the loop; it picks the user up on its next heartbeat
+        from app.models import BotAssignment
+        assignment = db.query(BotAssignment).filter(BotAssignment.user_id == user_id).first()
+        if not assignment:
+            assignment = BotAssignment(user_id=user_id)
+            db.add(assignment)
+        assignment.interval_seconds = interval_seconds
+        config.gods_hand_enabled = True
+        db.commit()
+        logger.info(f"Gods Hand for user {user_id} handed to bot pool (interval={interval_seconds}s)")
+        result["continuous_mode"] = True
+        result["interval_seconds"] = interval_seconds
+        result["managed_by"] = "bot_pool"
+    elif continuous:
         logger.info(f"Starting continuous Gods Hand loop for user {user_id}")
         # Set status BEFORE creating task to avoid race condition
         bot_status[key] = "running"
@@ -1092,7 +1151,40 @@ async def stop_bot(bot_type: str, user_id: int, db: Session) -> dict:
     # Normalize bot type to internal key format (use underscores)
     normalized = bot_type.replace('-', '_') if bot_type else bot_type
     bot_key = f"{normalized}_{user_id}"
+
+    from app.bot_pool import pool_enabled
+    if normalized == "gods_hand" and pool_enabled():
+        # Loop lives in a pool worker: disabling the config makes its owner stop it
+        config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
+        if config and config.gods_hand_enabled:
+            config.gods_hand_enabled = False
+            db.commit()
+            bot_status[bot_key] = "stopped"
+            return {
+                "status": "success",
+                "message": f"{normalized} bot stopped"
+            }
     
+    if normalized == "dca":
+        from app.models import DcaSchedule
+        from app.dca_scheduler import dca_scheduler
+        schedule = db.query(DcaSchedule).filter(DcaSchedule.user_id == user_id).first()
+        if schedule and schedule.enabled:
+            schedule.enabled = False
+            db.commit()
+        dca_scheduler.unschedule(user_id)
+
+    if normalized == "grid":
+        # Cancels resting ladder orders (live) and unsubscribes from the price feed
+        from app.grid_engine import grid_manager
+        await grid_manager.stop(user_id)
+
+    if normalized == "gods_hand":
+        from app.bot_state import mark_stopped
+        from app.risk_engine import risk_engine
+        mark_stopped(db, user_id)
+        risk_engine.unregister(user_id)
+
     if bot_key in bot_status:
         bot_status[bot_key] = "stopped"
         
@@ -1156,26 +1248,37 @@ async def get_bot_status(user_id: int, db: Session) -> dict:
             "message": f"Kill-switch breach warning: {consecutive_breaches}/{required_breaches} consecutive breaches"
         }
     
+    gods_hand_state = bot_status.get(f"gods_hand_{user_id}", "stopped")
+    from app.bot_pool import pool_enabled
+    if pool_enabled() and config:
+        # The loop runs in another process; derive its state from config + lease
+        from app.models import BotAssignment
+        assignment = db.query(BotAssignment).filter(BotAssignment.user_id == user_id).first()
+        if not config.gods_hand_enabled:
+            gods_hand_state = "stopped"
+        elif assignment and assignment.worker_id and assignment.lease_until and assignment.lease_until >= datetime.utcnow():
+            gods_hand_state = "running"
+        else:
+            gods_hand_state = "starting"
+
+    from app.grid_engine import grid_manager
+    from app.risk_engine import risk_engine
+    from app.order_pipeline import order_pipeline
+    from app.scheduling import evaluation_schedulers
+    scheduler = evaluation_schedulers.get(user_id)
+    gods_hand_schedule = scheduler.to_dict() if scheduler else None
+
     return {
         "grid": bot_status.get(f"grid_{user_id}", "stopped"),
         "dca": bot_status.get(f"dca_{user_id}", "stopped"),
-        "gods_hand": bot_status.get(f"gods_hand_{user_id}", "stopped"),
+        "gods_hand": gods_hand_state,
         "gods_mode_enabled": gods_mode_enabled,
         "tennis_mode_enabled": tennis_mode_enabled,
         "kill_switch_cooldown": kill_switch_info,
         "kill_switch_breach_warning": breach_info,
+        "gods_hand_schedule": gods_hand_schedule,
+        "grid_engine": grid_manager.status(user_id),
+        "risk_engine": risk_engine.status(user_id),
+        "order_pipeline": order_pipeline.status(user_id),
         "timestamp": datetime.utcnow().isoformat()
     }
-
-
-async def log_and_broadcast(db: Session, log: Log):
-    """Helper to save log to DB and broadcast via WebSocket"""
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-    try:
-        from app.websocket_manager import ws_manager
-        if log.user_id:
-            await ws_manager.broadcast_log(log.user_id, log.to_dict())
-    except Exception as e:
-        print(f"⚠️ Log broadcast failed: {e}")
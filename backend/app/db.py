@@ -1,8 +1,10 @@
 """
 Database configuration
 """
+import asyncio
 import os
-from sqlalchemy import create_engine
+from concurrent.futures import Future, ThreadPoolExecutor
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -36,13 +38,105 @@ DATABASE_URL = os.getenv("DATABASE_URL", default_db_url)
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+
+def pool_options() -> dict:
+    """Connection pool settings for server databases (shared with app/db_async.py)."""
+    return {
+        "pool_pre_ping": True,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+
+
+# --- SQLite profile (standalone .exe / local installs) ---
+# WAL lets API reads run alongside a bot's write transaction (readers see the
+# last committed snapshot instead of waiting); synchronous=NORMAL only fsyncs at
+# checkpoints, which in WAL mode can lose the last commits on power loss but
+# never corrupts the file. Set SQLITE_PROFILE=0 for SQLite's defaults.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "1") != "0"
+WRITE_QUEUE_TIMEOUT = float(os.getenv("SQLITE_WRITE_TIMEOUT", "60"))
+
+
+def sqlite_pragmas() -> dict:
+    return {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB (64 MB)
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "15000")),
+        "temp_store": "MEMORY",
+    }
+
+
+def is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (url.rstrip("/") in ("sqlite:", "sqlite+aiosqlite:") or ":memory:" in url)
+
+
+def apply_sqlite_profile(target_engine, begin_immediate: bool = False):
+    """Set the profile pragmas on every new connection of a SQLite engine (sync or async).
+
+    begin_immediate: transactions take the write lock up front, so a writer
+    never fails half-way with "database is locked" after having read.
+    """
+    sync_engine = getattr(target_engine, "sync_engine", target_engine)
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+        if begin_immediate:
+            dbapi_connection.isolation_level = None  # BEGIN is emitted below instead
+
+    if begin_immediate:
+        @event.listens_for(sync_engine, "begin")
+        def _begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def sqlite_engine(url: str, profile: bool = SQLITE_PROFILE, writer: bool = False):
+    """Engine for a SQLite URL; `writer` = the single connection used by the write queue."""
+    connect_args = {"check_same_thread": False}
+    if not profile:
+        return create_engine(url, connect_args=connect_args)
+    connect_args["timeout"] = sqlite_pragmas()["busy_timeout"] / 1000
+    if is_memory_sqlite(url):
+        pool = {}  # SingletonThreadPool: one connection per thread, no sizing options
+    elif writer:
+        pool = {"pool_size": 1, "max_overflow": 0, "pool_timeout": WRITE_QUEUE_TIMEOUT}
+    else:
+        pool = {"pool_size": int(os.getenv("SQLITE_POOL_SIZE", "10")),
+                "max_overflow": int(os.getenv("SQLITE_MAX_OVERFLOW", "20"))}
+    new_engine = create_engine(url, connect_args=connect_args, **pool)
+    apply_sqlite_profile(new_engine, begin_immediate=writer)
+    return new_engine
+
 # Create SQLAlchemy engine
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = sqlite_engine(DATABASE_URL)
 else:
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    engine = create_engine(DATABASE_URL, **pool_options())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Bot writes go through write_queue: log batches, paper trades (record_paper_trade),
+# grid fills, paper snapshots, loop checkpoints and the kill-switch stop. On a
+# profiled SQLite file they run one at a time on a dedicated thread and connection,
+# so they queue in Python instead of contending for SQLite's lock; elsewhere they
+# simply run on SessionLocal in a worker thread.
+# Not covered (still committed on SessionLocal, relying on busy_timeout): request
+# handlers (config edits, bot start/stop, manual trades, auth), the live order
+# pipeline's records, DCA runs and the retention/rollup jobs.
+if DATABASE_URL.startswith("sqlite") and SQLITE_PROFILE and not is_memory_sqlite(DATABASE_URL):
+    writer_engine = sqlite_engine(DATABASE_URL, writer=True)
+    WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+else:
+    writer_engine = engine
+    WriterSessionLocal = SessionLocal
 Base = declarative_base()
 
 # Usage:
@@ -59,3 +153,56 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+class WriteQueue:
+    """Serialized write units: fn(session, *args) runs in its own session and is committed."""
+
+    def __init__(self, session_factory, serialized: bool):
+        self.session_factory = session_factory
+        self.serialized = serialized
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer") if serialized else None
+        self.completed = 0
+        self.failed = 0
+
+    def _run_unit(self, fn, args):
+        db = self.session_factory()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            self.completed += 1
+            return result
+        except Exception:
+            db.rollback()
+            self.failed += 1
+            raise
+        finally:
+            db.close()
+
+    def submit(self, fn, *args) -> Future:
+        """Queue a write unit from any thread; returns a concurrent Future."""
+        if self.serialized:
+            return self._executor.submit(self._run_unit, fn, args)
+        future = Future()
+        try:
+            future.set_result(self._run_unit(fn, args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    async def run(self, fn, *args):
+        """Await a write unit without blocking the event loop."""
+        if self.serialized:
+            return await asyncio.wrap_future(self.submit(fn, *args))
+        return await asyncio.to_thread(self._run_unit, fn, args)
+
+    def status(self) -> dict:
+        return {
+            "serialized": self.serialized,
+            "queued": self._executor._work_queue.qsize() if self._executor else 0,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+write_queue = WriteQueue(WriterSessionLocal, serialized=WriterSessionLocal is not SessionLocal)
@@ -0,0 +1,125 @@
+"""
+Async database access
+Same database as app/db.py through an async driver (asyncpg for Postgres,
+aiosqlite for SQLite), so request handlers and bot loops can await queries
+instead of blocking the event loop.
+
+- get_async_db(): FastAPI dependency yielding an AsyncSession
+- get_request_db(): what request handlers depend on. With ASYNC_DB_REQUESTS
+  on (default for Postgres) it is get_async_db; on SQLite it wraps the
+  request's sync session (the same one get_db yields; get_current_user
+  follows the same switch, so a request opens one session) in
+  SyncSessionAdapter, because aiosqlite
+  pays a thread hop per statement: measured on SQLite (2000 requests,
+  concurrency 50) the async path did 43 req/s at p99 4612 ms vs 53 req/s at
+  p99 2447 ms on the sync session
+- sync-only helpers (position ledger, performance engine, snapshot rollups)
+  are reused through `await session.run_sync(fn)`, which runs them on the
+  async connection without a thread hop
+- the position ledger and balance cache hooks are attached to the sync
+  session class behind AsyncSession (see app/models.py), so trades written
+  through either layer keep them in step
+
+Pool sizing (Postgres; also used by the sync engine): DB_POOL_SIZE,
+DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE. SQLite connections get
+the same pragmas as the sync engine (see SQLITE_PROFILE in app/db.py).
+"""
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.db import DATABASE_URL, SQLITE_PROFILE, apply_sqlite_profile, get_db, pool_options
+
+
+def async_database_url(url: str):
+    """(async URL, connect_args) for a sync SQLAlchemy URL."""
+    connect_args = {}
+    if url.startswith("sqlite"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1), connect_args
+    if url.startswith("postgresql"):
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = dict(parse_qsl(query))
+        # asyncpg takes ssl as a connect argument, not libpq's sslmode
+        sslmode = params.pop("sslmode", None)
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = sslmode
+        scheme = "postgresql+asyncpg"
+        return urlunsplit((scheme, netloc, path, urlencode(params), fragment)), connect_args
+    return url, connect_args
+
+
+class AsyncBackedSession(Session):
+    """Sync session class behind every AsyncSession (session event hooks attach here)."""
+
+
+ASYNC_DATABASE_URL, _connect_args = async_database_url(DATABASE_URL)
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=_connect_args)
+    if SQLITE_PROFILE:
+        apply_sqlite_profile(async_engine)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=_connect_args, **pool_options())
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    sync_session_class=AsyncBackedSession,
+    autoflush=False,
+    expire_on_commit=False,  # objects stay readable after commit without another round trip
+)
+
+
+async def get_async_db():
+    """Async dependency for FastAPI"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+ASYNC_DB_REQUESTS = os.getenv("ASYNC_DB_REQUESTS", "0" if DATABASE_URL.startswith("sqlite") else "1") != "0"
+
+
+class SyncSessionAdapter:
+    """AsyncSession-shaped wrapper over a sync Session: handlers written against
+    AsyncSession run unchanged (statements execute inline, as sync handlers did)."""
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def execute(self, statement, *args, **kwargs):
+        return self.sync_session.execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return self.sync_session.scalar(statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+    async def flush(self):
+        self.sync_session.flush()
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def refresh(self, instance, *args, **kwargs):
+        self.sync_session.refresh(instance, *args, **kwargs)
+
+
+if ASYNC_DB_REQUESTS:
+    get_request_db = get_async_db
+else:
+    async def get_request_db(db: Session = Depends(get_db)):
+        """Request session on SQLite: the sync get_db session behind the AsyncSession API"""
+        yield SyncSessionAdapter(db)
@@ -0,0 +1,279 @@
+"""
+Recurring DCA Scheduler
+Durable DCA jobs live in the dca_schedules table; in memory a min-heap of
+(next_run_at, user_id) drives a single timer task that sleeps until the
+earliest due time (or until woken by a schedule change), so thousands of
+idle schedules cost nothing.
+
+When jobs fall due together they are grouped by symbol and each symbol's
+price is fetched once. Runs missed while the app was down are caught up on
+start (capped by DCA_MAX_CATCHUP_RUNS) and the schedule keeps its phase.
+Each run is claimed with a compare-and-set on next_run_at so two processes
+never execute the same run. Live buys are queued on the order pipeline keyed
+by the claimed due time, so a retried run reuses the same client order id and
+an interrupted order is picked up by order_pipeline.recover().
+"""
+import asyncio
+import heapq
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+
+
+DCA_MAX_CATCHUP_RUNS = int(os.getenv("DCA_MAX_CATCHUP_RUNS", "1"))
+# Re-read the table occasionally to pick up schedules changed by other processes
+DCA_RESYNC_SECONDS = float(os.getenv("DCA_RESYNC_SECONDS", "300"))
+
+
+def _epoch(dt: datetime) -> float:
+    """Seconds since epoch for the naive-UTC datetimes stored in the DB."""
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+class DcaScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        # user_id -> next_run timestamp currently in the heap (stale heap entries are skipped)
+        self._due: Dict[int, float] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.runs_executed = 0
+
+    # ----- heap maintenance -----
+
+    def schedule(self, user_id: int, next_run_at: datetime):
+        ts = _epoch(next_run_at)
+        self._due[user_id] = ts
+        heapq.heappush(self._heap, (ts, user_id))
+        # Only wake the timer if this job is now the earliest one
+        if self._heap[0] == (ts, user_id):
+            self._wake.set()
+
+    def unschedule(self, user_id: int):
+        self._due.pop(user_id, None)
+
+    def _peek(self) -> Optional[Tuple[float, int]]:
+        while self._heap:
+            ts, user_id = self._heap[0]
+            if self._due.get(user_id) == ts:
+                return ts, user_id
+            heapq.heappop(self._heap)  # stale entry
+        return None
+
+    def _pop_due(self, now_ts: float) -> List[int]:
+        due = []
+        while True:
+            head = self._peek()
+            if head is None or head[0] > now_ts:
+                return due
+            heapq.heappop(self._heap)
+            self._due.pop(head[1], None)
+            due.append(head[1])
+
+    # ----- lifecycle -----
+
+    def load(self):
+        from app.db import SessionLocal
+        from app.models import DcaSchedule
+        from app.bots import bot_status
+
+        db = SessionLocal()
+        try:
+            schedules = db.query(DcaSchedule.user_id, DcaSchedule.next_run_at).filter(DcaSchedule.enabled == True).all()
+        finally:
+            db.close()
+        self._heap, self._due = [], {}
+        for user_id, next_run_at in schedules:
+            self.schedule(user_id, next_run_at)
+            bot_status[f"dca_{user_id}"] = "running"
+        return len(schedules)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            count = self.load()
+            print(f"🗓️ DCA scheduler started with {count} schedule(s)")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # Flag as well as cancel: wait_for can swallow a cancel that races a wake-up
+            self._stopping = True
+            self._wake.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_resync = loop.time()
+        while not self._stopping:
+            head = self._peek()
+            now_ts = _epoch(datetime.utcnow())
+            timeout = DCA_RESYNC_SECONDS if head is None else max(0.0, min(head[0] - now_ts, DCA_RESYNC_SECONDS))
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                continue  # schedule changed: recompute the earliest deadline
+            except asyncio.TimeoutError:
+                pass
+
+            if loop.time() - last_resync >= DCA_RESYNC_SECONDS:
+                self.load()
+                last_resync = loop.time()
+
+            now_ts = _epoch(datetime.utcnow())
+            due = self._pop_due(now_ts)
+            if due:
+                try:
+                    await self.run_due(due)
+                except Exception as e:
+                    print(f"❌ DCA scheduler batch failed: {e}")
+
+    # ----- execution -----
+
+    async def run_due(self, user_ids: List[int]):
+        """Execute all due jobs: one price fetch per symbol, then each user's buy(s)."""
+        from app.db import SessionLocal
+        from app.models import BotConfig, DcaSchedule
+        from app.market import get_current_price
+
+        # Objects stay loaded across the per-run commits below (no reload per row)
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            now = datetime.utcnow()
+            schedules = {s.user_id: s for s in db.query(DcaSchedule).filter(DcaSchedule.user_id.in_(user_ids)).all()}
+            configs = {c.user_id: c for c in db.query(BotConfig).filter(BotConfig.user_id.in_(user_ids)).all()}
+
+            claimed: List[Tuple[DcaSchedule, int, datetime]] = []
+            for user_id in user_ids:
+                schedule = schedules.get(user_id)
+                config = configs.get(user_id)
+                if schedule is None or not schedule.enabled:
+                    continue
+                if config is None or not config.dca_enabled or not config.dca_amount_per_period:
+                    from app.bots import bot_status
+                    schedule.enabled = False
+                    bot_status[f"dca_{user_id}"] = "stopped"
+                    continue
+                runs, next_run, missed = self._catch_up(schedule, now)
+                if runs == 0:
+                    self.schedule(user_id, schedule.next_run_at)
+                    continue
+                # Claim this run: only the process that moves next_run_at forward executes it
+                result = db.execute(
+                    update(DcaSchedule)
+                    .where(DcaSchedule.user_id == user_id, DcaSchedule.next_run_at == schedule.next_run_at)
+                    .values(next_run_at=next_run, runs_missed=DcaSchedule.runs_missed + missed)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    continue  # another process ran it; the next resync picks up its due time
+                due_at = schedule.next_run_at
+                schedule.next_run_at = next_run
+                schedule.runs_missed = (schedule.runs_missed or 0) + missed
+                claimed.append((schedule, runs, due_at))
+            db.commit()
+
+            symbols = sorted({configs[s.user_id].symbol for s, _, _ in claimed})
+            tickers = await asyncio.gather(*(get_current_price(sym) for sym in symbols), return_exceptions=True)
+            prices = {sym: t for sym, t in zip(symbols, tickers)}
+
+            for schedule, runs, due_at in claimed:
+                config = configs[schedule.user_id]
+                ticker = prices.get(config.symbol)
+                try:
+                    if isinstance(ticker, Exception) or not ticker:
+                        raise Exception(f"No price for {config.symbol}: {ticker}")
+                    if not config.paper_trading:
+                        db.commit()  # the pipeline writes its order record on its own connection
+                    # Keyed on the claimed due time: a retried or recovered run can't buy twice
+                    await execute_dca_buy(schedule.user_id, config, ticker['last'], db, runs=runs, commit=False,
+                                          intent_key=f"dca:{schedule.user_id}:{due_at.isoformat()}", wait=False)
+                    schedule.runs_completed = (schedule.runs_completed or 0) + runs
+                    schedule.last_run_at = now
+                    schedule.last_error = None
+                    self.runs_executed += runs
+                except Exception as e:
+                    print(f"❌ DCA run failed for user {schedule.user_id}: {e}")
+                    schedule.last_error = str(e)[:500]
+                self.schedule(schedule.user_id, schedule.next_run_at)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _catch_up(schedule, now: datetime) -> Tuple[int, datetime, int]:
+        """Runs to execute now, the next due time (phase preserved) and runs dropped by the cap."""
+        interval = timedelta(seconds=schedule.interval_seconds)
+        if schedule.next_run_at > now:
+            return 0, schedule.next_run_at, 0
+        periods_due = int((now - schedule.next_run_at) / interval) + 1
+        next_run = schedule.next_run_at + interval * periods_due
+        runs = min(periods_due, max(DCA_MAX_CATCHUP_RUNS, 1))
+        return runs, next_run, periods_due - runs
+
+    def status(self) -> dict:
+        head = self._peek()
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "scheduled": len(self._due),
+            "next_due_at": datetime.utcfromtimestamp(head[0]).isoformat() if head else None,
+            "runs_executed": self.runs_executed,
+        }
+
+
+async def execute_dca_buy(user_id: int, config, price: float, db, runs: int = 1, commit: bool = True,
+                          intent_key: Optional[str] = None, wait: bool = True) -> dict:
+    """One DCA period's buy (or `runs` periods when catching up) at the given price.
+    With commit=False the caller commits, so a batch of paper buys is one transaction.
+    Live buys go through the order pipeline under `intent_key` (one order per scheduled
+    run, however often it is retried); the pipeline records the trade once it fills.
+    wait=False returns as soon as the order is queued."""
+    from app.logging_models import Log, LogCategory, LogLevel
+
+    buy_amount = config.dca_amount_per_period / price * runs
+    if config.paper_trading:
+        from app.fill_simulator import record_paper_trade
+        trade, fill = await record_paper_trade(
+            db, user_id, config.symbol, "BUY", price, "dca",
+            quote_amount=config.dca_amount_per_period * runs, commit=False
+        )
+        if trade is None:
+            raise Exception(f"No order book depth to fill paper DCA buy for {config.symbol}")
+        buy_amount = fill.filled_quantity
+        result = {"mode": "paper", "amount": buy_amount, "price": fill.avg_price, "fill": fill.to_dict()}
+    else:
+        from app.order_pipeline import order_pipeline
+        intent_key = intent_key or f"dca:{user_id}:{datetime.utcnow().isoformat()}"
+        order = await order_pipeline.submit(user_id, config.symbol, "BUY", buy_amount, "dca", intent_key, wait=wait)
+        if order["status"] in ("failed", "canceled"):
+            raise Exception(f"DCA order {order['client_order_id']} {order['status']}: {order.get('error')}")
+        if order["status"] == "filled":
+            buy_amount = order["executed_qty"] or buy_amount
+            price = order["avg_price"] or price
+        result = {"mode": "live", "amount": buy_amount, "price": price, "status": order["status"], "order": order}
+
+    executed = result.get("status", "filled") == "filled"
+    db.add(Log(
+        timestamp=datetime.utcnow(),
+        category=LogCategory.TRADING,
+        level=LogLevel.INFO,
+        message=f"DCA buy {'executed' if executed else 'submitted'} ({result['mode']}): "
+                f"{buy_amount:.8f} {config.symbol} @ {price:.2f}"
+                + (f" (caught up {runs} periods)" if runs > 1 else ""),
+        details=json.dumps({"runs": runs, "amount": buy_amount, "price": price, "intent_key": intent_key}),
+        user_id=user_id,
+        symbol=config.symbol,
+        bot_type="dca",
+    ))
+    if commit:
+        db.commit()
+    return result
+
+
+dca_scheduler = DcaScheduler()
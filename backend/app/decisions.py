@@ -0,0 +1,138 @@
+"""
+Structured Decision Records
+Each Gods Hand decision is stored once in the `decisions` table: the values
+analytics need as typed columns (action, confidence, indicators, regime,
+step/fill %, outcome, latency) and everything else as a small zlib-compressed
+JSON blob. The AI_THINKING log only keeps a one-line message; the old
+multi-line "AI DECISION CALCULATION" text is rendered from the record when the
+log viewer asks for it (render_summary / attach_summaries).
+
+    SELECT action, AVG(confidence), SUM(executed) FROM decisions
+    WHERE user_id = 1 GROUP BY action;
+"""
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert, select
+
+from app.models import Decision
+
+
+def _jsonable(value):
+    # numpy scalars from the indicator code
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def pack_extras(extras: Optional[dict]) -> Optional[bytes]:
+    if not extras:
+        return None
+    raw = json.dumps(extras, separators=(",", ":"), default=_jsonable).encode()
+    return zlib.compress(raw, 6)
+
+
+def unpack_extras(blob: Optional[bytes]) -> dict:
+    if not blob:
+        return {}
+    return json.loads(zlib.decompress(blob))
+
+
+def summary_line(decision: dict) -> str:
+    """Stored message of the AI_THINKING log."""
+    mode = "Gods Mode" if decision.get("gods_mode") else "Standard AI"
+    return f"AI decision for {decision['symbol']}: {decision['action']} @{(decision.get('confidence') or 0):.2f} ({mode})"
+
+
+def render_summary(decision: dict) -> str:
+    """The human-readable decision text (a Decision.to_dict() or DecisionRecord.view())."""
+    extras = decision.get("extras") or {}
+    signals = extras.get("signals") or []
+    action = decision["action"]
+    confidence = decision.get("confidence") or 0.0
+    mode_label = "GODS MODE (Meta-Model AI)" if decision.get("gods_mode") else "Standard AI"
+    max_pos = decision.get("max_position_usd") or 0.0
+    current_val = decision.get("position_value_usd") or 0.0
+    return (
+        f"AI DECISION CALCULATION for {decision['symbol']} ({mode_label})\n\n"
+        f"-- AI Recommendation: {action} @{confidence:.2f}\n"
+        f"   Signals analyzed: {len(signals)}\n"
+        + ("".join([f"   • {s}\n" for s in signals[:5]]) or "   • (no signals logged)\n")
+        + f"\n-- Confidence: BUY={decision.get('buy_signals') or 0}, SELL={decision.get('sell_signals') or 0}, "
+        f"HOLD={decision.get('hold_signals') or 0}\n"
+        f"   - Confidence: {confidence:.3f} (average of {len(signals)} factors)\n\n"
+        f"Final Decision: {action} @ {confidence:.0%} confidence\n\n"
+        f"-- Position Setup for {decision['symbol']}:\n"
+        f"   - Max Position Size: ${max_pos:.2f}\n"
+        f"   - Current Held (cost basis value): ${current_val:.2f} ({(decision.get('fill_before') or 0.0):.1f}%)\n"
+        f"   - Available Capacity: ${max(0.0, max_pos - current_val):.2f}\n"
+        f"   - Incremental Trade (step): ${(decision.get('step_amount_usd') or 0.0):.2f}\n"
+    )
+
+
+class DecisionRecord:
+    """Columns and extras of one in-flight decision; finish() writes it exactly once."""
+
+    def __init__(self, started: float, extras: Optional[dict] = None, **columns):
+        self.started = started
+        self.columns = columns
+        self.columns.setdefault("timestamp", datetime.utcnow())
+        self.extras = dict(extras or {})
+        self.recorded = False
+
+    def view(self) -> dict:
+        data = dict(self.columns, extras=self.extras)
+        data["timestamp"] = self.columns["timestamp"].isoformat() + "Z"
+        return data
+
+    async def finish(self, executed: bool, block_reason: Optional[str] = None,
+                     client_order_id: Optional[str] = None, **extras):
+        """Store the outcome (through the bot write queue). Never raises into the bot loop.
+
+        Live orders finish as (False, "submitted", client_order_id); the order pipeline
+        sets the final outcome when the order settles (see order_pipeline.DECISION_OUTCOMES).
+        """
+        if self.recorded:
+            return
+        self.recorded = True
+        self.extras.update(extras)
+        row = dict(self.columns, executed=executed, block_reason=block_reason, client_order_id=client_order_id,
+                   latency_ms=int((time.perf_counter() - self.started) * 1000),
+                   extras=pack_extras(self.extras))
+
+        def write(session):
+            if client_order_id:
+                # The order may have settled before this row exists
+                from app.models import OrderRecord
+                from app.order_pipeline import DECISION_OUTCOMES
+                status = session.execute(
+                    select(OrderRecord.status).where(OrderRecord.client_order_id == client_order_id)
+                ).scalar()
+                row.update(DECISION_OUTCOMES.get(status, {}))
+            session.execute(insert(Decision.__table__), [row])
+
+        try:
+            from app.db import write_queue
+            await write_queue.run(write)
+        except Exception as e:
+            print(f"⚠️ Failed to record decision {row.get('decision_id')}: {e}")
+
+
+async def attach_summaries(db, logs: List[dict]) -> List[dict]:
+    """Render message/details of AI_THINKING log dicts from their decision records (AsyncSession)."""
+    wanted = {log["decision_id"] for log in logs
+              if log.get("category") == "ai_thinking" and log.get("decision_id") and not log.get("details")}
+    if not wanted:
+        return logs
+    rows = (await db.execute(select(Decision).where(Decision.decision_id.in_(wanted)))).scalars().all()
+    decisions = {row.decision_id: row.to_dict() for row in rows}
+    for log in logs:
+        decision = decisions.get(log.get("decision_id")) if log.get("category") == "ai_thinking" else None
+        if decision:
+            log["message"] = render_summary(decision)
+            log["details"] = json.dumps(decision, default=str)
+    return logs
@@ -0,0 +1,228 @@
+"""
+Bulk Export
+Streams trades, logs, decisions and paper trading snapshots for a user and
+date range as NDJSON, CSV or Parquet, optionally gzipped on the fly. Used by
+GET /api/export/{dataset} and backend/export_data.py.
+
+Memory stays constant whatever the row count:
+
+- rows come from one streaming cursor (server-side on Postgres, incremental
+  fetch on SQLite, where WAL keeps the long read from blocking bot writes)
+  in chunks of EXPORT_CHUNK_ROWS
+- each chunk is encoded and yielded before the next one is fetched; Parquet
+  writes one row group per chunk
+- export() is a plain generator, so StreamingResponse runs it in a worker
+  thread and the event loop never waits on the database
+
+Parquet needs pyarrow (optional; not in requirements.txt).
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime
+from enum import Enum
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportError(ValueError):
+    """Unknown dataset/format or a missing optional dependency."""
+
+
+def _datasets() -> dict:
+    from app.logging_models import Log
+    from app.models import Decision, Trade
+    from app.paper_trading_tracker import PaperTradingSnapshot
+    return {
+        "trades": Trade.__table__,
+        "logs": Log.__table__,
+        "decisions": Decision.__table__,
+        "snapshots": PaperTradingSnapshot.__table__,
+    }
+
+
+def datasets() -> list:
+    return list(_datasets())
+
+
+def _text(value):
+    """JSON/CSV form of a value."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str, separators=(",", ":"))
+    return value
+
+
+def _chunks(conn, table, user_id: Optional[int], since: Optional[datetime],
+            until: Optional[datetime], chunk_rows: int) -> Iterator[list]:
+    stmt = select(table)
+    if user_id is not None:
+        stmt = stmt.where(table.c.user_id == user_id)
+    if since:
+        stmt = stmt.where(table.c.timestamp >= since)
+    if until:
+        stmt = stmt.where(table.c.timestamp < until)
+    stmt = stmt.order_by(table.c.timestamp, table.c.id)
+
+    decode_extras = table.name == "decisions"
+    if decode_extras:
+        from app.decisions import unpack_extras
+
+    result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+    for partition in result.partitions():
+        rows = []
+        for row in partition:
+            record = {key: value.value if isinstance(value, Enum) else value for key, value in row._mapping.items()}
+            if decode_extras:
+                record["extras"] = unpack_extras(record["extras"])
+            rows.append(record)
+        yield rows
+
+
+def _ndjson(chunks, table) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(row, default=_text, separators=(",", ":")) + "\n" for row in rows).encode()
+
+
+def _csv(chunks, table) -> Iterator[bytes]:
+    yield (",".join(column.name for column in table.columns) + "\r\n").encode()
+    for rows in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_text(value) for value in row.values()])
+        yield buffer.getvalue().encode()
+
+
+def _arrow_schema(table):
+    import pyarrow as pa
+    from sqlalchemy import Boolean, Date, DateTime, Float, Integer
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()  # text, enums, JSON (decision extras)
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+class _StreamSink:
+    """Write-only file for ParquetWriter: hands out the bytes written since the last take().
+    tell() keeps counting from the start, since the footer records row group offsets."""
+
+    def __init__(self):
+        self.parts = []
+        self.offset = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.offset
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _parquet(chunks, table) -> Iterator[bytes]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    schema = _arrow_schema(table)
+    text_columns = [f.name for f in schema if f.type == pa.string()]
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            for row in rows:
+                for name in text_columns:
+                    if row[name] is not None and not isinstance(row[name], str):
+                        row[name] = _text(row[name])
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))  # one row group per chunk
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+    finally:
+        if writer.is_open:
+            writer.close()
+
+
+_ENCODERS = {"ndjson": _ndjson, "csv": _csv, "parquet": _parquet}
+
+
+def _gzip(parts) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def check(dataset: str, fmt: str):
+    """Raise ExportError before a response is started."""
+    if dataset not in _datasets():
+        raise ExportError(f"Unknown dataset '{dataset}' (one of: {', '.join(_datasets())})")
+    if fmt not in _ENCODERS:
+        raise ExportError(f"Unknown format '{fmt}' (one of: {', '.join(_ENCODERS)})")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+
+
+def export(dataset: str, fmt: str = "ndjson", user_id: Optional[int] = None,
+           since: Optional[datetime] = None, until: Optional[datetime] = None,
+           gzip: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS, engine=None) -> Iterator[bytes]:
+    """Generator of encoded bytes for one dataset export (one DB connection for its lifetime)."""
+    check(dataset, fmt)
+    if engine is None:
+        from app.db import engine
+    with engine.connect() as conn:
+        table = _datasets()[dataset]
+        parts = _ENCODERS[fmt](_chunks(conn, table, user_id, since, until, chunk_rows), table)
+        yield from (_gzip(parts) if gzip else parts)
+
+
+def filename(dataset: str, fmt: str, gzip: bool, user_id: Optional[int] = None) -> str:
+    suffix = f"_user{user_id}" if user_id is not None else ""
+    return f"{dataset}{suffix}_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}" + (".gz" if gzip else "")
@@ -0,0 +1,192 @@
+"""
+Paper Trading Fill Simulator
+Fills paper market orders against the cached order book instead of at the
+last price: walks the depth with a vectorized cumulative-volume search
+(numpy cumsum + searchsorted) to get the volume-weighted fill price, fills
+partially when the visible book is too thin, and optionally waits a
+simulated latency before reading the book.
+
+Fees are reported at the same 0.1% rate position_tracker applies when it
+replays trades, so they are not deducted twice.
+
+All paper Trade rows are built by `paper_trade_row`; `record_paper_trade`
+simulates one fill and commits its row through the DB write queue.
+"""
+import asyncio
+import os
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+PAPER_FEE_RATE = 0.001
+PAPER_DEPTH_LIMIT = int(os.getenv("PAPER_DEPTH_LIMIT", "100"))
+# Delay between the decision and the (simulated) order reaching the book
+PAPER_FILL_LATENCY_MS = float(os.getenv("PAPER_FILL_LATENCY_MS", "0"))
+
+
+@dataclass
+class FillResult:
+    side: str
+    requested_quantity: float
+    filled_quantity: float
+    avg_price: float
+    notional: float
+    fee: float
+    reference_price: float
+    levels_consumed: int
+    partial: bool
+    latency_ms: float = 0.0
+    source: str = "order_book"  # order_book | reference (no book available) | limit
+
+    @property
+    def slippage_bps(self) -> float:
+        if not self.reference_price or not self.filled_quantity:
+            return 0.0
+        sign = 1 if self.side == "BUY" else -1
+        return sign * (self.avg_price - self.reference_price) / self.reference_price * 10000
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["slippage_bps"] = round(self.slippage_bps, 3)
+        return data
+
+
+def walk_book(side: str, levels, quantity: Optional[float] = None,
+              quote_amount: Optional[float] = None) -> Tuple[float, float, int]:
+    """
+    Consume depth for a market order.
+    BUY walks asks, SELL walks bids; size by base `quantity` or by `quote_amount`.
+    Returns (filled_quantity, notional, levels_consumed).
+    """
+    book = np.asarray(levels, dtype=float).reshape(-1, 2)
+    if book.size == 0:
+        return 0.0, 0.0, 0
+    prices, sizes = book[:, 0], book[:, 1]
+    cum_qty = np.cumsum(sizes)
+    cum_notional = np.cumsum(prices * sizes)
+
+    if quote_amount is not None:
+        k = int(np.searchsorted(cum_notional, quote_amount, side="left"))
+        if k >= len(prices):
+            return float(cum_qty[-1]), float(cum_notional[-1]), len(prices)
+        prev_qty = cum_qty[k - 1] if k else 0.0
+        prev_notional = cum_notional[k - 1] if k else 0.0
+        rest = (quote_amount - prev_notional) / prices[k]
+        return float(prev_qty + rest), float(quote_amount), k + 1
+
+    k = int(np.searchsorted(cum_qty, quantity, side="left"))
+    if k >= len(prices):
+        return float(cum_qty[-1]), float(cum_notional[-1]), len(prices)
+    prev_qty = cum_qty[k - 1] if k else 0.0
+    prev_notional = cum_notional[k - 1] if k else 0.0
+    return float(quantity), float(prev_notional + (quantity - prev_qty) * prices[k]), k + 1
+
+
+async def simulate_market_fill(symbol: str, side: str, reference_price: float,
+                               quantity: Optional[float] = None,
+                               quote_amount: Optional[float] = None) -> FillResult:
+    """Simulate a market order; falls back to the reference price if no book is available."""
+    from app.market import get_order_book
+
+    side = side.upper()
+    if PAPER_FILL_LATENCY_MS > 0:
+        await asyncio.sleep(PAPER_FILL_LATENCY_MS / 1000.0)
+
+    requested = quantity if quantity is not None else (quote_amount / reference_price if reference_price else 0.0)
+    try:
+        book = await get_order_book(symbol, PAPER_DEPTH_LIMIT)
+        levels = book["asks"] if side == "BUY" else book["bids"]
+    except Exception as e:
+        print(f"⚠️ Paper fill: no order book for {symbol} ({e}), filling at reference price")
+        levels = []
+
+    if not levels:
+        notional = requested * reference_price
+        return FillResult(side, requested, requested, reference_price, notional,
+                          notional * PAPER_FEE_RATE, reference_price, 0, False,
+                          PAPER_FILL_LATENCY_MS, source="reference")
+
+    filled, notional, consumed = walk_book(side, levels, quantity=quantity, quote_amount=quote_amount)
+    avg_price = notional / filled if filled > 0 else reference_price
+    if quote_amount is not None:
+        partial = notional + 1e-9 < quote_amount
+        # Quote-sized orders have no exact base size; express it at the achieved price
+        requested = quote_amount / avg_price if partial else filled
+    else:
+        partial = filled + 1e-12 < requested
+    return FillResult(
+        side=side,
+        requested_quantity=requested,
+        filled_quantity=filled,
+        avg_price=avg_price,
+        notional=notional,
+        fee=notional * PAPER_FEE_RATE,
+        reference_price=reference_price,
+        levels_consumed=consumed,
+        partial=partial,
+        latency_ms=PAPER_FILL_LATENCY_MS,
+    )
+
+
+def limit_fill(side: str, quantity: float, limit_price: float) -> FillResult:
+    """Resting limit order that was traded through: fills in full at its limit price."""
+    notional = quantity * limit_price
+    return FillResult(side.upper(), quantity, quantity, limit_price, notional,
+                      notional * PAPER_FEE_RATE, limit_price, 0, False, source="limit")
+
+
+def paper_trade_row(user_id: int, symbol: str, reference_price: float, bot_type: str, fill: FillResult):
+    from app.models import Trade
+    return Trade(
+        user_id=user_id,
+        symbol=symbol,
+        side=fill.side,
+        amount=fill.filled_quantity,
+        price=reference_price,
+        filled_price=fill.avg_price,
+        status="completed_paper",
+        bot_type=bot_type,
+        timestamp=datetime.utcnow()
+    )
+
+
+def _insert_detached(session, row):
+    # Flushed (id assigned, ledger hook run) and detached, so the caller can read it
+    # after the writer's session is gone; the queue commits the transaction
+    session.add(row)
+    session.flush()
+    session.expunge(row)
+    return row
+
+
+async def record_paper_trade(db, user_id: int, symbol: str, side: str, reference_price: float,
+                             bot_type: str, quantity: Optional[float] = None,
+                             quote_amount: Optional[float] = None,
+                             limit_price: Optional[float] = None,
+                             commit: bool = True):
+    """
+    Simulate a paper fill and write its Trade row.
+    Returns (trade, fill); trade is None when nothing could be filled.
+    commit=True commits it through write_queue (its own session); with
+    commit=False the row is added to `db` and the caller commits.
+    """
+    if limit_price is not None:
+        fill = limit_fill(side, quantity, limit_price)
+    else:
+        fill = await simulate_market_fill(symbol, side, reference_price, quantity=quantity, quote_amount=quote_amount)
+
+    if fill.filled_quantity <= 0:
+        return None, fill
+
+    trade = paper_trade_row(user_id, symbol, reference_price, bot_type, fill)
+    if commit:
+        from app.db import write_queue
+        await write_queue.run(_insert_detached, trade)
+    else:
+        db.add(trade)
+    if fill.partial:
+        print(f"⚠️ Paper {fill.side} {symbol} partially filled: {fill.filled_quantity:.8f}/{fill.requested_quantity:.8f}")
+    return trade, fill
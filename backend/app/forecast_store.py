@@ -0,0 +1,238 @@
+"""
+Forecast Snapshot Storage and Accuracy Scoring
+Snapshots keep their forecast points as packed arrays (8-byte float price and
+1-byte confidence per hour) instead of a JSON list, and are scored once:
+
+- the evaluation job picks snapshots whose last forecast hour has a closed
+  hourly candle, fetches candles once per symbol for the whole batch and
+  stores MAE / MAPE / point count on the row (evaluated_at marks it done)
+- /api/market/forecast/history is then a single indexed read with no
+  exchange calls
+
+Snapshots older than the candles the exchange returns are marked evaluated
+with 0 points, as are a symbol's due snapshots once its candle fetch has
+failed (or come back empty) MAX_FETCH_ATTEMPTS runs in a row, so a delisted
+symbol can't hold the oldest slots of every batch. FORECAST_EVAL_INTERVAL_MINUTES
+sets how often the job runs (0 = off).
+"""
+import asyncio
+import json
+import os
+from array import array
+from calendar import timegm
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app.models import ForecastSnapshot
+
+
+FORECAST_EVAL_INTERVAL_MINUTES = float(os.getenv("FORECAST_EVAL_INTERVAL_MINUTES", "15"))
+FORECAST_EVAL_BATCH = 500
+MAX_CANDLES = 1000  # largest hourly window requested from the exchange
+MAX_FETCH_ATTEMPTS = 3  # consecutive failed candle fetches before a symbol's due rows are given up
+
+last_run: dict = {}
+# symbol -> consecutive runs whose candle fetch failed or returned nothing
+fetch_failures: dict = defaultdict(int)
+
+
+def pack_forecasts(forecasts: List[dict]) -> Tuple[bytes, bytes]:
+    """(prices, confidences) blobs for [{hour, predicted_price, confidence}] (hours 1..N)."""
+    points = sorted((f for f in forecasts if f.get('hour') and f.get('predicted_price') is not None),
+                    key=lambda f: int(f['hour']))
+    hours = max((int(f['hour']) for f in points), default=0)
+    prices = array('d', [float('nan')] * hours)
+    confidences = bytearray(hours)
+    for f in points:
+        prices[int(f['hour']) - 1] = float(f['predicted_price'])
+        confidences[int(f['hour']) - 1] = max(0, min(100, round(float(f.get('confidence') or 0) * 100)))
+    return prices.tobytes(), bytes(confidences)
+
+
+def unpack_forecasts(snapshot: ForecastSnapshot) -> List[dict]:
+    if snapshot.predicted_prices is None:
+        # Not packed (yet): the list is still in data_json
+        try:
+            return json.loads(snapshot.data_json).get('forecasts', [])
+        except Exception:
+            return []
+    prices = array('d')
+    prices.frombytes(snapshot.predicted_prices)
+    confidences = snapshot.confidences or b''
+    return [
+        {'hour': i + 1, 'predicted_price': price,
+         'confidence': confidences[i] / 100 if i < len(confidences) else None}
+        for i, price in enumerate(prices) if price == price  # skip NaN gaps
+    ]
+
+
+def new_snapshot(symbol: str, horizon_hours: int, forecast: dict, current_price: float) -> ForecastSnapshot:
+    forecasts = forecast.get('forecasts') or forecast.get('forecast') or forecast.get('predictions') or []
+    prices, confidences = pack_forecasts(forecasts)
+    return ForecastSnapshot(
+        symbol=symbol,
+        horizon_hours=horizon_hours,
+        current_price=current_price,
+        summary=forecast.get('summary'),
+        predicted_prices=prices,
+        confidences=confidences,
+        data_json=json.dumps({
+            'risk_metrics': forecast.get('risk_metrics'),
+            'price_targets': forecast.get('price_targets'),
+        }, separators=(',', ':')),
+    )
+
+
+def metrics(snapshot: ForecastSnapshot) -> dict:
+    if not snapshot.evaluated_points:
+        return {'evaluated': False}
+    return {'mae': snapshot.mae, 'mape': snapshot.mape, 'n': snapshot.evaluated_points, 'evaluated': True}
+
+
+# ----- evaluation -----
+
+def _epoch(dt: datetime) -> int:
+    return timegm(dt.timetuple())  # generated_at is naive UTC
+
+
+def due_before(now: datetime, horizon_hours: int) -> datetime:
+    # The candle holding the last forecast hour must have closed
+    return now - timedelta(hours=(horizon_hours or 0) + 1)
+
+
+def due_clause(dialect: str, now: datetime):
+    """SQL form of generated_at <= due_before(now, horizon_hours), per row."""
+    hours = func.coalesce(ForecastSnapshot.horizon_hours, 0) + 1
+    if dialect == 'postgresql':
+        return ForecastSnapshot.generated_at + func.make_interval(0, 0, 0, 0, hours) <= now
+    # SQLite stores DateTime as text; julianday() is in days
+    return func.julianday(ForecastSnapshot.generated_at) + hours / 24.0 <= func.julianday(now)
+
+
+def score(snapshot: ForecastSnapshot, closes: dict) -> Tuple[Optional[float], Optional[float], int]:
+    """(MAE, MAPE, points) against {hourly candle open (epoch s): close}."""
+    start = _epoch(snapshot.generated_at)
+    abs_errors, pct_errors = [], []
+    for point in unpack_forecasts(snapshot):
+        target = start + int(point['hour']) * 3600
+        hour_open = target - target % 3600
+        # The candle holding the target time, else its neighbours
+        actual = next((closes[ts] for ts in (hour_open, hour_open - 3600, hour_open + 3600) if closes.get(ts)), None)
+        if actual and actual > 0:
+            error = abs(point['predicted_price'] - actual)
+            abs_errors.append(error)
+            pct_errors.append(error / actual)
+    if not abs_errors:
+        return None, None, 0
+    return sum(abs_errors) / len(abs_errors), sum(pct_errors) / len(pct_errors), len(abs_errors)
+
+
+async def evaluate_due(db, now: Optional[datetime] = None, batch: int = FORECAST_EVAL_BATCH) -> dict:
+    """Score snapshots whose horizon has elapsed (AsyncSession); candles are fetched once per symbol."""
+    from app.market import get_candlestick_data
+
+    now = now or datetime.utcnow()
+    rows = (await db.execute(
+        select(ForecastSnapshot)
+        .where(
+            ForecastSnapshot.evaluated_at.is_(None),
+            ForecastSnapshot.generated_at <= due_before(now, 0),
+            due_clause(db.get_bind().dialect.name, now),
+        )
+        .order_by(ForecastSnapshot.generated_at)
+        .limit(batch)
+    )).scalars().all()
+    by_symbol = defaultdict(list)
+    for row in rows:
+        by_symbol[row.symbol].append(row)
+
+    evaluated = skipped = 0
+    for symbol, snapshots in by_symbol.items():
+        oldest = min(s.generated_at for s in snapshots)
+        hours_back = int((now - oldest).total_seconds() // 3600) + 2
+        try:
+            candles = await get_candlestick_data(symbol, timeframe='1h', limit=min(hours_back, MAX_CANDLES))
+        except Exception as e:
+            print(f"⚠️ Forecast evaluation: candles for {symbol} failed: {e}")
+            candles = None
+        closes = {int(c['timestamp'] / 1000): c.get('close') for c in candles or []}
+        if not closes:
+            fetch_failures[symbol] += 1
+            if fetch_failures[symbol] < MAX_FETCH_ATTEMPTS:
+                continue
+            print(f"⚠️ Forecast evaluation: no candles for {symbol} after {fetch_failures[symbol]} attempts, "
+                  f"marking {len(snapshots)} snapshot(s) evaluated with 0 points")
+        fetch_failures.pop(symbol, None)
+        for snapshot in snapshots:
+            snapshot.mae, snapshot.mape, snapshot.evaluated_points = score(snapshot, closes)
+            snapshot.evaluated_at = now
+            if snapshot.evaluated_points:
+                evaluated += 1
+            else:
+                skipped += 1
+    await db.commit()
+    return {"evaluated": evaluated, "no_data": skipped, "pending_checked": len(rows), "ran_at": now.isoformat()}
+
+
+def backfill_packed(conn, batch: int = 1000) -> int:
+    """Pack forecast lists still stored in data_json (used by the schema migration)."""
+    from sqlalchemy import text
+    converted = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, data_json FROM forecast_snapshots WHERE predicted_prices IS NULL ORDER BY id LIMIT :n"
+        ), {"n": batch}).all()
+        if not rows:
+            return converted
+        for row_id, data_json in rows:
+            try:
+                data = json.loads(data_json or '{}')
+            except Exception:
+                data = {}
+            prices, confidences = pack_forecasts(data.pop('forecasts', None) or [])
+            conn.execute(text(
+                "UPDATE forecast_snapshots SET predicted_prices = :p, confidences = :c, data_json = :d WHERE id = :id"
+            ), {"p": prices, "c": confidences, "d": json.dumps(data, separators=(',', ':')), "id": row_id})
+        converted += len(rows)
+
+
+class AccuracyScheduler:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, interval_minutes: float = FORECAST_EVAL_INTERVAL_MINUTES):
+        if interval_minutes > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(interval_minutes * 60))
+            print(f"🎯 Forecast accuracy scoring every {interval_minutes:g} min")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.run_once()
+
+    async def run_once(self) -> dict:
+        from app.db_async import AsyncSessionLocal
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await evaluate_due(db)
+        except Exception as e:
+            result = {"error": str(e)}
+            print(f"⚠️ Forecast evaluation failed: {e}")
+        last_run.clear()
+        last_run.update(result)
+        return result
+
+
+accuracy_scheduler = AccuracyScheduler()
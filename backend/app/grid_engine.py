@@ -0,0 +1,425 @@
+"""
+Grid Trading Engine
+Tick-driven grid bot: a sorted price-level index finds the resting orders the
+current price makes marketable with bisect in O(log n) per tick (a BUY fills
+at or below its level, a SELL at or above, however far price jumped between
+ticks), ladder orders are placed/replaced in parallel under the exchange rate
+limiter, live fills are reconciled against open orders, and paper mode fills
+resting limit orders only when price trades through them.
+
+Ladder rules (classic grid):
+- at start, BUY at every level below the current price, SELL at the levels
+  above it that the base asset already held can cover (nearest first)
+- a filled BUY at level i places a SELL at level i+1
+- a filled SELL at level i places a BUY at level i-1
+"""
+import asyncio
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+GRID_RECONCILE_SECONDS = float(os.getenv("GRID_RECONCILE_SECONDS", "15"))
+GRID_PLACEMENT_CONCURRENCY = int(os.getenv("GRID_PLACEMENT_CONCURRENCY", "8"))
+# Paper fills require price to trade this far through a level (queue-position proxy)
+PAPER_GRID_FILL_THROUGH_PERCENT = float(os.getenv("PAPER_GRID_FILL_THROUGH_PERCENT", "0.01"))
+# Live: a tick with marketable resting orders reconciles at most this often
+GRID_TICK_RECONCILE_SECONDS = float(os.getenv("GRID_TICK_RECONCILE_SECONDS", "1"))
+
+
+class GridLevelIndex:
+    """Sorted level prices plus the levels holding a resting BUY / SELL (kept sorted),
+    so the orders a price makes marketable are found via bisect."""
+
+    def __init__(self, prices: List[float]):
+        self.prices = sorted(prices)
+        self.bids: List[int] = []
+        self.asks: List[int] = []
+
+    def __len__(self):
+        return len(self.prices)
+
+    def rest(self, level: int, side: str):
+        insort(self.bids if side == "BUY" else self.asks, level)
+
+    def unrest(self, level: int, side: str):
+        levels = self.bids if side == "BUY" else self.asks
+        i = bisect_left(levels, level)
+        if i < len(levels) and levels[i] == level:
+            del levels[i]
+
+    def clear(self):
+        self.bids, self.asks = [], []
+
+    def filled_bids(self, price: float, through: float = 0.0) -> List[int]:
+        """Resting BUY levels L with price <= L*(1-through)."""
+        first = bisect_left(self.prices, price / (1 - through) if through < 1 else price)
+        return self.bids[bisect_left(self.bids, first):]
+
+    def filled_asks(self, price: float, through: float = 0.0) -> List[int]:
+        """Resting SELL levels L with price >= L*(1+through)."""
+        end = bisect_right(self.prices, price / (1 + through))
+        return self.asks[:bisect_left(self.asks, end)]
+
+
+@dataclass
+class GridOrder:
+    level: int
+    side: str
+    price: float
+    quantity: float
+    order_id: Optional[int] = None  # exchange order id (live only)
+    placed_at: float = field(default_factory=time.monotonic)
+
+
+class GridEngine:
+    """One running grid for one user/symbol."""
+
+    def __init__(self, user_id: int, symbol: str, lower_price: float, upper_price: float,
+                 levels: int, budget: float, paper_trading: bool):
+        self.user_id = user_id
+        self.symbol = symbol
+        self.paper_trading = paper_trading
+        self.budget = budget
+        step = (upper_price - lower_price) / levels
+        self.index = GridLevelIndex([lower_price + i * step for i in range(levels + 1)])
+        # `levels` intervals -> levels + 1 prices, each can hold an order
+        self.amount_per_level = budget / len(self.index)
+        # level -> resting order (None when empty)
+        self.orders: List[Optional[GridOrder]] = [None] * len(self.index)
+
+        self.last_price: Optional[float] = None
+        self.fills = 0
+        self.tick_count = 0
+        self.last_tick_ms = 0.0
+        self.started_at: Optional[datetime] = None
+
+        self._lock = asyncio.Lock()
+        self._client = None
+        self._step_size = 0.0
+        self._tick_size = 0.0
+        self._unsubscribe = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._last_reconcile = 0.0
+        self._placement_sem = asyncio.Semaphore(GRID_PLACEMENT_CONCURRENCY)
+
+    # ----- lifecycle -----
+
+    async def start(self, current_price: float) -> int:
+        from app.price_feed import price_feed
+
+        if not self.paper_trading:
+            await self._init_live_client()
+
+        self.last_price = current_price
+        initial = [(i, "BUY") for i, price in enumerate(self.index.prices) if price < current_price]
+        # Only sell what is held: a naked SELL ladder would short the account
+        held = await self._held_quantity(current_price)
+        for i, price in enumerate(self.index.prices):
+            if price <= current_price:
+                continue
+            quantity = self._quantity(price)
+            if quantity <= 0 or quantity > held + 1e-12:
+                break
+            held -= quantity
+            initial.append((i, "SELL"))
+        placed = await self._place_many(initial)
+
+        self.started_at = datetime.utcnow()
+        self._unsubscribe = price_feed.subscribe(self.symbol, self.on_tick)
+        if not self.paper_trading:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+        return placed
+
+    async def stop(self):
+        if self._unsubscribe:
+            self._unsubscribe()
+            self._unsubscribe = None
+        if self._reconcile_task:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+        if not self.paper_trading:
+            await asyncio.gather(
+                *(self._cancel(order) for order in self.orders if order and order.order_id),
+                return_exceptions=True,
+            )
+        self.orders = [None] * len(self.index)
+        self.index.clear()
+
+    # ----- order placement -----
+
+    def _quantity(self, price: float) -> float:
+        from app.market import round_to_step
+        quantity = self.amount_per_level / price
+        return round_to_step(quantity, self._step_size) if self._step_size else quantity
+
+    async def _held_quantity(self, current_price: float) -> float:
+        """Base asset available to back the initial SELLs."""
+        if self.paper_trading:
+            from app.db import SessionLocal
+            from app.position_tracker import get_current_position
+            db = SessionLocal()
+            try:
+                position = get_current_position(self.user_id, self.symbol, db)
+            finally:
+                db.close()
+            if position.get('_paper_initial'):
+                # Same simulated 50/50 start as Gods Hand paper trading
+                return (self.budget / 2) / current_price
+            return max(position.get('quantity') or 0.0, 0.0)
+
+        from app.rate_limiter import request_limiter
+        base_asset = self.symbol.split('/')[0]
+        await request_limiter.acquire()
+        balances = await asyncio.to_thread(self._client.get_balance)
+        return next((float(b.get('free') or 0) for b in balances if b.get('asset') == base_asset), 0.0)
+
+    def _set(self, level: int, order: Optional[GridOrder]):
+        """Put/clear the resting order at a level, keeping the index in step."""
+        current = self.orders[level]
+        if current is not None:
+            self.index.unrest(level, current.side)
+        self.orders[level] = order
+        if order is not None:
+            self.index.rest(level, order.side)
+
+    async def _place_many(self, wanted: List[tuple]) -> int:
+        results = await asyncio.gather(
+            *(self._place(level, side) for level, side in wanted), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ Grid order placement failed for user {self.user_id}: {result}")
+        return sum(1 for r in results if r is True)
+
+    async def _place(self, level: int, side: str) -> bool:
+        if level < 0 or level >= len(self.index) or self.orders[level] is not None:
+            return False
+        price = self.index.prices[level]
+        order = GridOrder(level=level, side=side, price=price, quantity=self._quantity(price))
+        if order.quantity <= 0:
+            return False
+        # Reserve the slot before awaiting so concurrent placements don't double up
+        self._set(level, order)
+        if self.paper_trading:
+            return True
+
+        from app.rate_limiter import acquire_order_slot
+        from app.market import round_to_step
+        try:
+            async with self._placement_sem:
+                await acquire_order_slot(self.user_id)
+                result = await asyncio.to_thread(
+                    self._client.create_order,
+                    self.symbol.replace('/', ''), side, 'LIMIT',
+                    quantity=order.quantity,
+                    price=round_to_step(price, self._tick_size) if self._tick_size else price,
+                )
+            order.order_id = result.get('orderId')
+            return True
+        except Exception:
+            self._set(level, None)
+            raise
+
+    async def _cancel(self, order: GridOrder):
+        from app.rate_limiter import acquire_order_slot
+        await acquire_order_slot(self.user_id)
+        await asyncio.to_thread(self._client.cancel_order, self.symbol.replace('/', ''), order.order_id)
+
+    async def _init_live_client(self):
+        from app.db import SessionLocal
+        from app.models import User
+        from app.auth import decrypt_api_key
+        from app.binance_client import get_binance_th_client
+        from app.market import get_symbol_step_size, get_symbol_tick_size
+
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == self.user_id).first()
+            if not user or not user.binance_api_key or not user.binance_api_secret:
+                raise Exception("API keys not configured")
+            self._client = get_binance_th_client(
+                decrypt_api_key(user.binance_api_key), decrypt_api_key(user.binance_api_secret)
+            )
+        finally:
+            db.close()
+        self._step_size, self._tick_size = await asyncio.gather(
+            get_symbol_step_size(self.symbol), get_symbol_tick_size(self.symbol)
+        )
+
+    # ----- ticks & fills -----
+
+    async def on_tick(self, symbol: str, ticker: dict):
+        price = ticker.get('last')
+        if not price:
+            return
+        async with self._lock:
+            started = time.perf_counter()
+            self.last_price = price
+            self.tick_count += 1
+
+            if self.paper_trading:
+                through = PAPER_GRID_FILL_THROUGH_PERCENT / 100
+                filled = [self.orders[i] for i in self.index.filled_bids(price, through)]
+                filled += [self.orders[i] for i in self.index.filled_asks(price, through)]
+                await self._handle_fills(filled, "completed_paper")
+            elif (self.index.filled_bids(price) or self.index.filled_asks(price)) \
+                    and time.monotonic() - self._last_reconcile >= GRID_TICK_RECONCILE_SECONDS:
+                await self._reconcile()
+            self.last_tick_ms = (time.perf_counter() - started) * 1000.0
+
+    async def _handle_fills(self, filled: List[GridOrder], status: str):
+        if not filled:
+            return
+        for order in filled:
+            self._set(order.level, None)
+        self.fills += len(filled)
+        await self._record_fills(filled, status)
+
+        # Opposite side one level away; placed after all fills are cleared
+        replacements = [
+            (order.level + 1, "SELL") if order.side == "BUY" else (order.level - 1, "BUY")
+            for order in filled
+        ]
+        await self._place_many(replacements)
+
+    async def _record_fills(self, filled: List[GridOrder], status: str):
+        from app.db import write_queue
+        from app.models import Trade
+        from app.fill_simulator import limit_fill, paper_trade_row
+
+        now = datetime.utcnow()
+        trades = []
+        for order in filled:
+            if self.paper_trading:
+                fill = limit_fill(order.side, order.quantity, order.price)
+                trades.append(paper_trade_row(self.user_id, self.symbol, order.price, "grid", fill))
+                continue
+            trades.append(Trade(
+                user_id=self.user_id,
+                symbol=self.symbol,
+                side=order.side,
+                amount=order.quantity,
+                price=order.price,
+                filled_price=order.price,
+                status=status,
+                bot_type="grid",
+                timestamp=now,
+            ))
+        await write_queue.run(lambda session: session.add_all(trades))
+        print(f"🔲 Grid {self.symbol} user {self.user_id}: {len(filled)} level(s) filled "
+              f"({', '.join(f'{o.side}@{o.price:.2f}' for o in filled)})")
+
+    # ----- live reconciliation -----
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(GRID_RECONCILE_SECONDS)
+            try:
+                async with self._lock:
+                    await self._reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Grid reconcile failed for user {self.user_id}: {e}")
+
+    async def _reconcile(self):
+        """One openOrders call; orders no longer open are confirmed with get_order."""
+        from app.rate_limiter import request_limiter
+
+        binance_symbol = self.symbol.replace('/', '')
+        self._last_reconcile = time.monotonic()
+        await request_limiter.acquire()
+        open_orders = await asyncio.to_thread(self._client.get_open_orders, binance_symbol)
+        open_ids = {o.get('orderId') for o in open_orders}
+        missing = [o for o in self.orders if o and o.order_id and o.order_id not in open_ids]
+        if not missing:
+            return
+
+        async def fetch(order: GridOrder):
+            await request_limiter.acquire()
+            return order, await asyncio.to_thread(self._client.get_order, binance_symbol, order.order_id)
+
+        results = await asyncio.gather(*(fetch(o) for o in missing), return_exceptions=True)
+        filled, dead = [], []
+        for result in results:
+            if isinstance(result, Exception):
+                continue
+            order, info = result
+            status = info.get('status')
+            if status == 'FILLED':
+                executed = float(info.get('executedQty', 0) or 0)
+                if executed > 0:
+                    order.quantity = executed
+                filled.append(order)
+            elif status in ('CANCELED', 'EXPIRED', 'REJECTED'):
+                dead.append(order)
+
+        await self._handle_fills(filled, "completed")
+        # Replace orders cancelled outside the engine so the ladder stays complete
+        for order in dead:
+            self._set(order.level, None)
+        await self._place_many([(o.level, o.side) for o in dead])
+
+    def status(self) -> dict:
+        resting = [o for o in self.orders if o]
+        return {
+            "symbol": self.symbol,
+            "mode": "paper" if self.paper_trading else "live",
+            "levels": len(self.index),
+            "resting_buys": sum(1 for o in resting if o.side == "BUY"),
+            "resting_sells": sum(1 for o in resting if o.side == "SELL"),
+            "fills": self.fills,
+            "last_price": self.last_price,
+            "ticks": self.tick_count,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+        }
+
+
+class GridManager:
+    """All grids running in this process, keyed by user."""
+
+    def __init__(self):
+        self.grids: Dict[int, GridEngine] = {}
+
+    async def start(self, user_id: int, config, current_price: float) -> GridEngine:
+        await self.stop(user_id)
+        engine = GridEngine(
+            user_id=user_id,
+            symbol=config.symbol,
+            lower_price=config.grid_lower_price,
+            upper_price=config.grid_upper_price,
+            levels=config.grid_levels,
+            budget=config.budget,
+            paper_trading=config.paper_trading,
+        )
+        self.grids[user_id] = engine
+        try:
+            await engine.start(current_price)
+        except Exception:
+            self.grids.pop(user_id, None)
+            await engine.stop()
+            raise
+        return engine
+
+    async def stop(self, user_id: int) -> bool:
+        engine = self.grids.pop(user_id, None)
+        if engine is None:
+            return False
+        await engine.stop()
+        return True
+
+    async def stop_all(self):
+        for user_id in list(self.grids):
+            await self.stop(user_id)
+
+    def status(self, user_id: int) -> Optional[dict]:
+        engine = self.grids.get(user_id)
+        return engine.status() if engine else None
+
+
+grid_manager = GridManager()
@@ -0,0 +1,310 @@
+"""
+Log Retention & Archival
+The logs table gets a heartbeat per user per iteration plus multi-KB AI
+details, so old rows are moved out on a schedule:
+
+- per-category TTLs (DEFAULT_RETENTION_DAYS, overridable with
+  LOG_RETENTION_DAYS="bot=3,trading=0"; 0 = keep forever)
+- expired rows are appended to gzip JSONL files partitioned by day
+  (LOG_ARCHIVE_DIR/YYYY-MM/logs-YYYY-MM-DD.jsonl.gz, one line per log in the
+  /api/logs shape), then deleted, LOG_RETENTION_BATCH rows per transaction
+- archiving is at-least-once: a crash between the file append and the
+  delete archives those rows again on the next run
+- on Postgres the logs table is range-partitioned by month (migration 3);
+  each run creates the next months' partitions and drops past ones that
+  retention has emptied
+- read_archived_logs() reads the archive back for a time range
+
+Runs every LOG_RETENTION_INTERVAL_HOURS in the API process (0 = off).
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from app.logging_models import Log, LogCategory
+
+
+DEFAULT_RETENTION_DAYS = {
+    LogCategory.BOT: 7,            # mostly heartbeats
+    LogCategory.MARKET: 7,
+    LogCategory.AI_THINKING: 30,
+    LogCategory.SYSTEM: 30,
+    LogCategory.AI_ACTION: 90,
+    LogCategory.ERROR: 90,
+    LogCategory.USER: 90,
+    LogCategory.CONFIG: 90,
+    LogCategory.TRADING: 365,
+}
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./log_archive")
+LOG_RETENTION_BATCH = int(os.getenv("LOG_RETENTION_BATCH", "5000"))
+LOG_RETENTION_INTERVAL_HOURS = float(os.getenv("LOG_RETENTION_INTERVAL_HOURS", "6"))
+LOG_PARTITION_MONTHS_AHEAD = 2
+
+# Advisory lock id so only one process runs retention at a time on Postgres
+_PG_LOCK_ID = 704212
+
+
+def retention_policy() -> Dict[LogCategory, int]:
+    """Days to keep per category: defaults plus LOG_RETENTION_DAYS overrides."""
+    policy = dict(DEFAULT_RETENTION_DAYS)
+    for item in os.getenv("LOG_RETENTION_DAYS", "").split(","):
+        if "=" not in item:
+            continue
+        name, days = item.split("=", 1)
+        try:
+            policy[LogCategory(name.strip().lower())] = int(days)
+        except ValueError:
+            print(f"⚠️ Ignoring LOG_RETENTION_DAYS entry '{item}'")
+    return policy
+
+
+def archive_path(day: date, archive_dir: str = None) -> str:
+    return os.path.join(archive_dir or LOG_ARCHIVE_DIR, day.strftime("%Y-%m"), f"logs-{day.isoformat()}.jsonl.gz")
+
+
+def _append_archive(logs: List[Log], archive_dir: str = None):
+    """Append logs to their day files (each append is a new gzip member; readers see one stream)."""
+    by_day: Dict[date, List[str]] = {}
+    for log in logs:
+        day = (log.timestamp or datetime.utcnow()).date()
+        by_day.setdefault(day, []).append(json.dumps(log.to_dict(), separators=(",", ":"), default=str))
+    for day, lines in by_day.items():
+        path = archive_path(day, archive_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def archive_expired(db: Session, category: LogCategory, cutoff: datetime, archive_dir: str = None,
+                    batch_size: int = LOG_RETENTION_BATCH) -> int:
+    """Archive and delete logs of `category` older than `cutoff`, one bounded batch per transaction."""
+    moved = 0
+    while True:
+        batch = db.execute(
+            select(Log).where(Log.category == category, Log.timestamp < cutoff).order_by(Log.id).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            return moved
+        _append_archive(batch, archive_dir)
+        db.execute(delete(Log).where(Log.id.in_([log.id for log in batch])))
+        db.commit()
+        db.expunge_all()
+        moved += len(batch)
+
+
+# ----- Postgres monthly partitions -----
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_name(month: date) -> str:
+    return f"logs_y{month.year}m{month.month:02d}"
+
+
+def ensure_log_partitions(conn, start: date = None, months_ahead: int = LOG_PARTITION_MONTHS_AHEAD) -> int:
+    """Create monthly partitions of logs from `start` through `months_ahead` months from now."""
+    month = _month_start(start or datetime.utcnow().date())
+    last = _month_start(datetime.utcnow().date())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    created = 0
+    while month <= last:
+        name = _partition_name(month)
+        exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if not exists:
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF logs "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            ))
+            created += 1
+        month = _next_month(month)
+    return created
+
+
+def drop_empty_partitions(conn) -> List[str]:
+    """Drop monthly partitions that ended before the current month and hold no rows."""
+    current = _month_start(datetime.utcnow().date())
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'logs' AND c.relname LIKE 'logs_y%'"
+    )).scalars().all()
+    dropped = []
+    for name in sorted(rows):
+        month = date(int(name[6:10]), int(name[11:13]), 1)
+        if _next_month(month) > current:
+            continue
+        if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+            continue
+        conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+def is_partitioned(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'logs'"
+    )).first())
+
+
+# The logs indexes as of schema version 3 (ix_logs_id is covered by the primary key).
+# Not read from the model: later migrations add indexes on columns the table only
+# gets after this one has run (e.g. decision_id in version 5).
+_V3_LOG_INDEXES = (
+    ("ix_logs_timestamp", ("timestamp",)),
+    ("ix_logs_category", ("category",)),
+    ("ix_logs_level", ("level",)),
+    ("ix_logs_user_id", ("user_id",)),
+    ("ix_logs_user_category_ts", ("user_id", "category", "timestamp")),
+    ("ix_logs_user_ts", ("user_id", "timestamp")),
+)
+
+
+def partition_logs_table(conn):
+    """Rebuild logs as a table range-partitioned by month on timestamp (Postgres, runs once as migration 3)."""
+    if is_partitioned(conn):
+        return
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('logs', 'id')")).scalar()
+    conn.execute(text("ALTER TABLE logs RENAME TO logs_unpartitioned"))
+    # Index and constraint names are schema-wide: free them for the new table
+    conn.execute(text("ALTER TABLE logs_unpartitioned DROP CONSTRAINT IF EXISTS logs_pkey"))
+    for (name,) in conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'logs_unpartitioned'")).all():
+        conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+    conn.execute(text("UPDATE logs_unpartitioned SET timestamp = NOW() AT TIME ZONE 'utc' WHERE timestamp IS NULL"))
+    conn.execute(text(
+        "CREATE TABLE logs (LIKE logs_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+    ))
+    # The partition key has to be part of the primary key
+    conn.execute(text("ALTER TABLE logs ADD PRIMARY KEY (id, timestamp)"))
+    for name, columns in _V3_LOG_INDEXES:
+        conn.execute(text(f"CREATE INDEX {name} ON logs ({', '.join(columns)})"))
+    oldest = conn.execute(text("SELECT MIN(timestamp) FROM logs_unpartitioned")).scalar()
+    ensure_log_partitions(conn, start=oldest.date() if oldest else None)
+    conn.execute(text("CREATE TABLE logs_default PARTITION OF logs DEFAULT"))
+    conn.execute(text("INSERT INTO logs SELECT * FROM logs_unpartitioned"))
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY logs.id"))
+    conn.execute(text("DROP TABLE logs_unpartitioned"))
+
+
+# ----- runs -----
+
+last_run: dict = {}
+
+
+def run_retention(db: Session, now: datetime = None, archive_dir: str = None) -> dict:
+    """Archive + delete expired logs for every category; on Postgres also maintain partitions."""
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    moved = {}
+    for category, days in retention_policy().items():
+        if days > 0:
+            count = archive_expired(db, category, now - timedelta(days=days), archive_dir)
+            if count:
+                moved[category.value] = count
+    result = {"archived": moved, "archived_total": sum(moved.values())}
+    if db.get_bind().dialect.name == "postgresql" and is_partitioned(db.connection()):
+        conn = db.connection()
+        result["partitions_created"] = ensure_log_partitions(conn)
+        result["partitions_dropped"] = drop_empty_partitions(conn)
+        db.commit()
+    result["seconds"] = round(time.monotonic() - started, 3)
+    result["finished_at"] = datetime.utcnow().isoformat()
+    return result
+
+
+def read_archived_logs(start: datetime, end: datetime, user_id: Optional[int] = None,
+                       category: Optional[str] = None, limit: int = 1000,
+                       archive_dir: str = None) -> Iterator[dict]:
+    """Archived logs with start <= timestamp < end, oldest first, filtered like /api/logs."""
+    day = start.date()
+    returned = 0
+    while day <= end.date() and returned < limit:
+        path = archive_path(day, archive_dir)
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    ts = datetime.fromisoformat(entry["timestamp"].rstrip("Z")) if entry.get("timestamp") else None
+                    if ts is None or ts < start or ts >= end:
+                        continue
+                    if user_id is not None and entry.get("user_id") != user_id:
+                        continue
+                    if category and entry.get("category") != category:
+                        continue
+                    yield entry
+                    returned += 1
+                    if returned >= limit:
+                        return
+        day += timedelta(days=1)
+
+
+class RetentionScheduler:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, interval_hours: float = LOG_RETENTION_INTERVAL_HOURS):
+        if interval_hours > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(interval_hours * 3600))
+            print(f"🗄️ Log retention scheduled every {interval_hours:g}h (archive: {LOG_ARCHIVE_DIR})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.run_once()
+
+    async def run_once(self) -> dict:
+        def work():
+            from app.db import engine
+            # One connection throughout: the Postgres advisory lock belongs to it
+            with engine.connect() as conn:
+                postgres = engine.dialect.name == "postgresql"
+                if postgres:
+                    locked = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _PG_LOCK_ID}).scalar()
+                    conn.commit()
+                    if not locked:
+                        return {"skipped": "retention already running in another process"}
+                db = Session(bind=conn)
+                try:
+                    return run_retention(db)
+                finally:
+                    db.close()
+                    if postgres:
+                        conn.rollback()
+                        conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _PG_LOCK_ID})
+                        conn.commit()
+        try:
+            result = await asyncio.to_thread(work)
+        except Exception as e:
+            result = {"error": str(e)}
+            print(f"⚠️ Log retention failed: {e}")
+        last_run.clear()
+        last_run.update(result)
+        if result.get("archived_total"):
+            print(f"🗄️ Archived {result['archived_total']} log(s): {result['archived']}")
+        return result
+
+
+retention_scheduler = RetentionScheduler()
@@ -0,0 +1,181 @@
+"""
+Buffered Log Writer
+Bot loops write several logs per user per iteration (heartbeat, AI thinking,
+AI action). Instead of a commit per entry, logs are queued in memory and
+written with one multi-row INSERT per batch:
+
+- a batch is flushed when LOG_BATCH_SIZE entries are waiting or every
+  LOG_FLUSH_INTERVAL_SECONDS, whichever comes first
+- log_and_broadcast pushes the entry to the user's WebSocket straight from
+  the queue, without waiting for the insert (queued entries have no id yet;
+  pass wait=True when the id matters, e.g. kill-switch events)
+- stop() flushes whatever is still queued, so a clean shutdown loses nothing
+- a failed insert is retried with the next batch; beyond LOG_QUEUE_MAX the
+  oldest entries are dropped (counted in status())
+
+Before start() (scripts, tests) entries are written immediately, one INSERT each.
+"""
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from app.logging_models import Log, LogLevel
+
+
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "1"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+
+_COLUMNS = [c.name for c in Log.__table__.columns if c.name != "id"]
+
+
+def _row(log: Log) -> dict:
+    return {name: getattr(log, name) for name in _COLUMNS}
+
+
+def _insert_statement():
+    # RETURNING in parameter order maps generated ids back onto the batch
+    return insert(Log.__table__).returning(Log.__table__.c.id, sort_by_parameter_order=True)
+
+
+class LogWriter:
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, interval: float = LOG_FLUSH_INTERVAL_SECONDS,
+                 max_queue: int = LOG_QUEUE_MAX):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self.pending: List[Log] = []
+        self.lock = threading.Lock()          # submit() may be called from worker threads
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._stopping
+
+    def submit(self, log: Log):
+        """Queue a log entry (timestamp fixed now, not at flush time)."""
+        if log.timestamp is None:
+            log.timestamp = datetime.utcnow()
+        if log.level is None:
+            log.level = LogLevel.INFO
+        if not self.running:
+            self._write_now([log])
+            return
+        with self.lock:
+            self.pending.append(log)
+            if len(self.pending) > self.max_queue:
+                del self.pending[0]
+                self.dropped += 1
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def flush(self) -> int:
+        """Write everything queued so far; returns the number of rows written."""
+        if self._flush_lock is None:
+            return 0
+        async with self._flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            try:
+                from app.db import write_queue
+                rows = [_row(log) for log in batch]
+                if write_queue.serialized:
+                    # SQLite: queue behind the other bot writes instead of racing them for the lock
+                    ids = await write_queue.run(
+                        lambda session: session.connection().execute(_insert_statement(), rows).scalars().all()
+                    )
+                else:
+                    from app.db_async import async_engine
+                    async with async_engine.begin() as conn:
+                        ids = (await conn.execute(_insert_statement(), rows)).scalars().all()
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Log batch insert failed ({len(batch)} entries, will retry): {e}")
+                with self.lock:
+                    self.pending[:0] = batch
+                    overflow = len(self.pending) - self.max_queue
+                    if overflow > 0:
+                        del self.pending[:overflow]
+                        self.dropped += overflow
+                return 0
+            for log, log_id in zip(batch, ids):
+                log.id = log_id
+            self.written += len(batch)
+            self.batches += 1
+            return len(batch)
+
+    def _write_now(self, logs: List[Log]):
+        from app.db import engine
+        try:
+            with engine.begin() as conn:
+                ids = conn.execute(_insert_statement(), [_row(log) for log in logs]).scalars().all()
+            for log, log_id in zip(logs, ids):
+                log.id = log_id
+            self.written += len(logs)
+        except Exception as e:
+            self.failures += 1
+            print(f"⚠️ Log insert failed: {e}")
+
+    # ----- lifecycle -----
+
+    def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        print(f"📝 Log writer started (batch {self.batch_size}, every {self.interval:g}s)")
+
+    async def stop(self):
+        """Stop the flusher and write everything still queued."""
+        if not self.running:
+            return
+        # Not cancelled: a batch being inserted right now must finish. New entries
+        # are written directly from here on (running is False).
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        await self.flush()
+        self._task = None
+        print(f"📝 Log writer stopped ({self.written} entries in {self.batches} batches)")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": len(self.pending),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.interval,
+        }
+
+
+log_writer = LogWriter()
@@ -46,8 +46,9 @@ class Logger:
                 execution_reason=execution_reason
             )
             
-            self.db.add(log_entry)
-            self.db.commit()
+            # Batched insert (app/log_writer.py): no commit of the caller's session per entry
+            from app.log_writer import log_writer
+            log_writer.submit(log_entry)
             
             # Also print to console for development
             print(f"[{category.value.upper()}] {message}")
@@ -55,7 +56,6 @@ class Logger:
             return log_entry
         except Exception as e:
             print(f"Failed to create log entry: {str(e)}")
-            self.db.rollback()
     
     # Convenience methods for common log types
     
@@ -2,7 +2,7 @@
 Comprehensive Logging System for Gods Ping
 Categorized logging with database persistence
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, Enum as SQLEnum
 from datetime import datetime
 from app.db import Base
 import enum
@@ -51,8 +51,15 @@ class Log(Base):
     # AI specific fields
     ai_recommendation = Column(String, nullable=True)  # BUY, SELL, HOLD
     ai_confidence = Column(String, nullable=True)
-    ai_executed = Column(String, nullable=True)  # "yes", "no", "skipped"
+    ai_executed = Column(String, nullable=True)  # "yes", "no", "skipped", "submitted" (live order pending)
     execution_reason = Column(Text, nullable=True)  # Why action was/wasn't taken
+    decision_id = Column(String, nullable=True, index=True)  # pairs a decision's AI_THINKING and AI_ACTION logs
+
+    # Hot query shapes (existing DBs get these from app/migration.py)
+    __table_args__ = (
+        Index('ix_logs_user_category_ts_id', 'user_id', 'category', 'timestamp', 'id'),
+        Index('ix_logs_user_ts_id', 'user_id', 'timestamp', 'id'),
+    )
     
     def to_dict(self):
         # Ensure timestamp is explicitly UTC for proper client-side conversion
@@ -74,5 +81,6 @@ class Log(Base):
             'ai_recommendation': self.ai_recommendation,
             'ai_confidence': self.ai_confidence,
             'ai_executed': self.ai_executed,
-            'execution_reason': self.execution_reason
+            'execution_reason': self.execution_reason,
+            'decision_id': self.decision_id
         }
@@ -4,19 +4,23 @@ Main API endpoints for Shichi-Fukujin single-page trading platform
 """
 import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel
 import time
 
 from app.db import engine, get_db, Base, SessionLocal
+from app.db_async import get_request_db
 from app.models import User, Trade, BotConfig, ForecastSnapshot
 from app.logging_models import Log, LogCategory, LogLevel
+from app.decisions import attach_summaries
 # Ensure all ORM models are imported before creating tables
 from app.paper_trading_tracker import PaperTradingSnapshot
 from app.auth import (
@@ -49,6 +53,64 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
         
+    # Materialize positions for trade history recorded before the ledger existed
+    from app.position_ledger import position_ledger
+    db = SessionLocal()
+    try:
+        created = position_ledger.backfill(db)
+        if created:
+            print(f"📒 Materialized {created} position(s) from trade history")
+    finally:
+        db.close()
+
+    # Hourly/daily rollups for paper snapshots recorded before rollups existed
+    from app.paper_trading_tracker import backfill_snapshot_rollups
+    db = SessionLocal()
+    try:
+        rolled = backfill_snapshot_rollups(db)
+        if rolled:
+            print(f"📈 Rolled up paper trading snapshots for {rolled} symbol(s)")
+    finally:
+        db.close()
+
+    # Start sharded bot-runner pool (BOT_POOL_WORKERS > 0)
+    from app.bot_pool import BOT_POOL_WORKERS, BotPoolSupervisor
+    bot_pool = None
+    if BOT_POOL_WORKERS > 0:
+        bot_pool = BotPoolSupervisor(BOT_POOL_WORKERS)
+        bot_pool.start()
+
+    # Recurring DCA jobs (single timer over all schedules)
+    from app.dca_scheduler import dca_scheduler
+    dca_scheduler.start()
+
+    # Live orders that were in flight at shutdown: confirm or resubmit (same client order id)
+    from app.order_pipeline import order_pipeline
+    order_pipeline.recover()
+
+    # Batched log inserts (flushed on shutdown below)
+    from app.log_writer import log_writer
+    log_writer.start()
+
+    # Archive + delete expired logs (LOG_RETENTION_INTERVAL_HOURS > 0)
+    from app.log_retention import retention_scheduler
+    retention_scheduler.start()
+
+    # Score forecast snapshots once their horizon has passed (FORECAST_EVAL_INTERVAL_MINUTES > 0)
+    from app.forecast_store import accuracy_scheduler
+    accuracy_scheduler.start()
+
+    # Keep balances of open dashboards warm (BALANCE_REFRESH_SECONDS > 0)
+    from app.balance_cache import balance_cache
+    balance_cache.start()
+
+    # Warm restart: resume Gods Hand loops that were running before shutdown
+    # (pool workers resume from config/leases on their own)
+    if not bot_pool:
+        import asyncio
+        from app.bot_state import resume_running_bots
+        asyncio.create_task(resume_running_bots())
+
     # Debug: Print all routes
     print("--- Registered Routes ---")
     for route in app.routes:
@@ -59,6 +121,22 @@ async def lifespan(app: FastAPI):
     yield
     # --- Shutdown ---
     print("🛑 Shutting down...")
+    if bot_pool:
+        bot_pool.stop()
+    # Grids hold resting orders that nothing would track after exit: cancel them
+    from app.grid_engine import grid_manager
+    from app.price_feed import price_feed
+    from app.risk_engine import risk_engine
+    await grid_manager.stop_all()
+    risk_engine.stop()
+    await dca_scheduler.stop()
+    await balance_cache.stop()
+    await order_pipeline.stop()
+    await price_feed.stop()
+    await retention_scheduler.stop()
+    await accuracy_scheduler.stop()
+    # Last: everything above may still log
+    await log_writer.stop()
 
 app = FastAPI(
     title="Gods Ping API",
@@ -78,8 +156,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+def _naive_utc(value: datetime) -> datetime:
+    """Query-string datetimes may carry an offset; stored timestamps are naive UTC."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
 # Debug endpoint to verify active CORS configuration (remove in production later)
 @app.get("/api/debug/cors")
 def debug_cors():
@@ -134,6 +218,10 @@ class UpdateBotConfigRequest(BaseModel):
     tennis_mode_enabled: Optional[bool] = None
     kill_switch_cooldown_minutes: Optional[int] = None
     kill_switch_consecutive_breaches: Optional[int] = None
+    schedule_mode: Optional[str] = None
+    skip_unchanged_evaluations: Optional[bool] = None
+    portfolio_enabled: Optional[bool] = None
+    portfolio_symbols: Optional[Dict[str, float]] = None  # {symbol: budget weight}
     notification_email: Optional[str] = None
     notify_on_action: Optional[bool] = None
     notify_on_position_size: Optional[bool] = None
@@ -152,6 +240,8 @@ class TradeRequest(BaseModel):
     side: str  # BUY or SELL
     amount: float
     price: Optional[float] = None
+    # Idempotency key for live orders: resending the same request_id never places a second order
+    request_id: Optional[str] = None
 
 
 class UserResponse(BaseModel):
@@ -291,8 +381,33 @@ async def delete_user(
         raise HTTPException(status_code=400, detail="Cannot delete admin user")
 
     # Delete related entities first due to FK constraints (no cascade configured)
+    # Delete order records (they reference trades)
+    from app.models import OrderRecord
+    db.query(OrderRecord).filter(OrderRecord.user_id == user.id).delete()
     # Delete trades
     trades_deleted = db.query(Trade).filter(Trade.user_id == user.id).delete()
+    # Delete materialized positions
+    from app.position_ledger import position_ledger
+    position_ledger.forget(db, user.id)
+    from app import trade_rollups
+    trade_rollups.forget(db, user.id)
+    # Delete the bot-pool assignment
+    from app.models import BotAssignment
+    db.query(BotAssignment).filter(BotAssignment.user_id == user.id).delete()
+    # Delete the DCA schedule (and drop it from the in-memory timer)
+    from app.models import DcaSchedule
+    from app.dca_scheduler import dca_scheduler
+    db.query(DcaSchedule).filter(DcaSchedule.user_id == user.id).delete()
+    dca_scheduler.unschedule(user.id)
+    # Delete the loop checkpoint so it isn't resumed on restart
+    from app.models import BotRuntimeState
+    db.query(BotRuntimeState).filter(BotRuntimeState.user_id == user.id).delete()
+    # Delete paper trading rollups
+    from app.paper_trading_tracker import PaperTradingRollup
+    db.query(PaperTradingRollup).filter(PaperTradingRollup.user_id == user.id).delete()
+    # Delete recorded decisions
+    from app.models import Decision
+    db.query(Decision).filter(Decision.user_id == user.id).delete()
     # Delete bot config
     bot_config_deleted = db.query(BotConfig).filter(BotConfig.user_id == user.id).delete()
 
@@ -382,18 +497,18 @@ async def validate_api_keys(
 @app.get("/api/settings/bot-config")
 async def get_bot_config(
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_request_db)
 ):
     """Get user's bot configuration"""
     try:
-        config = db.query(BotConfig).filter(BotConfig.user_id == current_user["id"]).first()
+        config = (await db.execute(select(BotConfig).where(BotConfig.user_id == current_user["id"]))).scalars().first()
         
         if not config:
             # Create default config
             config = BotConfig(user_id=current_user["id"])
             db.add(config)
-            db.commit()
-            db.refresh(config)
+            await db.commit()
+            await db.refresh(config)
         
         return config.to_dict()
     except Exception as e:
@@ -418,6 +533,15 @@ async def update_bot_config(
     
     # Update fields
     update_data = request.dict(exclude_unset=True)
+
+    from app.scheduling import SCHEDULE_MODES
+    if 'schedule_mode' in update_data and update_data['schedule_mode'] not in SCHEDULE_MODES:
+        raise HTTPException(status_code=400, detail=f"schedule_mode must be one of {', '.join(SCHEDULE_MODES)}")
+    if update_data.get('portfolio_symbols') is not None:
+        if any(weight < 0 for weight in update_data['portfolio_symbols'].values()):
+            raise HTTPException(status_code=400, detail="portfolio_symbols weights must be >= 0")
+        import json
+        update_data['portfolio_symbols'] = json.dumps(update_data['portfolio_symbols'])
     
     # 🔍 DEBUG: Log Tennis/Gods Mode updates
     if 'tennis_mode_enabled' in update_data or 'gods_mode_enabled' in update_data:
@@ -568,18 +692,11 @@ async def get_price_forecast(
         # Persist snapshot for historical comparison
         try:
             from app.models import ForecastSnapshot
-            import json
+            from app.forecast_store import new_snapshot
             from datetime import timedelta
-            snapshot = ForecastSnapshot(
-                symbol=symbol,
-                horizon_hours=forecast_hours,
+            snapshot = new_snapshot(
+                symbol, forecast_hours, forecast,
                 current_price=forecast.get('current_price', candles[-1]['close'] if candles else 0.0),
-                summary=forecast.get('summary'),
-                data_json=json.dumps({
-                    'forecasts': forecast.get('forecasts') or forecast.get('forecast') or forecast.get('predictions') or [],
-                    'risk_metrics': forecast.get('risk_metrics'),
-                    'price_targets': forecast.get('price_targets'),
-                })
             )
             db.add(snapshot)
             db.commit()
@@ -620,86 +737,19 @@ async def get_forecast_history(
     symbol: str,
     limit: int = 5,
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_request_db)
 ):
-    """Return recent persisted forecast snapshots for a symbol (limited)."""
+    """Return recent persisted forecast snapshots for a symbol (limited).
+    Accuracy metrics (MAE/MAPE) are stored by the evaluation job in app/forecast_store.py."""
     from app.models import ForecastSnapshot
-    import json
-    from app.market import get_candlestick_data
-    import math
     try:
-        q = db.query(ForecastSnapshot).filter(ForecastSnapshot.symbol == symbol).order_by(ForecastSnapshot.generated_at.desc()).limit(limit)
-        rows = q.all()
-        history = []
-        for r in rows:
-            data = {}
-            try:
-                data = json.loads(r.data_json)
-            except Exception:
-                pass
-            item = {
-                'id': r.id,
-                'symbol': r.symbol,
-                'generated_at': r.generated_at.isoformat() if r.generated_at else None,
-                'horizon_hours': r.horizon_hours,
-                'current_price': r.current_price,
-                'summary': r.summary,
-                'forecasts': data.get('forecasts', []),
-                'price_targets': data.get('price_targets'),
-                'risk_metrics': data.get('risk_metrics'),
-            }
-
-            # Compute evaluation metrics (MAE/MAPE) if horizon elapsed and data available
-            try:
-                forecasts = item['forecasts']
-                if forecasts and r.generated_at and r.horizon_hours:
-                    end_time = r.generated_at.timestamp() + r.horizon_hours * 3600
-                    now_ts = datetime.utcnow().timestamp()
-                    # Only evaluate if horizon fully elapsed and snapshot not too old (> 200h ago)
-                    if now_ts >= end_time:
-                        # Fetch last 200 hourly candles
-                        candles = await get_candlestick_data(symbol, timeframe='1h', limit=200)
-                        # Build map by hour timestamp (sec)
-                        candle_map = { int(c['timestamp'] / 1000): c for c in candles }
-                        abs_errors = []
-                        pct_errors = []
-                        for f in forecasts:
-                            hour = f.get('hour')
-                            pred = f.get('predicted_price') or f.get('value') or f.get('price')
-                            if hour is None or pred is None:
-                                continue
-                            ts = int(r.generated_at.timestamp()) + int(hour) * 3600
-                            # Find nearest candle within ±30min
-                            candidates = [ts, ts-3600, ts+3600]
-                            actual = None
-                            for cand_ts in candidates:
-                                c = candle_map.get(cand_ts)
-                                if c:
-                                    actual = c.get('close')
-                                    break
-                            if actual and actual > 0:
-                                abs_errors.append(abs(pred - actual))
-                                pct_errors.append(abs(pred - actual) / actual)
-                        if abs_errors:
-                            mae = sum(abs_errors) / len(abs_errors)
-                            mape = sum(pct_errors) / len(pct_errors)
-                            item['metrics'] = {
-                                'mae': mae,
-                                'mape': mape,
-                                'n': len(abs_errors),
-                                'evaluated': True,
-                            }
-                        else:
-                            item['metrics'] = { 'evaluated': False }
-                    else:
-                        item['metrics'] = { 'evaluated': False }
-                else:
-                    item['metrics'] = { 'evaluated': False }
-            except Exception as eval_err:
-                print(f"[WARN] Forecast evaluation failed: {eval_err}")
-                item['metrics'] = { 'evaluated': False }
-
-            history.append(item)
+        rows = (await db.execute(
+            select(ForecastSnapshot)
+            .where(ForecastSnapshot.symbol == symbol)
+            .order_by(ForecastSnapshot.generated_at.desc())
+            .limit(limit)
+        )).scalars().all()
+        history = [r.to_dict() for r in rows]
         return {'symbol': symbol, 'count': len(history), 'history': history}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -711,7 +761,7 @@ async def get_forecast_history_pair(
     quote: str,
     limit: int = 5,
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_request_db)
 ):
     """Pair form (BTC/USDT) convenience wrapper for history endpoint; avoids needing URL encoding of '/'."""
     symbol = f"{base}/{quote}"
@@ -725,11 +775,11 @@ async def get_balance(
     current_user: dict = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get account balance and P/L"""
-    from app.market import get_account_balance
+    """Get account balance and P/L (cached per user; see app/balance_cache.py)"""
+    from app.balance_cache import balance_cache
     
     try:
-        balance = await get_account_balance(db, current_user['id'], fiat_currency)
+        balance = await balance_cache.get(current_user['id'], fiat_currency)
         return balance
     except Exception as e:
         print(f"❌ Error in get_balance: {str(e)}")
@@ -994,59 +1044,76 @@ async def execute_trade(
 ):
     """Execute a trade (manual or bot)"""
     config = db.query(BotConfig).filter(BotConfig.user_id == current_user["id"]).first()
-    
-    # Create trade record
-    trade = Trade(
-        user_id=current_user["id"],
-        symbol=request.symbol,
-        side=request.side,
-        amount=request.amount,
-        price=request.price,
-        bot_type="manual",
-        status="pending",
-        timestamp=datetime.utcnow()
-    )
-    db.add(trade)
-    db.commit()
-    db.refresh(trade)
-    
+
     if config and config.paper_trading:
-        # Paper trading
-        trade.status = "completed_paper"
-        trade.filled_price = request.price
-        db.commit()
-        return {"message": "Paper trade executed", "trade_id": trade.id, "status": "paper"}
-    else:
-        # Real trading (implement with ccxt)
-        from app.market import execute_market_trade
-        try:
-            result = await execute_market_trade(
-                current_user["id"], 
-                request.symbol, 
-                request.side, 
-                request.amount,
-                db
-            )
-            trade.status = "completed"
-            trade.filled_price = result.get("price")
-            db.commit()
-            return {"message": "Trade executed", "trade_id": trade.id, "result": result}
-        except Exception as e:
-            trade.status = "failed"
-            db.commit()
-            raise HTTPException(status_code=500, detail=str(e))
+        # Paper trading: fill against the order book (slippage, partial fills)
+        from app.fill_simulator import record_paper_trade
+        from app.market import get_current_price
+        reference_price = request.price
+        if not reference_price:
+            ticker = await get_current_price(request.symbol)
+            reference_price = ticker['last']
+        trade, fill = await record_paper_trade(
+            db, current_user["id"], request.symbol, request.side, reference_price, "manual",
+            quantity=request.amount
+        )
+        if trade is None:
+            raise HTTPException(status_code=400, detail="Paper order could not be filled (no order book depth)")
+        return {"message": "Paper trade executed", "trade_id": trade.id, "status": "paper", "fill": fill.to_dict()}
+    
+    # Live: through the order pipeline (client order id, retries, recovery); it records the trade on fill
+    import uuid
+    from app.order_pipeline import order_pipeline
+    intent_key = f"manual:{request.request_id or uuid.uuid4().hex}"
+    try:
+        order = await order_pipeline.submit(
+            current_user["id"], request.symbol, request.side, request.amount, "manual", intent_key, wait=True
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if order["status"] in ("failed", "canceled"):
+        raise HTTPException(status_code=500, detail=f"Trade execution failed: {order.get('error') or order['status']}")
+    message = "Trade executed" if order["status"] == "filled" else "Trade submitted"
+    return {"message": message, "trade_id": order.get("trade_id"), "result": order}
 
 
 @app.get("/api/trade/history")
 async def get_trade_history(
+    response: Response,
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
-    limit: int = 50
+    db: AsyncSession = Depends(get_request_db),
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    symbol: Optional[str] = None,
+    bot_type: Optional[str] = None,
+    trade_status: Optional[str] = Query(None, alias="status"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
 ):
-    """Get user's trade history"""
-    trades = db.query(Trade).filter(
-        Trade.user_id == current_user["id"]
-    ).order_by(Trade.timestamp.desc()).limit(limit).all()
+    """Get user's trade history, newest first.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page (absent on the last page).
+    """
+    from app.pagination import page_statement, split_page
+
+    limit = max(1, min(limit, 1000))
+    filters = [Trade.user_id == current_user["id"]]
+    if symbol:
+        filters.append(Trade.symbol == symbol)
+    if bot_type:
+        filters.append(Trade.bot_type == bot_type)
+    if trade_status:
+        filters.append(Trade.status == trade_status)
+    if since:
+        filters.append(Trade.timestamp >= _naive_utc(since))
+    if until:
+        filters.append(Trade.timestamp < _naive_utc(until))
+    try:
+        stmt = page_statement(Trade, Trade.timestamp, Trade.id, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    trades, next_cursor = split_page((await db.execute(stmt)).scalars().all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [
         {
@@ -1194,6 +1261,81 @@ async def get_bot_status(
         raise HTTPException(status_code=500, detail=f"Failed to get bot status: {str(e)}")
 
 
+@app.get("/api/bot/pool/status")
+async def get_bot_pool_status(
+    current_user: dict = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Admin-only: bot-runner pool workers, their load/tick-latency stats and shard assignments."""
+    from app.bot_pool import get_pool_status
+
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Only admin can view the bot pool")
+    return get_pool_status(db)
+
+
+@app.get("/api/bot/gods-hand/schedule")
+async def get_gods_hand_schedule(
+    current_user: dict = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Scheduling mode, next-wake reasoning and executed vs skipped AI evaluations."""
+    from app.scheduling import evaluation_schedulers
+
+    config = db.query(BotConfig).filter(BotConfig.user_id == current_user["id"]).first()
+    scheduler = evaluation_schedulers.get(current_user["id"])
+    return {
+        "schedule_mode": (config.schedule_mode if config else None) or "fixed",
+        "skip_unchanged_evaluations": bool(config.skip_unchanged_evaluations) if config else False,
+        "stats": scheduler.to_dict() if scheduler else None,
+    }
+
+
+@app.get("/api/bot/orders")
+async def get_live_orders(
+    limit: int = 50,
+    current_user: dict = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Recent live orders from the order pipeline with submit -> ack -> fill latency."""
+    from app.models import OrderRecord
+    from app.order_pipeline import order_pipeline
+
+    orders = (
+        db.query(OrderRecord)
+        .filter(OrderRecord.user_id == current_user["id"])
+        .order_by(OrderRecord.id.desc())
+        .limit(min(limit, 500))
+        .all()
+    )
+    return {
+        "orders": [o.to_dict() for o in orders],
+        "pipeline": order_pipeline.status(current_user["id"]),
+    }
+
+
+@app.get("/api/bot/positions/verify")
+async def verify_position_ledger(
+    symbol: Optional[str] = None,
+    rebuild: bool = False,
+    current_user: dict = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_request_db)
+):
+    """Compare the materialized position with a full trade-history replay; optionally rebuild it."""
+    from app.position_ledger import position_ledger
+
+    if not symbol:
+        symbol = (await db.execute(
+            select(BotConfig.symbol).where(BotConfig.user_id == current_user["id"])
+        )).scalar() or "BTC/USDT"
+    result = await db.run_sync(position_ledger.verify, current_user["id"], symbol)
+    if rebuild and not result["match"]:
+        await db.run_sync(position_ledger.rebuild, current_user["id"], symbol)
+        await db.commit()
+        result["rebuilt"] = True
+    return result
+
+
 @app.post("/api/bot/gods-hand/reset-kill-switch")
 async def reset_kill_switch_baseline(
     restart: bool = True,
@@ -1410,10 +1552,16 @@ async def gods_hand_preview(
 @app.get("/api/bot/gods-hand/performance")
 async def gods_hand_performance(
     days: int = 7,
+    risk: bool = False,
     current_user: dict = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Compute performance metrics for Gods Hand trades over the last N days."""
+    """Compute performance metrics for Gods Hand trades over the last N days.
+    The window is day-aligned (daily rollups): it starts at 00:00 UTC N days ago, so
+    it covers the last N full days plus today so far (between N and N+1 days; days=1
+    is yesterday and today). The start is returned as 'since'.
+    risk=true adds mark-to-market risk metrics per symbol (mode follows the bot config).
+    """
     from datetime import datetime, timedelta
 
     if days < 1:
@@ -1421,82 +1569,30 @@ async def gods_hand_performance(
     if days > 365:
         days = 365
 
-    since = datetime.utcnow() - timedelta(days=days)
-
-    trades = (
-        db.query(Trade)
-        .filter(Trade.user_id == current_user["id"]) 
-        .filter(Trade.bot_type == 'gods_hand')
-        .filter(Trade.timestamp >= since)
-        .order_by(Trade.timestamp.asc())
-        .all()
-    )
-
-    # Aggregate by symbol using FIFO average cost method
-    per_symbol = {}
-    realized_profit = 0.0
-    gross_profit = 0.0
-    gross_loss = 0.0
-    total_buys = 0
-    total_sells = 0
-    winning_trades = 0
-    losing_trades = 0
-
-    for t in trades:
-        sym = t.symbol
-        if sym not in per_symbol:
-            per_symbol[sym] = {
-                'position': 0.0,
-                'total_cost': 0.0,
-                'avg_cost': 0.0,
-            }
-        s = per_symbol[sym]
+    # Day-aligned start: rollups are per UTC day
+    since_day = (datetime.utcnow() - timedelta(days=days)).date()
+    since = datetime.combine(since_day, datetime.min.time())
 
-        price = float(t.filled_price or t.price or 0)
-        amount = float(t.amount or 0)
-        if amount <= 0 or price <= 0:
-            continue
+    # Aggregated in SQL from daily rollups (brought up to date first), so the
+    # cost depends on the number of days, not on the number of trades
+    from app import trade_rollups
 
-        if t.side == 'BUY':
-            total_buys += 1
-            # Increase position and cost
-            s['total_cost'] += amount * price
-            s['position'] += amount
-            s['avg_cost'] = s['total_cost'] / s['position'] if s['position'] > 0 else 0.0
-        elif t.side == 'SELL':
-            total_sells += 1
-            # Realize PnL based on average cost
-            sell_amount = min(amount, s['position']) if s['position'] > 0 else 0.0
-            if sell_amount > 0:
-                pnl = (price - s['avg_cost']) * sell_amount
-                realized_profit += pnl
-                if pnl >= 0:
-                    gross_profit += pnl
-                    winning_trades += 1
-                else:
-                    gross_loss += abs(pnl)
-                    losing_trades += 1
-                # Reduce position and cost
-                s['position'] -= sell_amount
-                s['total_cost'] -= s['avg_cost'] * sell_amount
-                s['avg_cost'] = s['total_cost'] / s['position'] if s['position'] > 0 else 0.0
+    trade_rollups.refresh(db, current_user["id"], bot_type='gods_hand')
+    per_symbol = trade_rollups.window(db, current_user["id"], 'gods_hand', since_day)
+    positions = trade_rollups.open_positions(db, current_user["id"], 'gods_hand')
 
+    total_buys = sum(s['buys'] for s in per_symbol)
+    total_sells = sum(s['sells'] for s in per_symbol)
+    winning_trades = sum(s['winning_trades'] for s in per_symbol)
+    losing_trades = sum(s['losing_trades'] for s in per_symbol)
+    gross_profit = sum(s['gross_profit'] for s in per_symbol)
+    gross_loss = sum(s['gross_loss'] for s in per_symbol)
     total_trades = total_buys + total_sells
-    net_profit = realized_profit
+    net_profit = sum(s['realized_pl'] for s in per_symbol)
     win_rate = (winning_trades / max(1, total_sells)) * 100.0
     avg_win = (gross_profit / max(1, winning_trades)) if winning_trades > 0 else 0.0
     avg_loss = (gross_loss / max(1, losing_trades)) if losing_trades > 0 else 0.0
 
-    # Current positions per symbol
-    positions = [
-        {
-            'symbol': sym,
-            'position': round(s['position'], 8),
-            'avg_cost': round(s['avg_cost'], 6)
-        }
-        for sym, s in per_symbol.items() if s['position'] > 0
-    ]
-
     # Last trades (5 most recent)
     last_trades = [
         {
@@ -1517,6 +1613,18 @@ async def gods_hand_performance(
         )
     ]
 
+    risk_metrics = None
+    if risk:
+        from app.risk_metrics import compute_risk_metrics
+        config = db.query(BotConfig).filter(BotConfig.user_id == current_user["id"]).first()
+        mode = 'paper' if (config and config.paper_trading) else 'live'
+        risk_metrics = []
+        for s in per_symbol:
+            try:
+                risk_metrics.append(await compute_risk_metrics(current_user["id"], s['symbol'], 'gods_hand', db, mode=mode, days=days, config=config))
+            except Exception as e:
+                risk_metrics.append({'symbol': s['symbol'], 'mode': mode, 'error': str(e)})
+
     return {
         'since': since.isoformat(),
         'days': days,
@@ -1533,7 +1641,12 @@ async def gods_hand_performance(
             'avg_win': round(avg_win, 4),
             'avg_loss': round(avg_loss, 4),
         },
+        'per_symbol': [
+            {k: round(v, 4) if isinstance(v, float) else v for k, v in s.items()}
+            for s in per_symbol
+        ],
         'positions': positions,
+        'risk_metrics': risk_metrics,
         'last_trades': last_trades,
     }
 
@@ -1576,10 +1689,18 @@ async def reset_paper_trading(
         # Delete trades
         trades_query.delete(synchronize_session=False)
         
-        # Delete snapshots
+        # Delete snapshots (and their hourly/daily rollups)
         snapshots_query.delete(synchronize_session=False)
+        from app.paper_trading_tracker import delete_snapshot_rollups
+        delete_snapshot_rollups(db, current_user["id"], symbol)
+
+        # Bulk delete skips ORM events: recompute positions from the remaining (live) trades
+        from app.position_ledger import position_ledger
+        position_ledger.rebuild(db, current_user["id"], symbol)
         
         db.commit()
+        from app.balance_cache import balance_cache
+        balance_cache.invalidate(current_user["id"])
         
         message = f"Reset complete for {symbol}" if symbol else "Reset complete for all symbols"
         
@@ -1602,46 +1723,75 @@ async def reset_paper_trading(
 
 @app.get("/api/logs")
 async def get_logs(
+    response: Response,
     category: Optional[str] = None,
     level: Optional[str] = None,
+    symbol: Optional[str] = None,
+    bot_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_request_db)
 ):
-    """Get application logs with filtering. Non-admins only see their own logs."""
-    query = db.query(Log)
+    """Get application logs with filtering, newest first. Non-admins only see their own logs.
+    Page with `cursor` (next_cursor / X-Next-Cursor of the previous page); `offset` still works but
+    gets slower with depth. `total` is cached for a few seconds per filter set.
+    """
+    from app.pagination import cached_count, page_statement, split_page
+
+    limit = max(1, min(limit, 1000))
+    filters = []
     
     # Filter by user_id for non-admins
     if not current_user.get("is_admin"):
-        query = query.filter(Log.user_id == current_user["id"])
+        filters.append(Log.user_id == current_user["id"])
     
     # Filter by category
     if category:
         try:
-            query = query.filter(Log.category == LogCategory(category))
+            filters.append(Log.category == LogCategory(category))
         except ValueError:
             pass
     
     # Filter by level
     if level:
         try:
-            query = query.filter(Log.level == LogLevel(level))
+            filters.append(Log.level == LogLevel(level))
         except ValueError:
             pass
+
+    if symbol:
+        filters.append(Log.symbol == symbol)
+    if bot_type:
+        filters.append(Log.bot_type == bot_type)
+    if since:
+        filters.append(Log.timestamp >= _naive_utc(since))
+    if until:
+        filters.append(Log.timestamp < _naive_utc(until))
     
-    # Order by most recent first
-    query = query.order_by(Log.timestamp.desc())
-    
-    # Apply pagination
-    total = query.count()
-    logs = query.offset(offset).limit(limit).all()
+    # Keyset pagination, most recent first
+    try:
+        stmt = page_statement(Log, Log.timestamp, Log.id, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if offset and not cursor:
+        stmt = stmt.offset(offset)
+    logs, next_cursor = split_page((await db.execute(stmt)).scalars().all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    count_key = ("logs", None if current_user.get("is_admin") else current_user["id"],
+                 category, level, symbol, bot_type, since, until)
+    total = await cached_count(db, count_key, Log.id, filters)
     
     return {
         "total": total,
         "offset": offset,
         "limit": limit,
-        "logs": [log.to_dict() for log in logs]
+        "next_cursor": next_cursor,
+        "logs": await attach_summaries(db, [log.to_dict() for log in logs])
     }
 
 
@@ -1660,43 +1810,103 @@ async def get_log_categories(
 
 @app.get("/api/logs/ai-actions")
 async def get_ai_action_comparison(
+    response: Response,
     limit: int = 50,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_request_db)
 ):
-    """Get AI thinking vs actual actions comparison. Non-admins only see their own logs."""
-    # Base queries
-    thinking_query = db.query(Log).filter(Log.category == LogCategory.AI_THINKING)
-    action_query = db.query(Log).filter(Log.category == LogCategory.AI_ACTION)
+    """Get AI thinking vs actual actions comparison, newest first. Non-admins only see their own logs.
+    Each thinking log is paired with the action log of the same decision (decision_id); logs written
+    before decision ids existed fall back to the same user/symbol action nearest in time (within 60s).
+    Page with `cursor` (next_cursor / X-Next-Cursor of the previous page).
+    """
+    from datetime import timedelta
+    from app.pagination import page_statement, split_page
+
+    limit = max(1, min(limit, 500))
+    filters = [Log.category == LogCategory.AI_THINKING]
     
     # Filter by user_id for non-admins
     if not current_user.get("is_admin"):
-        thinking_query = thinking_query.filter(Log.user_id == current_user["id"])
-        action_query = action_query.filter(Log.user_id == current_user["id"])
-    
-    # Execute queries
-    thinking_logs = thinking_query.order_by(Log.timestamp.desc()).limit(limit).all()
-    action_logs = action_query.order_by(Log.timestamp.desc()).limit(limit).all()
+        filters.append(Log.user_id == current_user["id"])
     
+    try:
+        stmt = page_statement(Log, Log.timestamp, Log.id, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    thinking_logs, next_cursor = split_page((await db.execute(stmt)).scalars().all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    # One indexed lookup for the whole page
+    actions = {}
+    decision_ids = [t.decision_id for t in thinking_logs if t.decision_id]
+    if decision_ids:
+        for a in (await db.execute(
+            select(Log).where(Log.decision_id.in_(decision_ids), Log.category == LogCategory.AI_ACTION)
+            .order_by(Log.id)
+        )).scalars().all():
+            actions.setdefault(a.decision_id, a)
+
+    # Legacy rows: nearest unused action in the page's time window
+    legacy = [t for t in thinking_logs if not t.decision_id and t.timestamp]
+    if legacy:
+        window = timedelta(seconds=60)
+        legacy_filters = [
+            Log.category == LogCategory.AI_ACTION, Log.decision_id.is_(None),
+            Log.timestamp >= min(t.timestamp for t in legacy) - window,
+            Log.timestamp <= max(t.timestamp for t in legacy) + window,
+        ]
+        if not current_user.get("is_admin"):
+            legacy_filters.append(Log.user_id == current_user["id"])
+        candidates = (await db.execute(select(Log).where(*legacy_filters))).scalars().all()
+        used = set()
+        for thinking in legacy:
+            best = min(
+                (a for a in candidates
+                 if a.id not in used and a.user_id == thinking.user_id and a.symbol == thinking.symbol
+                 and abs((a.timestamp - thinking.timestamp).total_seconds()) < 60),
+                key=lambda a: abs((a.timestamp - thinking.timestamp).total_seconds()),
+                default=None,
+            )
+            if best is not None:
+                used.add(best.id)
+                actions[("legacy", thinking.id)] = best
+    
+    # Decision text is rendered from the decisions table (app/decisions.py)
+    thinking_messages = {
+        entry["id"]: entry["message"]
+        for entry in await attach_summaries(db, [thinking.to_dict() for thinking in thinking_logs])
+    }
+
+    # Live orders log "submitted"; the decision row carries the outcome once the pipeline settles it
+    from app.models import Decision
+    submitted = [a.decision_id for a in actions.values() if a.ai_executed == "submitted" and a.decision_id]
+    settled = {}
+    if submitted:
+        settled = dict((await db.execute(
+            select(Decision.decision_id, Decision.executed)
+            .where(Decision.decision_id.in_(submitted), Decision.block_reason.is_distinct_from("submitted"))
+        )).all())
+
     # Create comparison
     comparison = []
     for thinking in thinking_logs:
-        # Find corresponding action within 1 minute
-        matching_action = next(
-            (a for a in action_logs 
-             if a.symbol == thinking.symbol 
-             and abs((a.timestamp - thinking.timestamp).total_seconds()) < 60),
-            None
-        )
+        matching_action = actions.get(thinking.decision_id) if thinking.decision_id else actions.get(("legacy", thinking.id))
+        action_taken = matching_action.ai_executed if matching_action else "unknown"
+        if matching_action and matching_action.decision_id in settled:
+            action_taken = "yes" if settled[matching_action.decision_id] else "no"
         
         comparison.append({
             "timestamp": thinking.timestamp.isoformat() + 'Z' if thinking.timestamp and not thinking.timestamp.isoformat().endswith('Z') else thinking.timestamp.isoformat() if thinking.timestamp else None,
+            "decision_id": thinking.decision_id,
             "symbol": thinking.symbol,
             "ai_recommendation": thinking.ai_recommendation,
             "ai_confidence": thinking.ai_confidence,
-            "thinking_message": thinking.message,
+            "thinking_message": thinking_messages.get(thinking.id, thinking.message),
             "thinking_level": thinking.level.value if thinking.level else None,
-            "action_taken": matching_action.ai_executed if matching_action else "unknown",
+            "action_taken": action_taken,
             "action_reason": matching_action.execution_reason if matching_action else None,
             "action_message": matching_action.message if matching_action else None,
             "action_level": matching_action.level.value if matching_action and matching_action.level else None,
@@ -1704,10 +1914,127 @@ async def get_ai_action_comparison(
     
     return {
         "total": len(comparison),
+        "next_cursor": next_cursor,
         "comparisons": comparison
     }
 
 
+@app.get("/api/decisions")
+async def get_decisions(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    symbol: Optional[str] = None,
+    action: Optional[str] = None,
+    executed: Optional[bool] = None,
+    block_reason: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_request_db)
+):
+    """Gods Hand decision records (typed columns + extras), newest first, keyset paged like /api/logs."""
+    from app.models import Decision
+    from app.pagination import page_statement, split_page
+
+    limit = max(1, min(limit, 1000))
+    filters = []
+    if not current_user.get("is_admin"):
+        filters.append(Decision.user_id == current_user["id"])
+    if symbol:
+        filters.append(Decision.symbol == symbol)
+    if action:
+        filters.append(Decision.action == action.upper())
+    if executed is not None:
+        filters.append(Decision.executed == executed)
+    if block_reason:
+        filters.append(Decision.block_reason == block_reason)
+    if since:
+        filters.append(Decision.timestamp >= _naive_utc(since))
+    if until:
+        filters.append(Decision.timestamp < _naive_utc(until))
+
+    try:
+        stmt = page_statement(Decision, Decision.timestamp, Decision.id, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    decisions, next_cursor = split_page((await db.execute(stmt)).scalars().all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return {"next_cursor": next_cursor, "decisions": [d.to_dict() for d in decisions]}
+
+
+@app.get("/api/logs/archive")
+async def get_archived_logs(
+    start: datetime,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None,
+    limit: int = 1000,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Logs moved out of the database by retention (start <= timestamp < end, oldest first). Non-admins only see their own."""
+    import asyncio
+    from app.log_retention import read_archived_logs
+
+    start = _naive_utc(start)
+    end = _naive_utc(end) if end else datetime.utcnow()
+    user_id = None if current_user.get("is_admin") else current_user["id"]
+    logs = await asyncio.to_thread(
+        lambda: list(read_archived_logs(start, end, user_id=user_id, category=category, limit=min(limit, 10000)))
+    )
+    return {"total": len(logs), "start": start.isoformat(), "end": end.isoformat(), "logs": logs}
+
+
+@app.get("/api/logs/retention")
+async def get_log_retention(
+    run: bool = False,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Retention policy (days per category) and the last run; run=true archives now. Admin only."""
+    from app.log_retention import LOG_ARCHIVE_DIR, last_run, retention_policy, retention_scheduler
+
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin only")
+    result = await retention_scheduler.run_once() if run else dict(last_run)
+    return {
+        "policy_days": {category.value: days for category, days in retention_policy().items()},
+        "archive_dir": LOG_ARCHIVE_DIR,
+        "last_run": result,
+    }
+
+
+@app.get("/api/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Stream trades / logs / decisions / snapshots as NDJSON, CSV or Parquet (app/export.py).
+    Users export their own rows; admins may pass user_id, or omit it for all users."""
+    from app import export
+
+    if not current_user.get("is_admin"):
+        user_id = current_user["id"]
+    try:
+        export.check(dataset, format)
+    except export.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = export.export(
+        dataset, format, user_id=user_id, gzip=gzip,
+        since=_naive_utc(since) if since else None, until=_naive_utc(until) if until else None,
+    )
+    name = export.filename(dataset, format, gzip, user_id)
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
 @app.delete("/api/logs/clear")
 async def clear_logs(
     category: Optional[str] = None,
@@ -1741,10 +2068,14 @@ async def clear_logs(
 async def get_paper_performance(
     symbol: Optional[str] = None,
     bot_type: str = "gods_hand",
+    risk: bool = False,
+    days: int = 30,
     current_user: dict = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get current paper trading performance"""
+    """Get current paper trading performance.
+    risk=true adds mark-to-market risk metrics over the last `days` (drawdown, Sharpe, Sortino, exposure).
+    """
     from app.paper_trading_tracker import calculate_paper_performance
     
     # Get symbol from config if not provided
@@ -1753,7 +2084,15 @@ async def get_paper_performance(
         symbol = config.symbol if config else "BTC/USDT"
     
     perf = calculate_paper_performance(current_user["id"], symbol, bot_type, db)
-    return perf if perf else {"error": "No data available"}
+    if not perf:
+        return {"error": "No data available"}
+    if risk:
+        from app.risk_metrics import compute_risk_metrics
+        try:
+            perf = dict(perf, risk_metrics=await compute_risk_metrics(current_user["id"], symbol, bot_type, db, days=days, points=200))
+        except Exception as e:
+            perf = dict(perf, risk_metrics={"error": str(e)})
+    return perf
 
 
 @app.get("/api/paper-trading/history")
@@ -1761,19 +2100,32 @@ async def get_paper_history(
     symbol: Optional[str] = None,
     bot_type: str = "gods_hand",
     days: int = 7,
+    resolution: str = "auto",
     current_user: dict = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_request_db)
 ):
-    """Get paper trading performance history (default 7 days)"""
-    from app.paper_trading_tracker import get_paper_performance_history
+    """Get paper trading performance history (default 7 days).
+    resolution: 'auto' (finest of raw/hour/day that fits in a few hundred points), 'raw', 'hour' or 'day'.
+    """
+    from app.paper_trading_tracker import get_paper_performance_history, pick_history_resolution
     
+    if resolution not in ("auto", "raw", "hour", "day"):
+        raise HTTPException(status_code=400, detail="resolution must be one of auto, raw, hour, day")
+
     # Get symbol from config if not provided
     if not symbol:
-        config = db.query(BotConfig).filter(BotConfig.user_id == current_user["id"]).first()
-        symbol = config.symbol if config else "BTC/USDT"
+        symbol = (await db.execute(
+            select(BotConfig.symbol).where(BotConfig.user_id == current_user["id"])
+        )).scalar() or "BTC/USDT"
     
-    history = get_paper_performance_history(current_user["id"], symbol, bot_type, days, db)
-    return {"history": history, "symbol": symbol, "bot_type": bot_type, "days": days}
+    def load(session: Session):
+        res = resolution
+        if res == "auto":
+            res = pick_history_resolution(current_user["id"], symbol, bot_type, days, session)
+        return res, get_paper_performance_history(current_user["id"], symbol, bot_type, days, session, resolution=res)
+
+    resolution, history = await db.run_sync(load)
+    return {"history": history, "symbol": symbol, "bot_type": bot_type, "days": days, "resolution": resolution}
 
 
 @app.post("/api/paper-trading/snapshot")
@@ -1791,7 +2143,7 @@ async def create_paper_snapshot(
         config = db.query(BotConfig).filter(BotConfig.user_id == current_user["id"]).first()
         symbol = config.symbol if config else "BTC/USDT"
     
-    snapshot = save_paper_snapshot(current_user["id"], symbol, bot_type, db)
+    snapshot = save_paper_snapshot(current_user["id"], symbol, bot_type, db, force=True)
     return {"status": "success", "snapshot": snapshot}
 
 
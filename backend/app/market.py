@@ -48,6 +48,42 @@ async def get_symbol_step_size(symbol: str) -> float:
         return 0.00001 # Default fallback
 
 
+async def get_symbol_tick_size(symbol: str) -> float:
+    """Get price tick size for symbol (PRICE_FILTER) for limit order rounding"""
+    cache_key = f"{symbol}:tick"
+    if cache_key in _symbol_info_cache:
+        return _symbol_info_cache[cache_key]
+
+    try:
+        client = market_client.client
+        binance_symbol = symbol.replace('/', '')
+        info = await asyncio.to_thread(client.get_exchange_info, binance_symbol)
+
+        symbols = info.get('symbols', [])
+        if not symbols:
+            return 0.01
+
+        for filter in symbols[0].get('filters', []):
+            if filter['filterType'] == 'PRICE_FILTER':
+                tick_size = float(filter['tickSize']) or 0.01
+                _symbol_info_cache[cache_key] = tick_size
+                return tick_size
+
+        return 0.01
+    except Exception as e:
+        print(f"Failed to get symbol info: {e}")
+        return 0.01
+
+
+def round_to_step(value: float, step: float) -> float:
+    """Floor value to a multiple of step, without float artifacts"""
+    if step <= 0:
+        return value
+    import math
+    precision = max(0, int(round(-math.log(step, 10), 0)))
+    return round(math.floor(value / step + 1e-9) * step, precision)
+
+
 async def get_account_balance(db: Session, user_id: int, fiat_currency: str = "USD") -> dict:
     """Get account balance and P/L from Binance TH or paper trading simulation"""
     from app.models import BotConfig, Trade
@@ -79,7 +115,7 @@ async def get_account_balance(db: Session, user_id: int, fiat_currency: str = "U
             current_price = 0.0  # No fallback to fake prices
         
         # Calculate paper trading performance to get actual position
-        perf = calculate_paper_performance(user_id, symbol, 'gods_hand', db, current_price=current_price)
+        perf = calculate_paper_performance(user_id, symbol, 'gods_hand', db, current_price=current_price, config=config)
         
         if perf:
             if perf.get('total_trades', 0) > 0:
@@ -246,7 +282,7 @@ async def get_account_balance(db: Session, user_id: int, fiat_currency: str = "U
                     pass
 
             # Use the shared performance tracker with mode='live'
-            perf = calculate_paper_performance(user_id, config.symbol, 'gods_hand', db, mode='live', current_price=current_price)
+            perf = calculate_paper_performance(user_id, config.symbol, 'gods_hand', db, mode='live', current_price=current_price, config=config)
             if perf:
                 total_pnl = perf.get('total_pl', 0)
                 total_pnl_percentage = perf.get('pl_percent', 0)
@@ -291,21 +327,39 @@ async def get_account_balance(db: Session, user_id: int, fiat_currency: str = "U
         }
 
 
+def _ticker_dict(symbol: str, ticker: dict) -> dict:
+    return {
+        "symbol": symbol,
+        "last": ticker['last'],
+        "bid": ticker['bid'],
+        "ask": ticker['ask'],
+        "high": ticker['high'],
+        "low": ticker['low'],
+        "volume": ticker['baseVolume'],
+        "change_24h": ticker['percentage'],
+        "timestamp": ticker['timestamp']
+    }
+
+
+def _candles_from_ohlcv(ohlcv: list) -> List[dict]:
+    candles = []
+    for candle in ohlcv:
+        candles.append({
+            "timestamp": candle[0],
+            "open": candle[1],
+            "high": candle[2],
+            "low": candle[3],
+            "close": candle[4],
+            "volume": candle[5]
+        })
+    return candles
+
+
 async def get_current_price(symbol: str) -> dict:
     """Get current ticker price for symbol"""
     try:
         ticker = market_client.fetch_ticker(symbol)
-        return {
-            "symbol": symbol,
-            "last": ticker['last'],
-            "bid": ticker['bid'],
-            "ask": ticker['ask'],
-            "high": ticker['high'],
-            "low": ticker['low'],
-            "volume": ticker['baseVolume'],
-            "change_24h": ticker['percentage'],
-            "timestamp": ticker['timestamp']
-        }
+        return _ticker_dict(symbol, ticker)
     except Exception as e:
         raise Exception(f"Failed to fetch ticker for {symbol}: {str(e)}")
 
@@ -314,27 +368,28 @@ async def get_candlestick_data(symbol: str, timeframe: str = "1h", limit: int =
     """Get OHLCV candlestick data"""
     try:
         ohlcv = market_client.fetch_ohlcv(symbol, timeframe, limit)
-        
-        candles = []
-        for candle in ohlcv:
-            candles.append({
-                "timestamp": candle[0],
-                "open": candle[1],
-                "high": candle[2],
-                "low": candle[3],
-                "close": candle[4],
-                "volume": candle[5]
-            })
-        
-        return candles
+        return _candles_from_ohlcv(ohlcv)
     except Exception as e:
         raise Exception(f"Failed to fetch candles for {symbol}: {str(e)}")
 
 
+async def get_market_snapshot(symbol: str, timeframe: str = "1h", limit: int = 100) -> dict:
+    """Candles + ticker fetched in parallel worker threads (the client is synchronous),
+    so snapshots for many symbols can be gathered concurrently."""
+    try:
+        ohlcv, ticker = await asyncio.gather(
+            asyncio.to_thread(market_client.fetch_ohlcv, symbol, timeframe, limit),
+            asyncio.to_thread(market_client.fetch_ticker, symbol),
+        )
+        return {"candles": _candles_from_ohlcv(ohlcv), "ticker": _ticker_dict(symbol, ticker)}
+    except Exception as e:
+        raise Exception(f"Failed to fetch market snapshot for {symbol}: {str(e)}")
+
+
 async def get_order_book(symbol: str, limit: int = 20) -> dict:
-    """Get orderbook depth"""
+    """Get orderbook depth (fetched in a worker thread; the client is synchronous)"""
     try:
-        orderbook = market_client.fetch_order_book(symbol, limit)
+        orderbook = await asyncio.to_thread(market_client.fetch_order_book, symbol, limit)
         return {
             "symbol": symbol,
             "bids": orderbook['bids'][:limit],
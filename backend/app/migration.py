@@ -1,69 +1,203 @@
+"""
+Versioned schema migrations (SQLite and Postgres).
+
+Applied versions are recorded in schema_migrations; each pending migration
+runs in its own transaction, in version order. create_all() still creates
+missing tables first, so migrations only handle changes to existing tables.
+New columns or indexes go in a NEW version at the end of MIGRATIONS (never
+edit an applied one). Every step is idempotent, so a half-applied DB from
+before versioning is fine.
+"""
 import logging
+from datetime import datetime
+
 from sqlalchemy import inspect, text
 from app.db import engine
 
 logger = logging.getLogger(__name__)
 
+# Advisory lock id so only one process migrates at a time on Postgres
+_PG_LOCK_ID = 704211
+
+
+def _add_columns(conn, table: str, columns):
+    """ADD COLUMN for each (name, type_sql, default_sql) missing from table."""
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        logger.info(f"Table '{table}' does not exist yet. Skipping (will be created by create_all).")
+        return
+    existing = [c['name'] for c in inspector.get_columns(table)]
+    for col_name, col_type, default_val in columns:
+        if col_name in existing:
+            continue
+        logger.info(f"Migrating: Adding column '{col_name}' to {table}...")
+        # For boolean defaults in SQL: FALSE/TRUE work on both SQLite and Postgres
+        default_clause = f"DEFAULT {default_val}" if default_val != 'NULL' else ""
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type} {default_clause}"))
+        logger.info(f"✅ Added column {col_name}")
+
+
+def _create_indexes(conn, indexes):
+    """CREATE INDEX IF NOT EXISTS for each (name, table, columns) whose table exists."""
+    inspector = inspect(conn)
+    for name, table, columns in indexes:
+        if not inspector.has_table(table):
+            continue
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        logger.info(f"✅ Index {name} on {table}({', '.join(columns)})")
+
+
+def _bot_config_columns(conn):
+    # Format: (column_name, type_sql, default_value_sql)
+    # We use generic types that work on both (FLOAT, INTEGER, TEXT, BOOLEAN).
+    _add_columns(conn, 'bot_configs', [
+        ('kill_switch_baseline', 'FLOAT', 'NULL'),
+        ('kill_switch_last_trigger', 'TIMESTAMP', 'NULL'), # TIMESTAMP works in PG, DATETIME in SQLite usually mapped
+        ('kill_switch_cooldown_minutes', 'INTEGER', '60'),
+        ('kill_switch_consecutive_breaches', 'INTEGER', '3'),
+        ('cryptopanic_api_key', 'VARCHAR', 'NULL'),
+        ('gods_mode_enabled', 'BOOLEAN', 'FALSE'),
+        ('tennis_mode_enabled', 'BOOLEAN', 'FALSE'),
+        ('notification_email', 'VARCHAR', 'NULL'),
+        ('notify_on_action', 'BOOLEAN', 'FALSE'),
+        ('notify_on_position_size', 'BOOLEAN', 'FALSE'),
+        ('notify_on_failure', 'BOOLEAN', 'FALSE'),
+        ('gmail_user', 'VARCHAR', 'NULL'),
+        ('gmail_app_password', 'VARCHAR', 'NULL'),
+        ('schedule_mode', 'VARCHAR', "'fixed'"),
+        ('skip_unchanged_evaluations', 'BOOLEAN', 'FALSE'),
+        ('portfolio_enabled', 'BOOLEAN', 'FALSE'),
+        ('portfolio_symbols', 'TEXT', 'NULL'),
+    ])
+
+
+# Composite indexes for the hot query shapes (also declared on the models for fresh DBs)
+HOT_PATH_INDEXES = [
+    # performance / rollups / history filtered by bot and status
+    ('ix_trades_user_symbol_bot_status_ts', 'trades', ('user_id', 'symbol', 'bot_type', 'status', 'timestamp')),
+    # position ledger / performance engine replays (every bot), ordered by time
+    ('ix_trades_user_symbol_ts', 'trades', ('user_id', 'symbol', 'timestamp')),
+    # /api/trade/history
+    ('ix_trades_user_ts', 'trades', ('user_id', 'timestamp')),
+    # /api/logs?category=..., /api/logs/ai-actions
+    ('ix_logs_user_category_ts', 'logs', ('user_id', 'category', 'timestamp')),
+    # /api/logs without a category
+    ('ix_logs_user_ts', 'logs', ('user_id', 'timestamp')),
+    # paper trading history / change detection
+    ('ix_paper_snapshots_user_symbol_bot_ts', 'paper_trading_snapshots', ('user_id', 'symbol', 'bot_type', 'timestamp')),
+]
+
+
+def _hot_path_indexes(conn):
+    _create_indexes(conn, HOT_PATH_INDEXES)
+
+
+def _partition_logs(conn):
+    # Postgres only: logs becomes range-partitioned by month (see app/log_retention.py).
+    # Copies the whole table inside this migration's transaction.
+    if conn.dialect.name != 'postgresql' or not inspect(conn).has_table('logs'):
+        return
+    from app.log_retention import partition_logs_table
+    partition_logs_table(conn)
+
+
+# Keyset pagination orders by (timestamp, id): the same indexes with id appended
+KEYSET_INDEXES = [
+    ('ix_trades_user_ts_id', 'trades', ('user_id', 'timestamp', 'id')),
+    ('ix_logs_user_category_ts_id', 'logs', ('user_id', 'category', 'timestamp', 'id')),
+    ('ix_logs_user_ts_id', 'logs', ('user_id', 'timestamp', 'id')),
+]
+SUPERSEDED_INDEXES = ('ix_trades_user_ts', 'ix_logs_user_category_ts', 'ix_logs_user_ts')
+
+# Indexes the hot queries should use after all migrations
+ACTIVE_INDEXES = [i for i in HOT_PATH_INDEXES if i[0] not in SUPERSEDED_INDEXES] + KEYSET_INDEXES
+
+
+def _keyset_indexes(conn):
+    _create_indexes(conn, KEYSET_INDEXES)
+    for name in SUPERSEDED_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _log_decision_ids(conn):
+    _add_columns(conn, 'logs', [('decision_id', 'VARCHAR', 'NULL')])
+    _create_indexes(conn, [('ix_logs_decision_id', 'logs', ('decision_id',))])
+
+
+def _forecast_snapshots_packed(conn):
+    blob = 'BYTEA' if conn.dialect.name == 'postgresql' else 'BLOB'
+    _add_columns(conn, 'forecast_snapshots', [
+        ('predicted_prices', blob, 'NULL'),
+        ('confidences', blob, 'NULL'),
+        ('evaluated_at', 'TIMESTAMP', 'NULL'),
+        ('mae', 'FLOAT', 'NULL'),
+        ('mape', 'FLOAT', 'NULL'),
+        ('evaluated_points', 'INTEGER', 'NULL'),
+    ])
+    _create_indexes(conn, [
+        ('ix_forecast_snapshots_symbol_generated', 'forecast_snapshots', ('symbol', 'generated_at')),
+        ('ix_forecast_snapshots_pending', 'forecast_snapshots', ('evaluated_at', 'generated_at')),
+    ])
+    if inspect(conn).has_table('forecast_snapshots'):
+        from app.forecast_store import backfill_packed
+        logger.info(f"✅ Packed {backfill_packed(conn)} forecast snapshot(s)")
+
+
+def _decision_order_ids(conn):
+    _add_columns(conn, 'decisions', [('client_order_id', 'VARCHAR', 'NULL')])
+    _create_indexes(conn, [('ix_decisions_client_order_id', 'decisions', ('client_order_id',))])
+
+
+# (version, name, fn(conn)) - append only
+MIGRATIONS = [
+    (1, 'bot_configs_columns', _bot_config_columns),
+    (2, 'hot_path_composite_indexes', _hot_path_indexes),
+    (3, 'logs_monthly_partitions', _partition_logs),
+    (4, 'keyset_pagination_indexes', _keyset_indexes),
+    (5, 'logs_decision_id', _log_decision_ids),
+    (6, 'forecast_snapshots_packed', _forecast_snapshots_packed),
+    (7, 'decisions_client_order_id', _decision_order_ids),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(conn) -> set:
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
 def run_db_migrations():
-    """
-    Check for missing columns in the database and add them if necessary.
-    This handles schema evolution without needing a full migration tool like Alembic for now.
-    """
+    """Apply every pending migration in order; a failing one stops the run (later ones depend on it)."""
+    postgres = engine.dialect.name == 'postgresql'
     try:
-        inspector = inspect(engine)
-        
-        # Check if table exists first
-        if not inspector.has_table("bot_configs"):
-            logger.info("Table 'bot_configs' does not exist yet. Skipping migration (will be created by create_all).")
-            return
-
-        columns = [c['name'] for c in inspector.get_columns('bot_configs')]
-        logger.info(f"Existing columns in bot_configs: {columns}")
-
-        with engine.connect() as conn:
-            # List of columns to check and add
-            # Format: (column_name, type_sql, default_value_sql)
-            # Note: SQLite and Postgres have slightly different syntax, but ADD COLUMN is mostly standard.
-            # We use generic types that work on both (FLOAT, INTEGER, TEXT, BOOLEAN).
-            
-            migrations = [
-                ('kill_switch_baseline', 'FLOAT', 'NULL'),
-                ('kill_switch_last_trigger', 'TIMESTAMP', 'NULL'), # TIMESTAMP works in PG, DATETIME in SQLite usually mapped
-                ('kill_switch_cooldown_minutes', 'INTEGER', '60'),
-                ('kill_switch_consecutive_breaches', 'INTEGER', '3'),
-                ('cryptopanic_api_key', 'VARCHAR', 'NULL'),
-                ('gods_mode_enabled', 'BOOLEAN', 'FALSE'),
-                ('tennis_mode_enabled', 'BOOLEAN', 'FALSE'),
-                ('notification_email', 'VARCHAR', 'NULL'),
-                ('notify_on_action', 'BOOLEAN', 'FALSE'),
-                ('notify_on_position_size', 'BOOLEAN', 'FALSE'),
-                ('notify_on_failure', 'BOOLEAN', 'FALSE'),
-                ('gmail_user', 'VARCHAR', 'NULL'),
-                ('gmail_app_password', 'VARCHAR', 'NULL'),
-            ]
-
-            for col_name, col_type, default_val in migrations:
-                if col_name not in columns:
-                    logger.info(f"Migrating: Adding column '{col_name}' to bot_configs...")
-                    try:
-                        # Construct SQL based on dialect if needed, but simple ADD COLUMN is standard
-                        # For boolean defaults in SQL: FALSE/TRUE or 0/1
-                        default_clause = ""
-                        if default_val != 'NULL':
-                            default_clause = f"DEFAULT {default_val}"
-                        
-                        # Adjust type for SQLite vs Postgres if needed
-                        # SQLAlchemy engine.name can be 'sqlite' or 'postgresql'
-                        
-                        sql = f"ALTER TABLE bot_configs ADD COLUMN {col_name} {col_type} {default_clause}"
-                        conn.execute(text(sql))
-                        conn.commit()
-                        logger.info(f"✅ Added column {col_name}")
-                    except Exception as e:
-                        logger.error(f"❌ Failed to add column {col_name}: {e}")
-                        # Don't raise, try next column
-            
-            logger.info("Database migration check completed.")
-
+        with engine.connect() as lock_conn:
+            if postgres:
+                lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _PG_LOCK_ID})
+                lock_conn.commit()
+            try:
+                with engine.begin() as conn:
+                    _ensure_version_table(conn)
+                    done = applied_versions(conn)
+                for version, name, fn in MIGRATIONS:
+                    if version in done:
+                        continue
+                    logger.info(f"Applying migration {version}: {name}")
+                    with engine.begin() as conn:
+                        fn(conn)
+                        conn.execute(
+                            text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                            {"v": version, "n": name, "t": datetime.utcnow()},
+                        )
+                    logger.info(f"✅ Migration {version} applied")
+            finally:
+                if postgres:
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _PG_LOCK_ID})
+                    lock_conn.commit()
+        logger.info("Database migration check completed.")
     except Exception as e:
         logger.error(f"Migration failed: {e}")
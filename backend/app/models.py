@@ -2,9 +2,10 @@
 Gods Ping Database Models
 Simplified schema for single-page trading app
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Boolean, Text, LargeBinary, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import json
 from app.db import Base
 
 
@@ -61,6 +62,13 @@ class Trade(Base):
     # Relationship
     user = relationship("User", back_populates="trades")
 
+    # Hot query shapes (existing DBs get these from app/migration.py)
+    __table_args__ = (
+        Index('ix_trades_user_symbol_bot_status_ts', 'user_id', 'symbol', 'bot_type', 'status', 'timestamp'),
+        Index('ix_trades_user_symbol_ts', 'user_id', 'symbol', 'timestamp'),
+        Index('ix_trades_user_ts_id', 'user_id', 'timestamp', 'id'),
+    )
+
 
 class BotConfig(Base):
     """Unified bot configuration per user"""
@@ -111,6 +119,14 @@ class BotConfig(Base):
     kill_switch_cooldown_minutes = Column(Integer, default=60)  # cooldown period in minutes
     kill_switch_consecutive_breaches = Column(Integer, default=3)  # required consecutive breaches
 
+    # Gods Hand loop scheduling (see app/scheduling.py)
+    schedule_mode = Column(String, default="fixed")  # fixed | adaptive | candle
+    skip_unchanged_evaluations = Column(Boolean, default=False)  # skip AI call when market snapshot unchanged
+
+    # Gods Hand portfolio mode (see app/portfolio.py)
+    portfolio_enabled = Column(Boolean, default=False)
+    portfolio_symbols = Column(Text, nullable=True)  # JSON {symbol: budget weight}
+
     # Email Notification Settings
     notification_email = Column(String, nullable=True)
     notify_on_action = Column(Boolean, default=False)
@@ -166,6 +182,10 @@ class BotConfig(Base):
             'kill_switch_last_trigger': self.kill_switch_last_trigger.isoformat() if self.kill_switch_last_trigger else None,
             'kill_switch_cooldown_minutes': self.kill_switch_cooldown_minutes,
             'kill_switch_consecutive_breaches': self.kill_switch_consecutive_breaches,
+            'schedule_mode': self.schedule_mode or 'fixed',
+            'skip_unchanged_evaluations': bool(self.skip_unchanged_evaluations),
+            'portfolio_enabled': bool(self.portfolio_enabled),
+            'portfolio_symbols': json.loads(self.portfolio_symbols) if self.portfolio_symbols else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
@@ -180,10 +200,26 @@ class ForecastSnapshot(Base):
     horizon_hours = Column(Integer, default=6)
     current_price = Column(Float, nullable=False)
     summary = Column(Text, nullable=True)
-    # Store forecasts (array of {hour, predicted_price, confidence}) and any extra fields
+    # Forecast points packed by app/forecast_store.py: hour h is element h-1
+    predicted_prices = Column(LargeBinary, nullable=True)  # float64 array
+    confidences = Column(LargeBinary, nullable=True)       # uint8 array, confidence * 100
+    # Remaining fields ({risk_metrics, price_targets}); rows from before packing also have 'forecasts'
     data_json = Column(Text, nullable=False)  # JSON string
 
+    # Accuracy vs actual hourly closes, filled in once by the evaluation job after the horizon
+    evaluated_at = Column(DateTime, nullable=True)
+    mae = Column(Float, nullable=True)
+    mape = Column(Float, nullable=True)
+    evaluated_points = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index('ix_forecast_snapshots_symbol_generated', 'symbol', 'generated_at'),
+        Index('ix_forecast_snapshots_pending', 'evaluated_at', 'generated_at'),
+    )
+
     def to_dict(self):
+        from app.forecast_store import metrics, unpack_forecasts
+        data = json.loads(self.data_json) if self.data_json else {}
         return {
             'id': self.id,
             'symbol': self.symbol,
@@ -191,5 +227,309 @@ class ForecastSnapshot(Base):
             'horizon_hours': self.horizon_hours,
             'current_price': self.current_price,
             'summary': self.summary,
-            'data': self.data_json,
+            'forecasts': unpack_forecasts(self),
+            'price_targets': data.get('price_targets'),
+            'risk_metrics': data.get('risk_metrics'),
+            'metrics': metrics(self),
+        }
+
+
+class BotWorker(Base):
+    """Bot-runner pool worker registration and published load stats"""
+    __tablename__ = "bot_workers"
+
+    worker_id = Column(String, primary_key=True)
+    pid = Column(Integer, nullable=True)
+    hostname = Column(String, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # Load stats (refreshed on every heartbeat)
+    assigned_count = Column(Integer, default=0)
+    cpu_percent = Column(Float, default=0.0)
+    tick_count = Column(Integer, default=0)
+    tick_p50_ms = Column(Float, default=0.0)
+    tick_p95_ms = Column(Float, default=0.0)
+    tick_max_ms = Column(Float, default=0.0)
+
+    def to_dict(self):
+        return {
+            'worker_id': self.worker_id,
+            'pid': self.pid,
+            'hostname': self.hostname,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'assigned_count': self.assigned_count,
+            'cpu_percent': self.cpu_percent,
+            'tick_count': self.tick_count,
+            'tick_p50_ms': self.tick_p50_ms,
+            'tick_p95_ms': self.tick_p95_ms,
+            'tick_max_ms': self.tick_max_ms,
         }
+
+
+class BotAssignment(Base):
+    """Lease that pins a user's Gods Hand loop to exactly one pool worker"""
+    __tablename__ = "bot_assignments"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    worker_id = Column(String, nullable=True, index=True)
+    lease_until = Column(DateTime, nullable=True)
+    interval_seconds = Column(Integer, default=60)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DcaSchedule(Base):
+    """Durable recurring DCA job: one row per user, next due time drives the scheduler"""
+    __tablename__ = "dca_schedules"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    enabled = Column(Boolean, default=True, index=True)
+    interval_seconds = Column(Integer, nullable=False)
+    next_run_at = Column(DateTime, nullable=False, index=True)
+    last_run_at = Column(DateTime, nullable=True)
+    runs_completed = Column(Integer, default=0)
+    runs_missed = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'enabled': self.enabled,
+            'interval_seconds': self.interval_seconds,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'runs_completed': self.runs_completed,
+            'runs_missed': self.runs_missed,
+            'last_error': self.last_error,
+        }
+
+
+class BotRuntimeState(Base):
+    """Checkpoint of a running Gods Hand loop so it can be resumed after a restart"""
+    __tablename__ = "bot_runtime_states"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    bot_type = Column(String, default="gods_hand")
+    running = Column(Boolean, default=False, index=True)
+    interval_seconds = Column(Integer, default=60)
+    # JSON blobs (Text for SQLite/Postgres portability)
+    breach_history = Column(Text, nullable=True)     # ISO timestamps of recent kill-switch breaches
+    last_decision = Column(Text, nullable=True)      # summary of the last gods_hand_once result
+    scheduler_state = Column(Text, nullable=True)    # EvaluationScheduler.export_state()
+    cached_position = Column(Text, nullable=True)    # position + last trade id it was computed from
+    iteration = Column(Integer, default=0)
+    checkpointed_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        import json
+        return {
+            'user_id': self.user_id,
+            'bot_type': self.bot_type,
+            'running': self.running,
+            'interval_seconds': self.interval_seconds,
+            'breach_history': json.loads(self.breach_history) if self.breach_history else [],
+            'last_decision': json.loads(self.last_decision) if self.last_decision else None,
+            'scheduler_state': json.loads(self.scheduler_state) if self.scheduler_state else None,
+            'cached_position': json.loads(self.cached_position) if self.cached_position else None,
+            'iteration': self.iteration,
+            'checkpointed_at': self.checkpointed_at.isoformat() if self.checkpointed_at else None,
+        }
+
+
+class OrderRecord(Base):
+    """Live order submitted through the order pipeline, with its latency timeline"""
+    __tablename__ = "order_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    client_order_id = Column(String, unique=True, nullable=False)  # newClientOrderId sent to the exchange
+    intent_key = Column(String, nullable=False, index=True)       # what the order is for; retries reuse it
+    symbol = Column(String, nullable=False)
+    side = Column(String, nullable=False)
+    quantity = Column(Float, nullable=False)
+    bot_type = Column(String, nullable=True)
+    # queued -> submitted -> acked -> filled | failed | canceled
+    # (unknown: submit and lookups failed; left for recover() to reconcile, never resent)
+    status = Column(String, default="queued", index=True)
+    exchange_order_id = Column(String, nullable=True)
+    executed_qty = Column(Float, nullable=True)
+    avg_price = Column(Float, nullable=True)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    trade_id = Column(Integer, ForeignKey('trades.id'), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    submitted_at = Column(DateTime, nullable=True)
+    acked_at = Column(DateTime, nullable=True)
+    filled_at = Column(DateTime, nullable=True)
+
+    def latency_ms(self):
+        def ms(start, end):
+            return round((end - start).total_seconds() * 1000, 1) if start and end else None
+        return {
+            'queue_ms': ms(self.created_at, self.submitted_at),
+            'submit_to_ack_ms': ms(self.submitted_at, self.acked_at),
+            'submit_to_fill_ms': ms(self.submitted_at, self.filled_at),
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'client_order_id': self.client_order_id,
+            'symbol': self.symbol,
+            'side': self.side,
+            'quantity': self.quantity,
+            'bot_type': self.bot_type,
+            'status': self.status,
+            'exchange_order_id': self.exchange_order_id,
+            'executed_qty': self.executed_qty,
+            'avg_price': self.avg_price,
+            'attempts': self.attempts,
+            'error': self.error,
+            'trade_id': self.trade_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'submitted_at': self.submitted_at.isoformat() if self.submitted_at else None,
+            'acked_at': self.acked_at.isoformat() if self.acked_at else None,
+            'filled_at': self.filled_at.isoformat() if self.filled_at else None,
+            'latency': self.latency_ms(),
+        }
+
+
+class Position(Base):
+    """Materialized position per user/symbol, maintained by app/position_ledger.py on every Trade flush"""
+    __tablename__ = "positions"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    symbol = Column(String, primary_key=True)
+    quantity = Column(Float, default=0.0)
+    cost_basis = Column(Float, default=0.0)
+    total_fees = Column(Float, default=0.0)
+    realized_pl = Column(Float, default=0.0)
+    trades_count = Column(Integer, default=0)
+    # Implicit 50/50 paper holding seeded because the history starts with a SELL
+    implicit_seed = Column(Boolean, default=False)
+    last_trade_id = Column(Integer, nullable=True)
+    last_trade_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+
+class TradeDailyRollup(Base):
+    """Per-day trade aggregates per user/symbol/bot/mode, maintained by app/trade_rollups.py"""
+    __tablename__ = "trade_daily_rollups"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    symbol = Column(String, primary_key=True)
+    bot_type = Column(String, primary_key=True)
+    mode = Column(String, primary_key=True)  # 'paper' or 'live'
+    day = Column(Date, primary_key=True)
+    buys = Column(Integer, default=0)
+    sells = Column(Integer, default=0)  # sells realized against a held position
+    buy_volume = Column(Float, default=0.0)
+    sell_volume = Column(Float, default=0.0)
+    buy_notional = Column(Float, default=0.0)
+    sell_notional = Column(Float, default=0.0)
+    realized_pl = Column(Float, default=0.0)
+    gross_profit = Column(Float, default=0.0)
+    gross_loss = Column(Float, default=0.0)
+    winning_trades = Column(Integer, default=0)
+    losing_trades = Column(Integer, default=0)
+    # Average-cost state at the end of the day: the next refresh continues from here
+    closing_quantity = Column(Float, default=0.0)
+    closing_cost = Column(Float, default=0.0)
+    implicit_seed = Column(Boolean, default=False)
+
+
+class TradeRollupState(Base):
+    """What the rollups of a user/symbol were computed from (stale when the trade history moves on)"""
+    __tablename__ = "trade_rollup_state"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    symbol = Column(String, primary_key=True)
+    last_trade_id = Column(Integer, nullable=True)
+    trades_count = Column(Integer, default=0)
+    ledger_version = Column(DateTime, nullable=True)
+    budget = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Decision(Base):
+    """One Gods Hand decision as typed columns (see app/decisions.py); the
+    AI_THINKING/AI_ACTION logs of the decision share its decision_id"""
+    __tablename__ = "decisions"
+
+    id = Column(Integer, primary_key=True)
+    decision_id = Column(String(32), unique=True, nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    symbol = Column(String, nullable=False)
+    paper_trading = Column(Boolean, default=True)
+    gods_mode = Column(Boolean, default=False)
+
+    # Model output and the final action after stop-loss / take-profit overrides
+    ai_action = Column(String(4))
+    action = Column(String(4), nullable=False)
+    confidence = Column(Float)
+    buy_signals = Column(Integer, default=0)
+    sell_signals = Column(Integer, default=0)
+    hold_signals = Column(Integer, default=0)
+
+    # Market at decision time
+    price = Column(Float)
+    rsi = Column(Float)
+    macd = Column(Float)
+    sma_20 = Column(Float)
+    sma_50 = Column(Float)
+    adx = Column(Float)
+    volatility = Column(Float)          # percent
+    regime = Column(String(16))         # Gods Mode classifier (TREND_UP, RANGE, ...)
+
+    # Position sizing
+    max_position_usd = Column(Float)
+    position_value_usd = Column(Float)
+    step_percent = Column(Float)
+    step_amount_usd = Column(Float)
+    fill_before = Column(Float)         # percent of max position
+    fill_after = Column(Float)
+
+    # Outcome
+    executed = Column(Boolean, default=False, nullable=False)
+    # low_confidence, position_limit, hold, no_depth, error; live orders: submitted until
+    # the order pipeline settles it (filled -> executed, order_failed/_canceled/_unknown)
+    block_reason = Column(String(24))
+    client_order_id = Column(String, nullable=True, index=True)  # live order placed for this decision
+    latency_ms = Column(Integer)        # gods_hand_once start -> outcome
+    extras = Column(LargeBinary)        # zlib-compressed compact JSON (signals, model debug, fill/order)
+
+    __table_args__ = (
+        Index('ix_decisions_user_ts_id', 'user_id', 'timestamp', 'id'),
+        Index('ix_decisions_user_symbol_ts', 'user_id', 'symbol', 'timestamp'),
+    )
+
+    def to_dict(self):
+        from app.decisions import unpack_extras
+        data = {column.name: getattr(self, column.name) for column in self.__table__.columns if column.name != 'extras'}
+        data['timestamp'] = self.timestamp.isoformat() + 'Z' if self.timestamp else None
+        data['extras'] = unpack_extras(self.extras)
+        return data
+
+
+# Keep the positions table in step with every Trade flushed through SessionLocal
+# (and through AsyncSessionLocal, whose sessions wrap AsyncBackedSession, and the
+# SQLite write queue's WriterSessionLocal)
+from app.db import SessionLocal, WriterSessionLocal  # noqa: E402
+from app.db_async import AsyncBackedSession  # noqa: E402
+_session_factories = [SessionLocal, AsyncBackedSession]
+if WriterSessionLocal is not SessionLocal:
+    _session_factories.append(WriterSessionLocal)
+
+from app.position_ledger import install as _install_position_ledger  # noqa: E402
+for _factory in _session_factories:
+    _install_position_ledger(_factory)
+
+# Drop cached account balances when a user's trades, config or keys change
+from app.balance_cache import install as _install_balance_cache  # noqa: E402
+for _factory in _session_factories:
+    _install_balance_cache(_factory)
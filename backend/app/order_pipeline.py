@@ -0,0 +1,487 @@
+"""
+Live Order Pipeline
+Market orders are queued per account and submitted by one worker task per
+account, so accounts go out in parallel (under the shared rate limiter) while
+each account's orders keep their order. Callers get the queued order record
+back immediately; `wait=True` blocks until the fill is confirmed.
+
+Idempotency: every order carries a deterministic newClientOrderId derived from
+(user, intent). Submitting the same intent twice returns the existing order
+instead of placing a second one. When a submit times out or fails with an
+unknown outcome, the order is looked up by that id (origClientOrderId) before
+retrying. Only a definite "order does not exist" (-2013) allows a resend:
+Binance only rejects a duplicate client id while the first order is open, and
+a filled market order is not. If the lookup itself keeps failing, the record
+is left "unknown" for reconciliation (recover() looks it up again) and is
+never resubmitted.
+
+Every order is persisted in order_records with submitted / acked / filled
+timestamps; in-flight orders are picked up again on startup (recover()).
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional
+
+import requests
+
+
+ORDER_MAX_RETRIES = int(os.getenv("ORDER_MAX_RETRIES", "3"))
+ORDER_RETRY_BACKOFF_SECONDS = float(os.getenv("ORDER_RETRY_BACKOFF_SECONDS", "0.5"))
+ORDER_FILL_TIMEOUT_SECONDS = float(os.getenv("ORDER_FILL_TIMEOUT_SECONDS", "30"))
+ORDER_FILL_POLL_SECONDS = float(os.getenv("ORDER_FILL_POLL_SECONDS", "1"))
+ORDER_LOOKUP_RETRIES = int(os.getenv("ORDER_LOOKUP_RETRIES", "3"))
+
+# Final record status -> outcome of the decision that placed the order (decisions table)
+DECISION_OUTCOMES = {
+    "filled": {"executed": True, "block_reason": None},
+    "failed": {"executed": False, "block_reason": "order_failed"},
+    "canceled": {"executed": False, "block_reason": "order_canceled"},
+    "unknown": {"executed": False, "block_reason": "order_unknown"},
+}
+
+FINAL_EXCHANGE_STATUSES = {"FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH"}
+# Records in these states block a new order for the same intent
+LIVE_RECORD_STATUSES = ("queued", "submitted", "acked", "filled", "unknown")
+
+
+def make_client_order_id(user_id: int, intent_key: str, generation: int = 0) -> str:
+    """Deterministic newClientOrderId (Binance allows up to 36 chars of [A-Za-z0-9_-])."""
+    digest = hashlib.sha256(f"{user_id}|{intent_key}|{generation}".encode()).hexdigest()
+    return f"gp{digest[:30]}"
+
+
+def _outcome_unknown(exc: Exception) -> bool:
+    """True when the exchange may have accepted the order despite the error."""
+    if isinstance(exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(exc, "response", None)
+    if response is None:
+        return False
+    if response.status_code >= 500 or response.status_code == 429:
+        return True
+    try:
+        return "duplicate" in response.text.lower()
+    except Exception:
+        return False
+
+
+def _order_missing(exc: Exception) -> bool:
+    """True only for Binance's definite "Order does not exist" (-2013)."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return False
+    try:
+        return response.json().get("code") == -2013
+    except Exception:
+        return "-2013" in (getattr(response, "text", "") or "")
+
+
+class OrderLookupFailed(Exception):
+    """The order could not be looked up; whether it exists is unknown."""
+
+
+def _notify_insufficient_balance(user_id: int, symbol: str, side: str, error: str):
+    """Email the user (notify_on_failure, at most once an hour) that an order bounced on balance."""
+    from app.db import SessionLocal
+    from app.email_utils import send_gmail
+    from app.models import BotConfig
+    from app.notification_limiter import can_send_notification, get_time_until_next, mark_notification_sent
+
+    db = SessionLocal()
+    try:
+        config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
+        if not config or not config.notification_email or not config.notify_on_failure:
+            return
+        if not can_send_notification(user_id, 'insufficient_balance', 1):
+            remaining = get_time_until_next(user_id, 'insufficient_balance', 1)
+            print(f"⏳ Notification 'insufficient_balance' rate limited. Can send again in {remaining:.1f} hours")
+            return
+        sent = send_gmail(
+            config.notification_email,
+            f"Gods Hand: Insufficient Balance for {symbol}",
+            f"AI attempted to {side.upper()} but account has insufficient balance.\n\nError: {error}",
+            config.gmail_user,
+            config.gmail_app_password,
+        )
+        if sent:
+            mark_notification_sent(user_id, 'insufficient_balance')
+    except Exception as e:
+        print(f"⚠️ Insufficient balance notification failed: {e}")
+    finally:
+        db.close()
+
+
+class OrderPipeline:
+    def __init__(self):
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self.latencies: Dict[int, Deque[dict]] = {}
+
+    # ----- submission -----
+
+    async def submit(self, user_id: int, symbol: str, side: str, quantity: float,
+                     bot_type: str, intent_key: str, wait: bool = False) -> dict:
+        """Queue a live market order for `intent_key`; dedupes repeated intents."""
+        from app.db import SessionLocal
+        from app.models import OrderRecord, User
+        from app.market import get_symbol_step_size, round_to_step
+
+        quantity = round_to_step(quantity, await get_symbol_step_size(symbol))
+        if quantity <= 0:
+            raise Exception(f"Order quantity rounds to zero for {symbol}")
+
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            if not user or not user.binance_api_key or not user.binance_api_secret:
+                raise Exception("API keys not configured")
+
+            previous = db.query(OrderRecord).filter(
+                OrderRecord.user_id == user_id, OrderRecord.intent_key == intent_key
+            ).all()
+            existing = next((r for r in previous if r.status in LIVE_RECORD_STATUSES), None)
+            if existing:
+                print(f"🔁 Order intent {intent_key} already {existing.status} as {existing.client_order_id}")
+                record = existing
+            else:
+                # Failed/canceled attempts for this intent get a fresh id
+                record = OrderRecord(
+                    user_id=user_id,
+                    client_order_id=make_client_order_id(user_id, intent_key, len(previous)),
+                    intent_key=intent_key,
+                    symbol=symbol,
+                    side=side.upper(),
+                    quantity=quantity,
+                    bot_type=bot_type,
+                    status="queued",
+                    created_at=datetime.utcnow(),
+                )
+                db.add(record)
+                db.commit()
+                self._enqueue(user_id, record.client_order_id)
+            client_order_id, result = record.client_order_id, record.to_dict()
+        finally:
+            db.close()
+
+        if wait and result["status"] not in ("filled", "failed", "canceled"):
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(self._waiter(client_order_id)), ORDER_FILL_TIMEOUT_SECONDS * 2
+                )
+            except asyncio.TimeoutError:
+                pass
+        return result
+
+    def _enqueue(self, user_id: int, client_order_id: str):
+        queue = self._queues.setdefault(user_id, asyncio.Queue())
+        queue.put_nowait(client_order_id)
+        if user_id not in self._workers:
+            self._workers[user_id] = asyncio.create_task(self._worker(user_id))
+
+    def _waiter(self, client_order_id: str) -> asyncio.Future:
+        future = self._waiters.get(client_order_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[client_order_id] = future
+        return future
+
+    async def _worker(self, user_id: int):
+        queue = self._queues[user_id]
+        try:
+            while True:
+                try:
+                    client_order_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    # No await between the empty check and removal, so _enqueue can't miss us
+                    self._workers.pop(user_id, None)
+                    return
+                try:
+                    await self._process(client_order_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"❌ Order pipeline error for {client_order_id}: {e}")
+        finally:
+            if self._workers.get(user_id) is asyncio.current_task():
+                self._workers.pop(user_id, None)
+
+    # ----- execution -----
+
+    def _client(self, db, user_id: int):
+        from app.auth import decrypt_api_key
+        from app.binance_client import get_binance_th_client
+        from app.models import User
+
+        user = db.query(User).filter(User.id == user_id).first()
+        return get_binance_th_client(decrypt_api_key(user.binance_api_key), decrypt_api_key(user.binance_api_secret))
+
+    async def _lookup(self, client, binance_symbol: str, client_order_id: str) -> Optional[dict]:
+        """The exchange's order, or None when it definitely does not exist.
+        Raises OrderLookupFailed when that can't be established."""
+        from app.rate_limiter import request_limiter
+
+        for attempt in range(1, ORDER_LOOKUP_RETRIES + 1):
+            await request_limiter.acquire()
+            try:
+                return await asyncio.to_thread(client.get_order, binance_symbol, client_order_id=client_order_id)
+            except Exception as e:
+                if _order_missing(e):
+                    return None
+                if attempt == ORDER_LOOKUP_RETRIES:
+                    raise OrderLookupFailed(str(e))
+                print(f"⚠️ Lookup of order {client_order_id} failed ({e}), retrying")
+                await asyncio.sleep(ORDER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    def _settle_decision(self, db, record):
+        """Copy the record's final status onto the decision that placed it (same transaction)."""
+        from sqlalchemy import update
+        from app.models import Decision
+        outcome = DECISION_OUTCOMES.get(record.status)
+        if outcome:
+            db.execute(update(Decision).where(Decision.client_order_id == record.client_order_id).values(**outcome))
+
+    def _mark_unknown(self, db, record, error: str):
+        from app.logging_models import Log, LogCategory, LogLevel
+
+        record.status = "unknown"
+        record.error = error
+        db.add(Log(
+            timestamp=datetime.utcnow(),
+            category=LogCategory.TRADING,
+            level=LogLevel.ERROR,
+            message=f"Order {record.side} {record.quantity:g} {record.symbol} outcome unknown "
+                    f"(not resent; will be looked up again on restart): {error}",
+            user_id=record.user_id,
+            symbol=record.symbol,
+            bot_type=record.bot_type,
+        ))
+        self._settle_decision(db, record)
+        db.commit()
+        print(f"❓ Order {record.client_order_id} outcome unknown: {error}")
+
+    async def _process(self, client_order_id: str):
+        from app.db import SessionLocal
+        from app.models import OrderRecord
+
+        db = SessionLocal()
+        record = None
+        try:
+            record = db.query(OrderRecord).filter(OrderRecord.client_order_id == client_order_id).first()
+            if record is None or record.status in ("filled", "failed", "canceled"):
+                return
+            client = self._client(db, record.user_id)
+            binance_symbol = record.symbol.replace('/', '')
+
+            order = None
+            if record.status in ("submitted", "acked", "unknown"):
+                # Recovered after a restart: it may already be on the exchange
+                try:
+                    order = await self._lookup(client, binance_symbol, client_order_id)
+                except OrderLookupFailed as e:
+                    self._mark_unknown(db, record, f"Lookup failed: {e}")
+                    return
+                if order is None and record.status == "unknown":
+                    # Reconciled: it never reached the exchange. Too late to place it now
+                    self._fail(db, record, "Outcome was unknown; exchange has no such order (not resent)")
+                    return
+            if order is None:
+                record.status = "submitted"
+                record.submitted_at = record.submitted_at or datetime.utcnow()
+                db.commit()
+                order = await self._submit_with_retry(db, record, client, binance_symbol)
+                if order is None:
+                    return
+
+            record.status = "acked"
+            record.acked_at = record.acked_at or datetime.utcnow()
+            record.exchange_order_id = str(order.get('orderId'))
+            db.commit()
+
+            order = await self._confirm_fill(client, binance_symbol, client_order_id, order)
+            self._finalize(db, record, order)
+        finally:
+            result = record.to_dict() if record is not None else None
+            db.close()
+            future = self._waiters.pop(client_order_id, None)
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    async def _submit_with_retry(self, db, record, client, binance_symbol: str) -> Optional[dict]:
+        from app.rate_limiter import acquire_order_slot
+
+        for attempt in range(1, ORDER_MAX_RETRIES + 1):
+            record.attempts = (record.attempts or 0) + 1
+            await acquire_order_slot(record.user_id)
+            try:
+                return await asyncio.to_thread(
+                    client.create_order, binance_symbol, record.side, 'MARKET',
+                    quantity=record.quantity, client_order_id=record.client_order_id
+                )
+            except Exception as e:
+                error = str(e)
+                response = getattr(e, "response", None)
+                if response is not None:
+                    try:
+                        error += f" Response: {response.text}"
+                    except Exception:
+                        pass
+                if not _outcome_unknown(e):
+                    self._fail(db, record, error)
+                    return None
+                # Timeout / 5xx: the order may exist. Resend only if the exchange says it doesn't
+                try:
+                    order = await self._lookup(client, binance_symbol, record.client_order_id)
+                except OrderLookupFailed as lookup_error:
+                    self._mark_unknown(db, record, f"{error}; lookup failed: {lookup_error}")
+                    return None
+                if order is not None:
+                    return order
+                if attempt == ORDER_MAX_RETRIES:
+                    self._fail(db, record, error)
+                    return None
+                print(f"⚠️ Order {record.client_order_id} attempt {attempt} failed ({error}), retrying")
+                await asyncio.sleep(ORDER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        return None
+
+    async def _confirm_fill(self, client, binance_symbol: str, client_order_id: str, order: dict) -> dict:
+        from app.rate_limiter import request_limiter
+
+        deadline = asyncio.get_running_loop().time() + ORDER_FILL_TIMEOUT_SECONDS
+        while order.get('status') not in FINAL_EXCHANGE_STATUSES and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(ORDER_FILL_POLL_SECONDS)
+            await request_limiter.acquire()
+            try:
+                order = await asyncio.to_thread(client.get_order, binance_symbol, client_order_id=client_order_id)
+            except Exception as e:
+                print(f"⚠️ Fill check failed for {client_order_id}: {e}")
+        return order
+
+    def _finalize(self, db, record, order: dict):
+        from app.models import Trade
+        from app.logging_models import Log, LogCategory, LogLevel
+
+        executed = float(order.get('executedQty') or 0)
+        quote = float(order.get('cummulativeQuoteQty') or 0)
+        exchange_status = order.get('status')
+        if exchange_status not in FINAL_EXCHANGE_STATUSES:
+            # Still open after the timeout: leave it acked, recover() checks again on restart
+            print(f"⏳ Order {record.client_order_id} not final after {ORDER_FILL_TIMEOUT_SECONDS}s ({exchange_status})")
+            return
+
+        record.executed_qty = executed
+        record.avg_price = (quote / executed) if executed > 0 else None
+        record.filled_at = datetime.utcnow()
+        if executed > 0:
+            trade = Trade(
+                user_id=record.user_id,
+                symbol=record.symbol,
+                side=record.side,
+                amount=executed,
+                price=record.avg_price,
+                filled_price=record.avg_price,
+                status="completed",
+                bot_type=record.bot_type,
+                timestamp=record.filled_at
+            )
+            db.add(trade)
+            db.flush()
+            record.trade_id = trade.id
+            record.status = "filled" if exchange_status == "FILLED" else "canceled"
+        else:
+            record.status = "canceled"
+            record.error = f"Exchange status {exchange_status}, nothing filled"
+
+        latency = record.latency_ms()
+        db.add(Log(
+            timestamp=datetime.utcnow(),
+            category=LogCategory.TRADING,
+            level=LogLevel.INFO if executed > 0 else LogLevel.WARNING,
+            message=f"Order {record.side} {executed:g} {record.symbol} {record.status} @ {record.avg_price or 0:.2f} "
+                    f"(fill {latency['submit_to_fill_ms']} ms)",
+            details=json.dumps(record.to_dict()),
+            user_id=record.user_id,
+            symbol=record.symbol,
+            bot_type=record.bot_type,
+        ))
+        self._settle_decision(db, record)
+        db.commit()
+        self.latencies.setdefault(record.user_id, deque(maxlen=100)).append(latency)
+
+    def _fail(self, db, record, error: str):
+        from app.logging_models import Log, LogCategory, LogLevel
+
+        record.status = "failed"
+        record.error = error
+        insufficient = "-2010" in error or "insufficient balance" in error.lower()
+        db.add(Log(
+            timestamp=datetime.utcnow(),
+            category=LogCategory.TRADING,
+            level=LogLevel.WARNING if insufficient else LogLevel.ERROR,
+            message=f"Order {record.side} {record.quantity:g} {record.symbol} failed: "
+                    f"{'Insufficient balance' if insufficient else error}",
+            user_id=record.user_id,
+            symbol=record.symbol,
+            bot_type=record.bot_type,
+        ))
+        self._settle_decision(db, record)
+        db.commit()
+        print(f"❌ Order {record.client_order_id} failed: {error}")
+        if insufficient:
+            # SMTP blocks; the executor keeps it off the event loop
+            asyncio.get_running_loop().run_in_executor(
+                None, _notify_insufficient_balance, record.user_id, record.symbol, record.side, error
+            )
+
+    # ----- lifecycle -----
+
+    def recover(self):
+        """Re-queue orders that were in flight when the process stopped."""
+        from app.db import SessionLocal
+        from app.models import OrderRecord
+
+        db = SessionLocal()
+        try:
+            pending = db.query(OrderRecord.user_id, OrderRecord.client_order_id).filter(
+                OrderRecord.status.in_(("queued", "submitted", "acked", "unknown"))
+            ).order_by(OrderRecord.id).all()
+        finally:
+            db.close()
+        for user_id, client_order_id in pending:
+            self._enqueue(user_id, client_order_id)
+        if pending:
+            print(f"♻️ Re-queued {len(pending)} in-flight order(s)")
+
+    async def stop(self):
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+    def status(self, user_id: int) -> Optional[dict]:
+        samples = list(self.latencies.get(user_id, ()))
+        queue = self._queues.get(user_id)
+        if not samples and not queue:
+            return None
+
+        def p50(key):
+            values = sorted(s[key] for s in samples if s.get(key) is not None)
+            return values[len(values) // 2] if values else None
+
+        return {
+            "queued": queue.qsize() if queue else 0,
+            "worker_active": user_id in self._workers,
+            "orders_completed": len(samples),
+            "submit_to_ack_ms_p50": p50("submit_to_ack_ms"),
+            "submit_to_fill_ms_p50": p50("submit_to_fill_ms"),
+            "queue_ms_p50": p50("queue_ms"),
+        }
+
+
+order_pipeline = OrderPipeline()
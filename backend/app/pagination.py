@@ -0,0 +1,77 @@
+"""
+Keyset Pagination
+List endpoints page newest-first on (timestamp, id) instead of OFFSET, so
+page N costs the same index range scan as page 1:
+
+- the cursor is an opaque token for the last row of the previous page;
+  the next page is `(timestamp, id) < cursor` in the same order
+- one extra row is fetched to know whether another page exists
+- totals are COUNTs cached per filter set for COUNT_CACHE_SECONDS, since
+  the dashboard asks for the same count on every poll
+"""
+import base64
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_
+
+
+COUNT_CACHE_SECONDS = float(os.getenv("COUNT_CACHE_SECONDS", "30"))
+COUNT_CACHE_MAX_ENTRIES = 10_000
+
+# key -> (counted_at, total)
+_count_cache: Dict[tuple, Tuple[float, int]] = {}
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(timestamp, id) from a cursor; ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def before_cursor(timestamp_column, id_column, cursor: str):
+    """Rows after the cursor in (timestamp DESC, id DESC) order (a row-value range both SQLite and Postgres index)."""
+    timestamp, row_id = decode_cursor(cursor)
+    return tuple_(timestamp_column, id_column) < tuple_(timestamp, row_id)
+
+
+def page_statement(entity, timestamp_column, id_column, filters, cursor: Optional[str], limit: int):
+    """SELECT for one page (limit + 1 rows) newest-first."""
+    if cursor:
+        filters = list(filters) + [before_cursor(timestamp_column, id_column, cursor)]
+    return (select(entity).where(*filters)
+            .order_by(timestamp_column.desc(), id_column.desc())
+            .limit(limit + 1))
+
+
+def split_page(rows, limit: int):
+    """(rows of this page, cursor for the next one or None)."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.timestamp, last.id)
+
+
+async def cached_count(db, key: tuple, id_column, filters, ttl: float = COUNT_CACHE_SECONDS) -> int:
+    """COUNT(*) for filters, reused for `ttl` seconds per key."""
+    now = time.monotonic()
+    hit = _count_cache.get(key)
+    if hit and now - hit[0] < ttl:
+        return hit[1]
+    total = (await db.execute(select(func.count(id_column)).where(*filters))).scalar() or 0
+    if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+        _count_cache.clear()
+    _count_cache[key] = (now, total)
+    return total
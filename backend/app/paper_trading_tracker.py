@@ -1,15 +1,29 @@
 """
 Paper Trading Performance Tracker
 Tracks balance, P/L, and trade performance over time for paper trading mode
+
+Snapshots are change-driven: one is written when the trade count changes, the
+balance moves by more than SNAPSHOT_MIN_CHANGE_PCT, or SNAPSHOT_HEARTBEAT_MINUTES
+pass without one. Every snapshot is also folded into hourly and daily rollups
+(paper_trading_rollups), and the history endpoint reads whichever resolution
+keeps the answer under SNAPSHOT_HISTORY_MAX_POINTS points.
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+import os
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
 from app.db import Base
-from app.models import Trade, BotConfig
+from app.models import BotConfig
 import json
 
 
+SNAPSHOT_MIN_CHANGE_PCT = float(os.getenv("SNAPSHOT_MIN_CHANGE_PCT", "0.1"))
+SNAPSHOT_HEARTBEAT_MINUTES = float(os.getenv("SNAPSHOT_HEARTBEAT_MINUTES", "60"))
+SNAPSHOT_HISTORY_MAX_POINTS = int(os.getenv("SNAPSHOT_HISTORY_MAX_POINTS", "300"))
+ROLLUP_RESOLUTIONS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+
 class PaperTradingSnapshot(Base):
     """Daily snapshot of paper trading performance"""
     __tablename__ = "paper_trading_snapshots"
@@ -47,164 +61,91 @@ class PaperTradingSnapshot(Base):
     max_drawdown = Column(Float, default=0.0)      # Max % loss from peak
     sharpe_ratio = Column(Float, default=0.0)       # Risk-adjusted return
 
+    __table_args__ = (
+        Index('ix_paper_snapshots_user_symbol_bot_ts', 'user_id', 'symbol', 'bot_type', 'timestamp'),
+    )
 
-def calculate_paper_performance(user_id: int, symbol: str, bot_type: str, db: Session, mode: str = 'paper', current_price: float = None) -> dict:
-    """Calculate current trading performance (paper or live)"""
-    # Get config
-    config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
-    if not config:
-        return None
-    
-    starting_balance = config.budget
-    
-    # Determine status filter based on mode
-    status_filter = ['completed_paper', 'simulated']
-    if mode == 'live':
-        status_filter = ['completed', 'completed_live']
-    
-    # Get all trades for this symbol
-    trades = db.query(Trade).filter(
-        Trade.user_id == user_id,
-        Trade.symbol == symbol,
-        Trade.bot_type == bot_type,
-        Trade.status.in_(status_filter)
-    ).order_by(Trade.timestamp).all()
-    
-    if not trades:
-        # No trades yet - return initial 50/50 split like the balance API
-        initial_cash = starting_balance / 2  # 50% in USDT
-        initial_position_value = starting_balance / 2  # 50% in asset value
-        
-        return {
-            'starting_balance': starting_balance,
-            'current_balance': starting_balance,
-            'cash_balance': initial_cash,  # FIX: Should be 50% of budget, not 0
-            'position_value': initial_position_value,  # FIX: Should be 50% of budget
-            'quantity_held': 0.0,  # Will be calculated by market.py based on current price
-            'avg_buy_price': 0.0,
-            'current_price': 0.0,
-            'realized_pl': 0.0,
-            'unrealized_pl': 0.0,
-            'total_pl': 0.0,
-            'pl_percent': 0.0,
-            'total_trades': 0,
-            'buy_trades': 0,
-            'sell_trades': 0,
-            'winning_trades': 0,
-            'losing_trades': 0,
-            'win_rate': 0.0
-        }
-    
-    # Calculate position
-    # Start from a 50/50 allocation by default (half cash, half position) so
-    # that if there are trades but no prior BUYs (e.g. a lone SELL), we don't
-    # incorrectly treat the account as all cash. We'll model an implicit
-    # initial buy for performance calculation at the first trade price.
-    quantity_held = 0.0
-    total_cost = 0.0
-    cash_balance = starting_balance
-    realized_pl = 0.0
-    
-    buy_trades = []
-    sell_trades = []
-    
-    # If the first trade is a SELL and there are no prior BUYs, assume an
-    # implicit initial position representing the 50% allocation at the price
-    # of the first trade. This preserves the expected UX where starting
-    # balances are split 50/50 until explicit buys/sells change them.
-    
-    # Check if we have any BUY trades
-    buy_trades_check = [t for t in trades if t.side == 'BUY']
-    
-    # Only apply implicit 50/50 if we have trades but NO buys (i.e. started with a SELL)
-    if trades and not buy_trades_check:
-        first_price = trades[0].filled_price or trades[0].price
-        if first_price and first_price > 0:
-            # implicit 50% position value
-            implicit_position_value = starting_balance / 2.0
-            quantity_held = implicit_position_value / first_price
-            total_cost = quantity_held * first_price
-            cash_balance = starting_balance - implicit_position_value
-
-    for trade in trades:
-        price = trade.filled_price or trade.price
-        amount = trade.amount
-        cost = amount * price
-        
-        if trade.side == 'BUY':
-            quantity_held += amount
-            total_cost += cost
-            cash_balance -= cost
-            buy_trades.append(trade)
-        elif trade.side == 'SELL':
-            # Calculate realized P/L for this sale
-            if quantity_held > 0:
-                avg_cost = total_cost / quantity_held if quantity_held > 0 else 0
-                sale_pl = (price - avg_cost) * amount
-                realized_pl += sale_pl
-                
-                # Update position
-                quantity_held -= amount
-                if quantity_held > 0:
-                    total_cost = quantity_held * avg_cost
-                else:
-                    total_cost = 0
-                
-                cash_balance += cost
-                sell_trades.append((trade, sale_pl))
-    
-    # Get current market price
-    if current_price is None:
-        current_price = trades[-1].filled_price or trades[-1].price
-    
-    # Calculate unrealized P/L on remaining position
-    avg_buy_price = total_cost / quantity_held if quantity_held > 0 else 0
-    unrealized_pl = (current_price - avg_buy_price) * quantity_held if quantity_held > 0 else 0
-    
-    # Total balance
-    position_value = quantity_held * current_price
-    current_balance = cash_balance + position_value
-    total_pl = current_balance - starting_balance
-    pl_percent = (total_pl / starting_balance * 100) if starting_balance > 0 else 0
-    
-    # Win/loss statistics
-    winning_trades = len([t for t, pl in sell_trades if pl > 0])
-    losing_trades = len([t for t, pl in sell_trades if pl <= 0])
-    total_closed_trades = len(sell_trades)
-    win_rate = (winning_trades / total_closed_trades * 100) if total_closed_trades > 0 else 0
-    
-    return {
-        'starting_balance': starting_balance,
-        'current_balance': current_balance,
-        'cash_balance': cash_balance,
-        'position_value': position_value,
-        'quantity_held': quantity_held,
-        'avg_buy_price': avg_buy_price,
-        'current_price': current_price,
-        'realized_pl': realized_pl,
-        'unrealized_pl': unrealized_pl,
-        'total_pl': total_pl,
-        'pl_percent': pl_percent,
-        'total_trades': len(trades),
-        'buy_trades': len(buy_trades),
-        'sell_trades': total_closed_trades,
-        'winning_trades': winning_trades,
-        'losing_trades': losing_trades,
-        'win_rate': win_rate
-    }
-
-
-def save_paper_snapshot(user_id: int, symbol: str, bot_type: str, db: Session):
-    """Save current paper trading performance as a snapshot"""
-    perf = calculate_paper_performance(user_id, symbol, bot_type, db)
+
+class PaperTradingRollup(Base):
+    """Hourly/daily aggregate of paper trading snapshots (open/high/low/close balance)"""
+    __tablename__ = "paper_trading_rollups"
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    symbol = Column(String, primary_key=True)
+    bot_type = Column(String, primary_key=True)
+    resolution = Column(String, primary_key=True)  # 'hour' or 'day'
+    bucket = Column(DateTime, primary_key=True)    # bucket start (UTC)
+
+    samples = Column(Integer, default=0)
+    open_balance = Column(Float, default=0.0)
+    high_balance = Column(Float, default=0.0)
+    low_balance = Column(Float, default=0.0)
+    close_balance = Column(Float, default=0.0)
+    total_pl = Column(Float, default=0.0)
+    pl_percent = Column(Float, default=0.0)
+    total_trades = Column(Integer, default=0)
+    win_rate = Column(Float, default=0.0)
+    last_snapshot_at = Column(DateTime, nullable=True)
+
+
+# Last snapshot written per (user_id, symbol, bot_type): (timestamp, total_trades, current_balance)
+_last_snapshot: Dict[Tuple[int, str, str], Tuple[datetime, int, float]] = {}
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    if resolution == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def calculate_paper_performance(user_id: int, symbol: str, bot_type: str, db: Session, mode: str = 'paper',
+                                current_price: float = None, config: BotConfig = None) -> dict:
+    """Calculate current trading performance (paper or live); see app/performance_engine.py.
+    Pass `config` when the caller already loaded it.
+    """
+    from app.performance_engine import performance_engine
+    return performance_engine.performance(user_id, symbol, bot_type, db, mode, current_price, config)
+
+
+def snapshot_changed(perf: dict, last: Optional[Tuple[datetime, int, float]], now: datetime) -> bool:
+    """Whether perf differs enough from the last snapshot to be worth storing."""
+    if last is None:
+        return True
+    last_at, last_trades, last_balance = last
+    if perf['total_trades'] != last_trades:
+        return True
+    if now - last_at >= timedelta(minutes=SNAPSHOT_HEARTBEAT_MINUTES):
+        return True
+    if last_balance:
+        return abs(perf['current_balance'] - last_balance) / abs(last_balance) * 100 >= SNAPSHOT_MIN_CHANGE_PCT
+    return perf['current_balance'] != last_balance
+
+
+def save_paper_snapshot(user_id: int, symbol: str, bot_type: str, db: Session, current_price: float = None,
+                        config: BotConfig = None, force: bool = False):
+    """Save current paper trading performance as a snapshot, unless nothing changed (see snapshot_changed)"""
+    perf = calculate_paper_performance(user_id, symbol, bot_type, db, current_price=current_price, config=config)
     if not perf:
         return
+
+    key = (user_id, symbol, bot_type)
+    now = datetime.utcnow()
+    if key not in _last_snapshot:
+        last = db.query(PaperTradingSnapshot).filter(
+            PaperTradingSnapshot.user_id == user_id,
+            PaperTradingSnapshot.symbol == symbol,
+            PaperTradingSnapshot.bot_type == bot_type,
+        ).order_by(PaperTradingSnapshot.timestamp.desc()).first()
+        if last:
+            _last_snapshot[key] = (last.timestamp, last.total_trades, last.current_balance)
+    if not force and not snapshot_changed(perf, _last_snapshot.get(key), now):
+        return None
     
     snapshot = PaperTradingSnapshot(
         user_id=user_id,
         symbol=symbol,
         bot_type=bot_type,
-        timestamp=datetime.utcnow(),
+        timestamp=now,
         starting_balance=perf['starting_balance'],
         current_balance=perf['current_balance'],
         quantity_held=perf['quantity_held'],
@@ -219,16 +160,136 @@ def save_paper_snapshot(user_id: int, symbol: str, bot_type: str, db: Session):
         losing_trades=perf['losing_trades'],
         win_rate=perf['win_rate']
     )
+    # Risk columns from the daily closes so far plus this balance
+    from app.risk_metrics import risk_metrics
+    closes = [c for (c,) in db.query(PaperTradingRollup.close_balance).filter(
+        PaperTradingRollup.user_id == user_id,
+        PaperTradingRollup.symbol == symbol,
+        PaperTradingRollup.bot_type == bot_type,
+        PaperTradingRollup.resolution == 'day',
+        PaperTradingRollup.bucket < bucket_start(now, 'day')
+    ).order_by(PaperTradingRollup.bucket).all()]
+    risk = risk_metrics([perf['starting_balance']] + closes + [perf['current_balance']], periods_per_year=365)
+    snapshot.max_drawdown = risk.get('max_drawdown_pct', 0.0)
+    snapshot.sharpe_ratio = risk.get('sharpe_ratio', 0.0)
     
     db.add(snapshot)
+    apply_snapshot_to_rollups(db, snapshot)
     db.commit()
+    _last_snapshot[key] = (now, perf['total_trades'], perf['current_balance'])
     return snapshot
 
 
-def get_paper_performance_history(user_id: int, symbol: str, bot_type: str, days: int, db: Session) -> list:
-    """Get paper trading performance history for the last N days"""
+def apply_snapshot_to_rollups(db: Session, snapshot: PaperTradingSnapshot):
+    """Fold one snapshot into its hourly and daily buckets (in the caller's transaction)."""
+    for resolution in ROLLUP_RESOLUTIONS:
+        bucket = bucket_start(snapshot.timestamp, resolution)
+        row = db.get(PaperTradingRollup, (snapshot.user_id, snapshot.symbol, snapshot.bot_type, resolution, bucket))
+        balance = snapshot.current_balance
+        if row is None:
+            row = PaperTradingRollup(
+                user_id=snapshot.user_id, symbol=snapshot.symbol, bot_type=snapshot.bot_type,
+                resolution=resolution, bucket=bucket, samples=0,
+                open_balance=balance, high_balance=balance, low_balance=balance,
+            )
+            db.add(row)
+        elif row.last_snapshot_at and snapshot.timestamp < row.last_snapshot_at:
+            # Out-of-order snapshot: only the range and count change
+            row.samples += 1
+            row.high_balance = max(row.high_balance, balance)
+            row.low_balance = min(row.low_balance, balance)
+            continue
+        row.samples += 1
+        row.high_balance = max(row.high_balance, balance)
+        row.low_balance = min(row.low_balance, balance)
+        row.close_balance = balance
+        row.total_pl = snapshot.total_pl
+        row.pl_percent = snapshot.pl_percent
+        row.total_trades = snapshot.total_trades
+        row.win_rate = snapshot.win_rate
+        row.last_snapshot_at = snapshot.timestamp
+
+
+def backfill_snapshot_rollups(db: Session) -> int:
+    """Roll up snapshots of user/symbol/bot keys that have none yet (history from before rollups)."""
+    have = set(db.query(PaperTradingRollup.user_id, PaperTradingRollup.symbol, PaperTradingRollup.bot_type).distinct().all())
+    keys = db.query(PaperTradingSnapshot.user_id, PaperTradingSnapshot.symbol, PaperTradingSnapshot.bot_type).distinct().all()
+    missing = [tuple(k) for k in keys if tuple(k) not in have]
+    for user_id, symbol, bot_type in missing:
+        snapshots = db.query(PaperTradingSnapshot).filter(
+            PaperTradingSnapshot.user_id == user_id,
+            PaperTradingSnapshot.symbol == symbol,
+            PaperTradingSnapshot.bot_type == bot_type,
+        ).order_by(PaperTradingSnapshot.timestamp).yield_per(1000)
+        for snapshot in snapshots:
+            apply_snapshot_to_rollups(db, snapshot)
+            db.flush()
+        db.commit()
+    return len(missing)
+
+
+def delete_snapshot_rollups(db: Session, user_id: int, symbol: Optional[str] = None):
+    """Drop rollups (and the change-detection cache) together with their snapshots."""
+    query = db.query(PaperTradingRollup).filter(PaperTradingRollup.user_id == user_id)
+    if symbol:
+        query = query.filter(PaperTradingRollup.symbol == symbol)
+    query.delete(synchronize_session=False)
+    for key in [k for k in _last_snapshot if k[0] == user_id and (not symbol or k[1] == symbol)]:
+        del _last_snapshot[key]
+
+
+def pick_history_resolution(user_id: int, symbol: str, bot_type: str, days: int, db: Session,
+                            max_points: int = None) -> str:
+    """Finest resolution ('raw', 'hour', 'day') that keeps `days` of history under max_points."""
+    max_points = max_points or SNAPSHOT_HISTORY_MAX_POINTS
     cutoff = datetime.utcnow() - timedelta(days=days)
-    
+    raw_points = db.query(func.count(PaperTradingSnapshot.id)).filter(
+        PaperTradingSnapshot.user_id == user_id,
+        PaperTradingSnapshot.symbol == symbol,
+        PaperTradingSnapshot.bot_type == bot_type,
+        PaperTradingSnapshot.timestamp >= cutoff
+    ).scalar() or 0
+    if raw_points <= max_points:
+        return 'raw'
+    if days * 24 <= max_points:
+        return 'hour'
+    return 'day'
+
+
+def get_paper_performance_history(user_id: int, symbol: str, bot_type: str, days: int, db: Session,
+                                  resolution: str = 'raw', max_points: int = None) -> list:
+    """Get paper trading performance history for the last N days at 'raw', 'hour' or 'day' resolution"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    if resolution in ROLLUP_RESOLUTIONS:
+        rows = db.query(PaperTradingRollup).filter(
+            PaperTradingRollup.user_id == user_id,
+            PaperTradingRollup.symbol == symbol,
+            PaperTradingRollup.bot_type == bot_type,
+            PaperTradingRollup.resolution == resolution,
+            PaperTradingRollup.bucket >= bucket_start(cutoff, resolution)
+        ).order_by(PaperTradingRollup.bucket).all()
+        points = [{
+            'timestamp': r.bucket.isoformat(),
+            'current_balance': r.close_balance,
+            'open_balance': r.open_balance,
+            'high_balance': r.high_balance,
+            'low_balance': r.low_balance,
+            'total_pl': r.total_pl,
+            'pl_percent': r.pl_percent,
+            'total_trades': r.total_trades,
+            'win_rate': r.win_rate,
+            'samples': r.samples
+        } for r in rows]
+        # Very long ranges at daily resolution: keep every n-th bucket plus the latest,
+        # leaving room for the latest so the result stays within max_points
+        max_points = max_points or SNAPSHOT_HISTORY_MAX_POINTS
+        if len(points) > max_points:
+            step = -(-(len(points) - 1) // max(max_points - 1, 1))
+            sampled = points[:-1:step]
+            sampled.append(points[-1])
+            points = sampled
+        return points
+
     snapshots = db.query(PaperTradingSnapshot).filter(
         PaperTradingSnapshot.user_id == user_id,
         PaperTradingSnapshot.symbol == symbol,
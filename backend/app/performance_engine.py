@@ -0,0 +1,247 @@
+"""
+Unified Performance Engine
+One pass over a user's trades for a symbol produces, for every (bot_type, mode)
+scope at once: position held, average cost, cash, realized P/L, fees, buy/sell
+counts, win/loss stats and a timeline of realized sells (prefix sums, so any
+"last N days" window is two bisects).
+
+Results are memoized by (user, symbol, budget, last trade id, ledger version),
+so repeated dashboard calls (balance, paper performance, Gods Hand
+performance) reuse the same pass until a trade is recorded or edited. The
+ledger version is positions.updated_at, which changes on every edit/delete the
+position ledger sees, not only on inserts.
+
+mode: 'paper' = completed_paper/simulated trades, 'live' = completed/completed_live.
+"""
+import os
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import BotConfig, Position, Trade
+
+
+PERFORMANCE_CACHE_SIZE = int(os.getenv("PERFORMANCE_CACHE_SIZE", "1024"))
+FEE_RATE = 0.001  # same 0.1% the position ledger charges
+MODE_STATUSES = {
+    'paper': ('completed_paper', 'simulated'),
+    'live': ('completed', 'completed_live'),
+}
+_STATUS_MODE = {status: mode for mode, statuses in MODE_STATUSES.items() for status in statuses}
+
+
+class ScopeStats:
+    """Average-cost accounting for one (bot_type, mode) scope, fed trade by trade."""
+
+    def __init__(self, starting_balance: float):
+        self.starting_balance = starting_balance
+        self.quantity_held = 0.0
+        self.total_cost = 0.0
+        self.cash_balance = starting_balance
+        self.realized_pl = 0.0
+        self.total_fees = 0.0
+        self.total_trades = 0
+        self.buy_trades = 0
+        self.sell_trades = 0
+        self.winning_trades = 0
+        self.losing_trades = 0
+        self.last_price = 0.0
+        # Timelines (sorted, since trades arrive in time order) for windowed stats
+        self.buy_times = []
+        self.sell_times = []
+        self.cum_pl = []
+        self.cum_wins = []
+        self.cum_gross_profit = []
+        self.cum_gross_loss = []
+        # Seeded twin used while the history has no BUY (implicit 50/50 start)
+        self.seeded: Optional["ScopeStats"] = None
+        self.seen_buy = False
+
+    def seed(self, price: float):
+        implicit_position_value = self.starting_balance / 2.0
+        self.quantity_held = implicit_position_value / price
+        self.total_cost = self.quantity_held * price
+        self.cash_balance = self.starting_balance - implicit_position_value
+
+    def add(self, ts: datetime, side: str, amount: float, price: float):
+        if self.total_trades == 0 and side == 'SELL' and price > 0:
+            # Histories that start with a SELL are valued from an implicit 50% holding
+            # if they never BUY; track that variant alongside until a BUY shows up
+            self.seeded = ScopeStats(self.starting_balance)
+            self.seeded.seed(price)
+        if side == 'BUY':
+            self.seen_buy = True
+            self.seeded = None
+        elif self.seeded is not None:
+            self.seeded._apply(ts, side, amount, price)
+        self._apply(ts, side, amount, price)
+
+    def _apply(self, ts: datetime, side: str, amount: float, price: float):
+        cost = amount * price
+        self.total_trades += 1
+        self.total_fees += cost * FEE_RATE
+        self.last_price = price
+        if side == 'BUY':
+            self.quantity_held += amount
+            self.total_cost += cost
+            self.cash_balance -= cost
+            self.buy_trades += 1
+            self.buy_times.append(ts)
+        elif side == 'SELL' and self.quantity_held > 0:
+            avg_cost = self.total_cost / self.quantity_held
+            sale_pl = (price - avg_cost) * amount
+            self.realized_pl += sale_pl
+            self.quantity_held -= amount
+            self.total_cost = self.quantity_held * avg_cost if self.quantity_held > 0 else 0
+            self.cash_balance += cost
+            self.sell_trades += 1
+            won = sale_pl > 0
+            self.winning_trades += won
+            self.losing_trades += not won
+            self.sell_times.append(ts)
+            self.cum_pl.append(self.realized_pl)
+            self.cum_wins.append(self.winning_trades)
+            self.cum_gross_profit.append((self.cum_gross_profit[-1] if self.cum_gross_profit else 0.0) + max(sale_pl, 0.0))
+            self.cum_gross_loss.append((self.cum_gross_loss[-1] if self.cum_gross_loss else 0.0) + max(-sale_pl, 0.0))
+
+    def final(self) -> "ScopeStats":
+        return self.seeded if (self.seeded is not None and not self.seen_buy) else self
+
+    def result(self, current_price: Optional[float] = None) -> dict:
+        """Same shape as the historical calculate_paper_performance() output."""
+        if current_price is None:
+            current_price = self.last_price
+        quantity_held = self.quantity_held
+        avg_buy_price = self.total_cost / quantity_held if quantity_held > 0 else 0
+        unrealized_pl = (current_price - avg_buy_price) * quantity_held if quantity_held > 0 else 0
+        position_value = quantity_held * current_price
+        current_balance = self.cash_balance + position_value
+        total_pl = current_balance - self.starting_balance
+        return {
+            'starting_balance': self.starting_balance,
+            'current_balance': current_balance,
+            'cash_balance': self.cash_balance,
+            'position_value': position_value,
+            'quantity_held': quantity_held,
+            'avg_buy_price': avg_buy_price,
+            'current_price': current_price,
+            'realized_pl': self.realized_pl,
+            'unrealized_pl': unrealized_pl,
+            'total_pl': total_pl,
+            'pl_percent': (total_pl / self.starting_balance * 100) if self.starting_balance > 0 else 0,
+            'total_fees': self.total_fees,
+            'total_trades': self.total_trades,
+            'buy_trades': self.buy_trades,
+            'sell_trades': self.sell_trades,
+            'winning_trades': self.winning_trades,
+            'losing_trades': self.losing_trades,
+            'win_rate': (self.winning_trades / self.sell_trades * 100) if self.sell_trades > 0 else 0,
+        }
+
+    def window(self, since: datetime) -> dict:
+        """Buy/sell counts and realized stats for sells at or after `since`."""
+        def before(cum, i):
+            return cum[i - 1] if i > 0 else 0
+
+        b = bisect_left(self.buy_times, since)
+        s = bisect_left(self.sell_times, since)
+        sells = len(self.sell_times) - s
+        wins = (self.cum_wins[-1] - before(self.cum_wins, s)) if sells else 0
+        return {
+            'buys': len(self.buy_times) - b,
+            'sells': sells,
+            'winning_trades': wins,
+            'losing_trades': sells - wins,
+            'realized_pl': (self.cum_pl[-1] - before(self.cum_pl, s)) if sells else 0.0,
+            'gross_profit': (self.cum_gross_profit[-1] - before(self.cum_gross_profit, s)) if sells else 0.0,
+            'gross_loss': (self.cum_gross_loss[-1] - before(self.cum_gross_loss, s)) if sells else 0.0,
+        }
+
+
+def no_trades_performance(starting_balance: float) -> dict:
+    # No trades yet - initial 50/50 split like the balance API
+    return {
+        'starting_balance': starting_balance,
+        'current_balance': starting_balance,
+        'cash_balance': starting_balance / 2,  # 50% in USDT
+        'position_value': starting_balance / 2,  # 50% in asset value
+        'quantity_held': 0.0,  # Will be calculated by market.py based on current price
+        'avg_buy_price': 0.0,
+        'current_price': 0.0,
+        'realized_pl': 0.0,
+        'unrealized_pl': 0.0,
+        'total_pl': 0.0,
+        'pl_percent': 0.0,
+        'total_fees': 0.0,
+        'total_trades': 0,
+        'buy_trades': 0,
+        'sell_trades': 0,
+        'winning_trades': 0,
+        'losing_trades': 0,
+        'win_rate': 0.0
+    }
+
+
+class PerformanceEngine:
+    def __init__(self, max_entries: int = PERFORMANCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._memo: "OrderedDict[Tuple, Dict[Tuple[str, str], ScopeStats]]" = OrderedDict()
+        self.passes = 0
+        self.hits = 0
+
+    def scopes(self, user_id: int, symbol: str, db: Session, budget: float) -> Dict[Tuple[str, str], ScopeStats]:
+        """All (bot_type, mode) scopes for a symbol, from the memo or one pass over its trades."""
+        last_trade_id, version = db.execute(
+            select(func.max(Trade.id), Position.updated_at)
+            .select_from(Trade)
+            .outerjoin(Position, (Position.user_id == Trade.user_id) & (Position.symbol == Trade.symbol))
+            .where(Trade.user_id == user_id, Trade.symbol == symbol)
+            .group_by(Position.updated_at)
+        ).first() or (None, None)
+        key = (user_id, symbol, budget, last_trade_id, version)
+        cached = self._memo.get(key)
+        if cached is not None:
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        rows = db.execute(
+            select(Trade.bot_type, Trade.status, Trade.side, Trade.amount, Trade.price, Trade.filled_price, Trade.timestamp)
+            .where(Trade.user_id == user_id, Trade.symbol == symbol, Trade.status.in_(tuple(_STATUS_MODE)))
+            .order_by(Trade.timestamp, Trade.id)
+        ).all()
+        scopes: Dict[Tuple[str, str], ScopeStats] = {}
+        for bot_type, status, side, amount, price, filled_price, ts in rows:
+            scope_key = (bot_type, _STATUS_MODE[status])
+            stats = scopes.get(scope_key)
+            if stats is None:
+                stats = scopes[scope_key] = ScopeStats(budget)
+            stats.add(ts, side, amount or 0.0, filled_price or price or 0.0)
+        scopes = {k: s.final() for k, s in scopes.items()}
+        self.passes += 1
+
+        self._memo[key] = scopes
+        if len(self._memo) > self.max_entries:
+            self._memo.popitem(last=False)
+        return scopes
+
+    def performance(self, user_id: int, symbol: str, bot_type: str, db: Session, mode: str = 'paper',
+                    current_price: Optional[float] = None, config: Optional[BotConfig] = None) -> Optional[dict]:
+        if config is None:
+            config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
+        if not config:
+            return None
+        stats = self.scopes(user_id, symbol, db, config.budget).get((bot_type, mode))
+        if stats is None or stats.total_trades == 0:
+            return no_trades_performance(config.budget)
+        return stats.result(current_price)
+
+    def status(self) -> dict:
+        return {"entries": len(self._memo), "passes": self.passes, "hits": self.hits}
+
+
+performance_engine = PerformanceEngine()
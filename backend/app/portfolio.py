@@ -0,0 +1,133 @@
+"""
+Gods Hand Portfolio Mode
+Trades several symbols from one budget. BotConfig.portfolio_symbols holds
+budget weights, e.g. {"BTC/USDT": 0.6, "ETH/USDT": 0.4} (a plain list means
+equal weights).
+
+One iteration:
+1. fetches candles + ticker for every symbol concurrently
+2. computes every position once, plus the combined unrealized P/L that the
+   loop's single kill-switch check uses
+3. runs gods_hand_once for all symbols concurrently on the prefetched data,
+   each sized against its weight of the shared budget
+"""
+import asyncio
+import json
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+
+def parse_portfolio_symbols(raw) -> Dict[str, float]:
+    """Normalized {symbol: weight} (weights sum to 1); {} if unset or invalid."""
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw) if isinstance(raw, str) else raw
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(data, list):
+        data = {symbol: 1.0 for symbol in data}
+    weights = {str(k): float(v) for k, v in data.items() if float(v) > 0}
+    total = sum(weights.values())
+    return {k: v / total for k, v in weights.items()} if total > 0 else {}
+
+
+def portfolio_mode(config) -> bool:
+    return bool(getattr(config, 'portfolio_enabled', False)) and bool(
+        parse_portfolio_symbols(getattr(config, 'portfolio_symbols', None))
+    )
+
+
+class SymbolSlice:
+    """BotConfig view for one portfolio symbol: own symbol and budget share, rest delegated."""
+
+    def __init__(self, config, symbol: str, budget: float):
+        self._config = config
+        self.symbol = symbol
+        self.budget = budget
+
+    def __getattr__(self, name):
+        return getattr(self._config, name)
+
+
+async def fetch_portfolio_market(symbols) -> Dict[str, dict]:
+    """Candles (1h x100) and ticker for all symbols at once; failed symbols map to {}."""
+    from app.market import get_market_snapshot
+
+    symbols = list(symbols)
+    results = await asyncio.gather(*(get_market_snapshot(s) for s in symbols), return_exceptions=True)
+    market = {}
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Portfolio market data failed for {symbol}: {result}")
+            market[symbol] = {}
+        else:
+            market[symbol] = result
+    return market
+
+
+def portfolio_pl(user_id: int, config, db: Session, market: Dict[str, dict]) -> Tuple[dict, Dict[str, dict]]:
+    """Combined unrealized P/L across all portfolio symbols, plus each symbol's position."""
+    from app.position_tracker import get_current_position, calculate_position_pl
+
+    weights = parse_portfolio_symbols(config.portfolio_symbols)
+    positions, current_value, cost_basis = {}, 0.0, 0.0
+    for symbol in weights:
+        position = get_current_position(user_id, symbol, db)
+        positions[symbol] = position
+        ticker = market.get(symbol, {}).get("ticker")
+        if not ticker or position.get('_paper_initial'):
+            continue
+        pl = calculate_position_pl(position, ticker['last'])
+        current_value += pl['current_value']
+        cost_basis += pl['cost_basis']
+
+    pl_percent = ((current_value - cost_basis) / cost_basis * 100) if cost_basis > 0 else 0.0
+    combined = {
+        "current_value": current_value,
+        "cost_basis": cost_basis,
+        "pl_usd": current_value - cost_basis,
+        "pl_percent": pl_percent,
+    }
+    return combined, positions
+
+
+async def portfolio_once(user_id: int, config, market: Optional[Dict[str, dict]] = None) -> dict:
+    """Evaluate and trade every portfolio symbol concurrently against the shared budget."""
+    from app.db import SessionLocal
+    from app.bots import gods_hand_once
+
+    weights = parse_portfolio_symbols(config.portfolio_symbols)
+    if market is None:
+        market = await fetch_portfolio_market(weights)
+
+    async def run(symbol: str, weight: float):
+        if not market.get(symbol):
+            return {"status": "error", "symbol": symbol, "message": "No market data"}
+        # Sessions are not shareable between concurrent tasks
+        db = SessionLocal()
+        try:
+            view = SymbolSlice(config, symbol, config.budget * weight)
+            return await gods_hand_once(user_id, view, db, market=market[symbol])
+        finally:
+            db.close()
+
+    symbols = list(weights)
+    results = await asyncio.gather(*(run(s, weights[s]) for s in symbols), return_exceptions=True)
+    per_symbol = {}
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            per_symbol[symbol] = {"status": "error", "message": str(result)}
+        else:
+            per_symbol[symbol] = result
+
+    actions = [r.get("action") for r in per_symbol.values() if r.get("status") == "success"]
+    return {
+        "status": "success",
+        "mode": "paper" if config.paper_trading else "live",
+        "portfolio": True,
+        "weights": weights,
+        "action": ",".join(actions) if actions else "HOLD",
+        "results": per_symbol,
+    }
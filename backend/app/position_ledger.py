@@ -0,0 +1,241 @@
+"""
+Materialized Position Ledger
+The positions table holds quantity, cost basis, fees and realized P/L per
+user/symbol, so a position lookup is a primary-key read (or an in-memory dict
+hit) instead of a replay of the whole trade history.
+
+Maintenance is transactional: an after_flush hook folds every newly flushed
+completed Trade into its positions row on the same connection, so the row
+commits or rolls back together with the trade. The in-memory mirror is only
+updated after the commit. Anything that can't be applied incrementally
+(edited or deleted trades, trades older than the last applied one, the first
+BUY after an implicit paper seed) rebuilds that row from history instead.
+Rows also depend on the user's BotConfig (paper_trading and budget decide the
+implicit 50/50 seed), so flushing a change to either rebuilds all of that
+user's rows.
+
+Bulk deletes bypass ORM events: callers that delete trades with
+query.delete() must call position_ledger.rebuild() / forget() themselves.
+"""
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.models import BotConfig, Position, Trade
+from app.position_tracker import (
+    COMPLETED_STATUSES, apply_trade, empty_state, no_trades_position,
+    replay_trades, state_to_position,
+)
+
+
+Key = Tuple[int, str]
+_PENDING = "position_ledger_pending"
+# Columns whose change invalidates an already-applied trade
+_TRADE_FIELDS = ("status", "amount", "price", "filled_price", "side", "symbol", "user_id", "timestamp")
+# BotConfig columns the replay reads
+_CONFIG_FIELDS = ("paper_trading", "budget")
+_STATE_FIELDS = tuple(empty_state())
+# Core table: rows are read as plain mappings so no stale Position objects sit in a session
+positions = Position.__table__
+
+
+class PositionLedger:
+    def __init__(self):
+        self.mirror: Dict[Key, dict] = {}
+
+    # ----- reads -----
+
+    def get(self, user_id: int, symbol: str, db: Session) -> dict:
+        key = (user_id, symbol)
+        state = self.mirror.get(key) if self._mirror_trusted() else None
+        if state is None:
+            row = db.execute(
+                select(positions).where(positions.c.user_id == user_id, positions.c.symbol == symbol)
+            ).mappings().first()
+            if row is not None:
+                state = {field: row[field] for field in _STATE_FIELDS}
+            else:
+                # Not materialized yet (e.g. history from before the ledger): replay once
+                state = self._replay(db.connection(), user_id, symbol)
+            if key not in db.info.get(_PENDING, {}):
+                self.mirror[key] = state
+        if state["trades_count"] == 0:
+            return no_trades_position(user_id, symbol, db)
+        return state_to_position(symbol, state)
+
+    @staticmethod
+    def _mirror_trusted() -> bool:
+        # With pool workers, other processes write trades this mirror never sees
+        from app.bot_pool import pool_enabled
+        return not pool_enabled()
+
+    # ----- maintenance -----
+
+    def _replay(self, conn, user_id: int, symbol: str) -> dict:
+        trades = conn.execute(
+            select(Trade.id, Trade.side, Trade.amount, Trade.price, Trade.filled_price, Trade.timestamp)
+            .where(Trade.user_id == user_id, Trade.symbol == symbol, Trade.status.in_(COMPLETED_STATUSES))
+            .order_by(Trade.timestamp, Trade.id)
+        ).all()
+        config = conn.execute(
+            select(BotConfig.paper_trading, BotConfig.budget).where(BotConfig.user_id == user_id)
+        ).first()
+        return replay_trades(trades, bool(config and config.paper_trading), (config.budget or 0.0) if config else 0.0)
+
+    def _write(self, conn, key: Key, state: dict, exists: bool):
+        values = {field: state[field] for field in _STATE_FIELDS}
+        values["updated_at"] = datetime.utcnow()
+        if exists:
+            conn.execute(update(Position).where(Position.user_id == key[0], Position.symbol == key[1]).values(**values))
+        else:
+            conn.execute(insert(Position).values(user_id=key[0], symbol=key[1], **values))
+
+    def rebuild(self, db: Session, user_id: int, symbol: Optional[str] = None):
+        """Recompute rows from history inside db's transaction (all symbols if symbol is None)."""
+        conn = db.connection()
+        if symbol is None:
+            symbols = {s for (s,) in conn.execute(select(Position.symbol).where(Position.user_id == user_id))}
+            symbols |= {s for (s,) in conn.execute(select(Trade.symbol).where(Trade.user_id == user_id).distinct())}
+        else:
+            symbols = {symbol}
+        pending = db.info.setdefault(_PENDING, {})
+        for sym in symbols:
+            key = (user_id, sym)
+            conn.execute(delete(Position).where(Position.user_id == user_id, Position.symbol == sym))
+            state = self._replay(conn, user_id, sym)
+            self._write(conn, key, state, exists=False)
+            pending[key] = state
+
+    def forget(self, db: Session, user_id: int):
+        """Drop every row for a user (before deleting the user)."""
+        db.execute(delete(Position).where(Position.user_id == user_id))
+        pending = db.info.setdefault(_PENDING, {})
+        for key in [k for k in self.mirror if k[0] == user_id]:
+            pending[key] = None
+
+    def backfill(self, db: Session) -> int:
+        """Materialize every user/symbol with trades but no row yet; returns rows created."""
+        have = set(db.execute(select(Position.user_id, Position.symbol)).all())
+        keys = [tuple(k) for k in db.execute(select(Trade.user_id, Trade.symbol).distinct()).all()]
+        missing = [k for k in keys if k not in have and k[1] is not None]
+        conn = db.connection()
+        for user_id, symbol in missing:
+            self._write(conn, (user_id, symbol), self._replay(conn, user_id, symbol), exists=False)
+        db.commit()
+        return len(missing)
+
+    def verify(self, db: Session, user_id: int, symbol: str) -> dict:
+        """Compare the ledger with a full replay of the trade history."""
+        from app.position_tracker import rebuild_position
+
+        ledger = self.get(user_id, symbol, db)
+        replayed = rebuild_position(user_id, symbol, db)
+        mismatches = {k: (ledger.get(k), v) for k, v in replayed.items() if ledger.get(k) != v}
+        return {"symbol": symbol, "match": not mismatches, "ledger": ledger, "replayed": replayed, "mismatches": mismatches}
+
+    # ----- session hooks -----
+
+    def after_flush(self, session: Session, flush_context):
+        new: Dict[Key, list] = {}
+        stale = set()
+        reseed = set()
+        for obj in session.new:
+            if isinstance(obj, Trade) and obj.status in COMPLETED_STATUSES:
+                new.setdefault((obj.user_id, obj.symbol), []).append(obj)
+        for obj in session.dirty:
+            if isinstance(obj, Trade) and session.is_modified(obj):
+                changed = False
+                attrs = inspect(obj).attrs
+                for field in _TRADE_FIELDS:
+                    history = attrs[field].history
+                    if history.has_changes():
+                        changed = True
+                        if field in ("symbol", "user_id") and history.deleted:
+                            old_user = history.deleted[0] if field == "user_id" else obj.user_id
+                            old_symbol = history.deleted[0] if field == "symbol" else obj.symbol
+                            stale.add((old_user, old_symbol))
+                if changed:
+                    stale.add((obj.user_id, obj.symbol))
+            elif isinstance(obj, BotConfig) and self._config_changed(obj):
+                reseed.add(obj.user_id)
+        for obj in session.deleted:
+            if isinstance(obj, Trade):
+                stale.add((obj.user_id, obj.symbol))
+        if not new and not stale and not reseed:
+            return
+
+        conn = session.connection()
+        pending = session.info.setdefault(_PENDING, {})
+        for key, trades in new.items():
+            if key in stale:
+                continue
+            row = conn.execute(
+                select(positions).where(positions.c.user_id == key[0], positions.c.symbol == key[1]).with_for_update()
+            ).mappings().first()
+            trades.sort(key=lambda t: (t.timestamp, t.id))
+            if row is None or not self._can_append(row, trades):
+                stale.add(key)
+                continue
+            state = {field: row[field] for field in _STATE_FIELDS}
+            for trade in trades:
+                apply_trade(state, trade)
+            self._write(conn, key, state, exists=True)
+            pending[key] = state
+
+        for key in stale:
+            if key[1] is None:
+                continue
+            exists = conn.execute(
+                select(Position.user_id).where(Position.user_id == key[0], Position.symbol == key[1]).with_for_update()
+            ).first() is not None
+            state = self._replay(conn, *key)
+            self._write(conn, key, state, exists=exists)
+            pending[key] = state
+
+        for user_id in reseed:
+            self.rebuild(session, user_id)
+
+    @staticmethod
+    def _config_changed(config: BotConfig) -> bool:
+        attrs = inspect(config).attrs
+        for field in _CONFIG_FIELDS:
+            history = attrs[field].history
+            # No deleted value means the old one was never loaded: assume it changed
+            if history.added and (not history.deleted or history.added[0] != history.deleted[0]):
+                return True
+        return False
+
+    @staticmethod
+    def _can_append(row, trades: list) -> bool:
+        if row["last_trade_at"] is not None and (trades[0].timestamp, trades[0].id) < (row["last_trade_at"], row["last_trade_id"] or 0):
+            return False  # back-dated trade: order matters for average cost
+        if row["implicit_seed"] and any(t.side == 'BUY' for t in trades):
+            return False  # the implicit seed only exists while the history has no BUY
+        if row["trades_count"] == 0 and trades[0].side != 'BUY':
+            return False  # first trades: the replay decides whether to seed
+        return True
+
+    def after_commit(self, session: Session):
+        pending = session.info.pop(_PENDING, None)
+        if not pending:
+            return
+        for key, state in pending.items():
+            if state is None:
+                self.mirror.pop(key, None)
+            else:
+                self.mirror[key] = state
+
+    def after_rollback(self, session: Session):
+        session.info.pop(_PENDING, None)
+
+
+position_ledger = PositionLedger()
+
+
+def install(session_factory):
+    """Attach the ledger hooks to a sessionmaker (done for SessionLocal in app/db.py)."""
+    event.listen(session_factory, "after_flush", position_ledger.after_flush)
+    event.listen(session_factory, "after_commit", position_ledger.after_commit)
+    event.listen(session_factory, "after_soft_rollback", lambda session, previous: position_ledger.after_rollback(session))
@@ -45,125 +45,110 @@ def calculate_position_pl(current_position: Dict, current_price: float) -> Dict:
     }
 
 
-def get_current_position(user_id: int, symbol: str, db: Session) -> Dict:
+BINANCE_FEE_RATE = 0.001  # 0.1% trading fee
+COMPLETED_STATUSES = ('completed_paper', 'completed_live', 'completed')
+
+
+def empty_state() -> Dict:
+    return {
+        "quantity": 0.0,
+        "cost_basis": 0.0,
+        "total_fees": 0.0,
+        "realized_pl": 0.0,
+        "trades_count": 0,
+        "implicit_seed": False,
+        "last_trade_id": None,
+        "last_trade_at": None,
+    }
+
+
+def seed_implicit_position(state: Dict, first_trade, budget: float):
+    """Paper history starting with a SELL: assume 50% of budget was held at the first trade's price."""
+    first_trade_price = first_trade.filled_price or first_trade.price or 0.0
+    if first_trade_price > 0:
+        implicit_value = budget / 2.0
+        state["quantity"] = implicit_value / first_trade_price
+        state["cost_basis"] = implicit_value
+        state["implicit_seed"] = True
+
+
+def apply_trade(state: Dict, trade) -> Dict:
+    """Fold one completed trade into a position state (weighted average cost, fees included)."""
+    trade_amount = trade.amount  # Crypto quantity (e.g., 0.01 BTC)
+    trade_price = trade.filled_price or trade.price
+    trade_value = trade_amount * trade_price  # USD value
+    state["trades_count"] += 1
+
+    # Calculate trading fee (fee is paid in the asset being received)
+    if trade.side == 'BUY':
+        # When buying: pay fee in crypto (you receive slightly less crypto)
+        fee_in_crypto = trade_amount * BINANCE_FEE_RATE
+        fee_in_usd = fee_in_crypto * trade_price
+
+        # Add to position
+        state["quantity"] += trade_amount - fee_in_crypto  # Net crypto received after fee
+        state["cost_basis"] += trade_value  # Total USD spent (fee already deducted from quantity)
+        state["total_fees"] += fee_in_usd
+
+    elif trade.side == 'SELL':
+        # When selling: pay fee in USD (you receive slightly less USD)
+        fee_in_usd = trade_value * BINANCE_FEE_RATE
+
+        # Calculate cost of the sold portion to maintain accurate Cost Basis
+        # (Weighted Average Cost method)
+        if state["quantity"] > 0:
+            avg_price_before_sell = state["cost_basis"] / state["quantity"]
+            cost_of_sold_portion = trade_amount * avg_price_before_sell
+        else:
+            cost_of_sold_portion = 0.0
+
+        # Remove from position
+        state["quantity"] -= trade_amount
+        # Reduce cost basis by the COST of what was sold, not the VALUE it was sold for
+        state["cost_basis"] -= cost_of_sold_portion
+        state["total_fees"] += fee_in_usd
+        state["realized_pl"] += trade_value - fee_in_usd - cost_of_sold_portion
+
+    state["last_trade_id"] = trade.id
+    state["last_trade_at"] = trade.timestamp
+    return state
+
+
+def replay_trades(trades, paper_trading: bool, budget: float) -> Dict:
+    """Position state from a full trade history ordered by (timestamp, id)."""
+    state = empty_state()
+
+    # If there are trades but no BUYs (e.g., a lone SELL recorded in paper mode),
+    # initialize an implicit 50/50 starting position so that SELLs are applied
+    # against a reasonable starting holding instead of creating negative quantity.
+    try:
+        if trades and paper_trading and not any((t.side or '').upper() == 'BUY' for t in trades):
+            seed_implicit_position(state, trades[0], budget)
+    except Exception:
+        # Fail-safe: if anything goes wrong with implicit init, continue normally
+        pass
+
+    for trade in trades:
+        apply_trade(state, trade)
+    return state
+
+
+def state_to_position(symbol: str, state: Dict) -> Dict:
     """
-    Calculate current position for a symbol including fees.
-    
-    Returns:
+    Position dict as returned by get_current_position():
         {
             "symbol": "BTC/USDT",
             "quantity": 0.05,  # Current holdings (BTC amount)
             "cost_basis": 2500.0,  # Total cost including fees (USD)
             "average_price": 50000.0,  # Average buy price per unit
             "total_fees_paid": 2.5,  # Cumulative trading fees
+            "realized_pl": 12.3,  # Realized P/L of sells (after fees)
             "position_value_usd": 2500.0,  # Based on average cost
             "trades_count": 5  # Number of trades that built this position
         }
     """
-    from app.models import BotConfig
-    
-    # Get all trades for this symbol (both paper and live)
-    trades = db.query(Trade).filter(
-        Trade.user_id == user_id,
-        Trade.symbol == symbol,
-        Trade.status.in_(['completed_paper', 'completed_live', 'completed'])
-    ).order_by(Trade.timestamp).all()
-    
-    if not trades:
-        # No trades yet - check if paper trading mode
-        config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
-        if config and config.paper_trading:
-            # Paper trading: Start with 50% position (simulated initial holdings)
-            # This allows testing both BUY and SELL immediately
-            budget = config.budget
-            
-            # We need current price to calculate quantity
-            # Return a special flag so caller knows to get price
-            return {
-                "symbol": symbol,
-                "quantity": 0.0,
-                "cost_basis": 0.0,
-                "average_price": 0.0,
-                "total_fees_paid": 0.0,
-                "position_value_usd": 0.0,
-                "trades_count": 0,
-                "_paper_initial": True,  # Flag for paper trading initial state
-                "_budget": budget
-            }
-        
-        return {
-            "symbol": symbol,
-            "quantity": 0.0,
-            "cost_basis": 0.0,
-            "average_price": 0.0,
-            "total_fees_paid": 0.0,
-            "position_value_usd": 0.0,
-            "trades_count": 0
-        }
-    
-    # Calculate position using FIFO (First In, First Out)
-    quantity = 0.0
-    cost_basis = 0.0
-    total_fees = 0.0
-    trades_count = 0
-
-    # If there are trades but no BUYs (e.g., a lone SELL recorded in paper mode),
-    # initialize an implicit 50/50 starting position so that SELLs are applied
-    # against a reasonable starting holding instead of creating negative quantity.
-    try:
-        buy_trades = [t for t in trades if (t.side or '').upper() == 'BUY']
-        if len(trades) > 0 and len(buy_trades) == 0:
-            # Only SELLs exist. If user is in paper trading, create implicit initial
-            # holdings equal to 50% of the budget at the price of the first trade.
-            from app.models import BotConfig
-            config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
-            if config and config.paper_trading:
-                first_trade_price = trades[0].filled_price or trades[0].price or 0.0
-                if first_trade_price > 0:
-                    implicit_value = config.budget / 2.0
-                    quantity = implicit_value / first_trade_price
-                    cost_basis = implicit_value
-    except Exception:
-        # Fail-safe: if anything goes wrong with implicit init, continue normally
-        pass
-    
-    BINANCE_FEE_RATE = 0.001  # 0.1% trading fee
-    
-    for trade in trades:
-        trades_count += 1
-        trade_amount = trade.amount  # Crypto quantity (e.g., 0.01 BTC)
-        trade_price = trade.filled_price or trade.price
-        trade_value = trade_amount * trade_price  # USD value
-        
-        # Calculate trading fee (fee is paid in the asset being received)
-        if trade.side == 'BUY':
-            # When buying: pay fee in crypto (you receive slightly less crypto)
-            fee_in_crypto = trade_amount * BINANCE_FEE_RATE
-            fee_in_usd = fee_in_crypto * trade_price
-            
-            # Add to position
-            quantity += trade_amount - fee_in_crypto  # Net crypto received after fee
-            cost_basis += trade_value  # Total USD spent (fee already deducted from quantity)
-            total_fees += fee_in_usd
-            
-        elif trade.side == 'SELL':
-            # When selling: pay fee in USD (you receive slightly less USD)
-            fee_in_usd = trade_value * BINANCE_FEE_RATE
-            
-            # Calculate cost of the sold portion to maintain accurate Cost Basis
-            # (Weighted Average Cost method)
-            if quantity > 0:
-                avg_price_before_sell = cost_basis / quantity
-                cost_of_sold_portion = trade_amount * avg_price_before_sell
-            else:
-                cost_of_sold_portion = 0.0
-
-            # Remove from position
-            quantity -= trade_amount
-            # Reduce cost basis by the COST of what was sold, not the VALUE it was sold for
-            cost_basis -= cost_of_sold_portion 
-            total_fees += fee_in_usd
-    
+    quantity = state["quantity"]
+    cost_basis = state["cost_basis"]
     # Handle floating point errors (if quantity is near zero, reset cost basis)
     if quantity <= 0.00000001:
         quantity = 0.0
@@ -172,18 +157,60 @@ def get_current_position(user_id: int, symbol: str, db: Session) -> Dict:
     else:
         # Calculate average price (avoid division by zero)
         average_price = (cost_basis / quantity) if quantity > 0 else 0.0
-    
+
     return {
         "symbol": symbol,
         "quantity": round(quantity, 8),
         "cost_basis": round(cost_basis, 2),
         "average_price": round(average_price, 2),
-        "total_fees_paid": round(total_fees, 2),
+        "total_fees_paid": round(state["total_fees"], 2),
+        "realized_pl": round(state["realized_pl"], 2),
         "position_value_usd": round(cost_basis, 2),  # Current value based on cost
-        "trades_count": trades_count
+        "trades_count": state["trades_count"]
     }
 
 
+def no_trades_position(user_id: int, symbol: str, db: Session) -> Dict:
+    from app.models import BotConfig
+
+    position = state_to_position(symbol, empty_state())
+    config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
+    if config and config.paper_trading:
+        # Paper trading: Start with 50% position (simulated initial holdings)
+        # This allows testing both BUY and SELL immediately.
+        # We need current price to calculate quantity, so return a flag for the caller
+        position["_paper_initial"] = True  # Flag for paper trading initial state
+        position["_budget"] = config.budget
+    return position
+
+
+def get_current_position(user_id: int, symbol: str, db: Session) -> Dict:
+    """
+    Current position for a symbol including fees (see state_to_position for the shape).
+    Reads the materialized ledger (app/position_ledger.py): O(1) regardless of trade count.
+    """
+    from app.position_ledger import position_ledger
+    return position_ledger.get(user_id, symbol, db)
+
+
+def rebuild_position(user_id: int, symbol: str, db: Session) -> Dict:
+    """Replay the full trade history, bypassing the ledger (used for verification)."""
+    from app.models import BotConfig
+
+    trades = db.query(Trade).filter(
+        Trade.user_id == user_id,
+        Trade.symbol == symbol,
+        Trade.status.in_(COMPLETED_STATUSES)
+    ).order_by(Trade.timestamp, Trade.id).all()
+
+    if not trades:
+        return no_trades_position(user_id, symbol, db)
+
+    config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
+    paper = bool(config and config.paper_trading)
+    return state_to_position(symbol, replay_trades(trades, paper, config.budget if config else 0.0))
+
+
 def calculate_incremental_amount(
     current_position: Dict,
     max_position_size: float,
@@ -0,0 +1,74 @@
+"""
+Shared Price Feed
+One polling task per symbol fans ticker updates out to every subscriber
+(grid engines, risk checks) instead of each consumer polling on its own.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+PRICE_FEED_POLL_SECONDS = float(os.getenv("PRICE_FEED_POLL_SECONDS", "2"))
+
+TickCallback = Callable[[str, dict], Awaitable[None]]
+
+
+class PriceFeed:
+    def __init__(self, poll_seconds: float = PRICE_FEED_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._subscribers: Dict[str, List[TickCallback]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.last_tick: Dict[str, dict] = {}
+
+    def subscribe(self, symbol: str, callback: TickCallback) -> Callable[[], None]:
+        """Register `callback(symbol, ticker)`; returns an unsubscribe function."""
+        self._subscribers.setdefault(symbol, []).append(callback)
+        task = self._tasks.get(symbol)
+        if task is None or task.done():
+            self._tasks[symbol] = asyncio.create_task(self._poll(symbol))
+
+        def unsubscribe():
+            callbacks = self._subscribers.get(symbol, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(symbol, None)
+                poll_task = self._tasks.pop(symbol, None)
+                if poll_task:
+                    poll_task.cancel()
+
+        return unsubscribe
+
+    def latest(self, symbol: str) -> Optional[dict]:
+        return self.last_tick.get(symbol)
+
+    async def _poll(self, symbol: str):
+        from app.market import get_current_price
+
+        while self._subscribers.get(symbol):
+            try:
+                ticker = await get_current_price(symbol)
+                self.last_tick[symbol] = ticker
+                callbacks = list(self._subscribers.get(symbol, []))
+                results = await asyncio.gather(
+                    *(cb(symbol, ticker) for cb in callbacks), return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"⚠️ Price feed subscriber error for {symbol}: {result}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Price feed poll failed for {symbol}: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        self._subscribers.clear()
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+price_feed = PriceFeed()
@@ -0,0 +1,62 @@
+"""
+Exchange Rate Limiting
+Async token buckets shared by everything that sends signed requests to
+Binance TH (order placement, cancels, order queries), so bursts such as a grid
+placing a few hundred ladder orders stay under the exchange limits.
+"""
+import asyncio
+import os
+import time
+from typing import Dict
+
+
+# Binance spot default: 50 orders / 10s per account, 6000 request weight / min per IP
+ORDER_RATE_PER_SECOND = float(os.getenv("EXCHANGE_ORDER_RATE_PER_SECOND", "5"))
+ORDER_BURST = int(os.getenv("EXCHANGE_ORDER_BURST", "10"))
+REQUEST_RATE_PER_SECOND = float(os.getenv("EXCHANGE_REQUEST_RATE_PER_SECOND", "20"))
+REQUEST_BURST = int(os.getenv("EXCHANGE_REQUEST_BURST", "40"))
+
+
+class AsyncTokenBucket:
+    """Token bucket: `acquire()` waits until `weight` tokens are available."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = max(rate_per_second, 0.001)
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, weight: float = 1.0):
+        # The lock keeps waiters FIFO so a large burst drains in order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= weight:
+                    self._tokens -= weight
+                    return
+                await asyncio.sleep((weight - self._tokens) / self.rate)
+
+
+# Shared IP-wide request budget and per-account order budgets
+request_limiter = AsyncTokenBucket(REQUEST_RATE_PER_SECOND, REQUEST_BURST)
+_order_limiters: Dict[int, AsyncTokenBucket] = {}
+
+
+def get_order_limiter(user_id: int) -> AsyncTokenBucket:
+    limiter = _order_limiters.get(user_id)
+    if limiter is None:
+        limiter = AsyncTokenBucket(ORDER_RATE_PER_SECOND, ORDER_BURST)
+        _order_limiters[user_id] = limiter
+    return limiter
+
+
+async def acquire_order_slot(user_id: int):
+    """Wait for both the account's order budget and the shared request budget."""
+    await get_order_limiter(user_id).acquire()
+    await request_limiter.acquire()
@@ -0,0 +1,353 @@
+"""
+Tick-Driven Risk Engine
+Keeps each running Gods Hand user's position, cost basis and high-water mark
+in memory and checks hard stop-loss, trailing take-profit and kill-switch on
+every price-feed tick instead of once per loop interval.
+
+Thresholds are converted to trigger prices whenever the position or config
+changes, so a tick is a handful of float comparisons (O(1), no DB access):
+- hard stop:     P/L < -hard_stop_loss_percent                 -> sell everything
+- trailing TP:   armed once P/L >= trailing_take_profit_percent; then exits
+                 exit_step_percent of the position when price gives back
+                 RISK_TP_GIVEBACK of the gain above break-even since the high
+- kill-switch:   effective P/L < -max_daily_loss for kill_switch_consecutive_breaches
+                 evaluation intervals in a row -> same stop path as the loop
+                 (trigger_kill_switch). Ticks within one loop interval count as a
+                 single breach, so the setting means the same as in the loop.
+
+The loop re-syncs state every iteration (cached position, fresh config), and
+every exit re-reads the position from the DB. Tick-to-exit latency is measured
+from tick receipt to the exit trade being recorded (live: fill confirmed by the
+order pipeline).
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, Optional
+
+
+# Fraction of the gain above break-even given back from the high before the trailing TP fires
+RISK_TP_GIVEBACK = float(os.getenv("RISK_TP_GIVEBACK", "0.5"))
+RISK_LATENCY_SAMPLES = int(os.getenv("RISK_LATENCY_SAMPLES", "100"))
+
+
+@dataclass
+class RiskState:
+    user_id: int
+    symbol: str
+    paper: bool
+    quantity: float = 0.0
+    cost_basis: float = 0.0
+    exit_step_percent: float = 100.0
+
+    # Precomputed trigger prices (None = check disabled)
+    stop_price: Optional[float] = None
+    kill_price: Optional[float] = None
+    tp_activation_price: Optional[float] = None
+    break_even_price: float = 0.0
+
+    high_water_mark: float = 0.0
+    trailing_armed: bool = False
+    required_breaches: int = 1
+    breaches: int = 0
+    # Seconds per counted breach (the loop's interval) and when the last one was counted
+    breach_interval_seconds: float = 60.0
+    last_breach_at: Optional[float] = None
+    kill_switch_enabled: bool = True
+    cooldown_until: Optional[datetime] = None
+    exiting: bool = False
+
+    def trailing_exit_price(self) -> Optional[float]:
+        if not self.trailing_armed:
+            return None
+        return self.break_even_price + (self.high_water_mark - self.break_even_price) * (1 - RISK_TP_GIVEBACK)
+
+
+@dataclass
+class RiskStats:
+    ticks: int = 0
+    eval_ns_total: int = 0
+    exits: int = 0
+    latencies_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=RISK_LATENCY_SAMPLES))
+    last_exit: Optional[dict] = None
+
+
+class RiskEngine:
+    def __init__(self):
+        # symbol -> user_id -> state, so a tick only visits that symbol's watchers
+        self.states: Dict[str, Dict[int, RiskState]] = {}
+        self.stats: Dict[int, RiskStats] = {}
+        self._unsubscribe: Dict[str, Callable[[], None]] = {}
+
+    # ----- registration -----
+
+    def sync(self, user_id: int, config, position: dict, kill_switch: bool = True, symbol: Optional[str] = None,
+             interval_seconds: Optional[float] = None):
+        """(Re)load thresholds and position for one user/symbol; subscribes to its price feed."""
+        symbol = symbol or config.symbol
+        state = self.states.get(symbol, {}).get(user_id)
+        if state is None:
+            state = RiskState(user_id=user_id, symbol=symbol, paper=bool(config.paper_trading))
+            self.states.setdefault(symbol, {})[user_id] = state
+            self.stats.setdefault(user_id, RiskStats())
+        state.paper = bool(config.paper_trading)
+        state.exit_step_percent = config.exit_step_percent or 100.0
+        state.required_breaches = max(1, config.kill_switch_consecutive_breaches or 1)
+        if interval_seconds:
+            state.breach_interval_seconds = float(interval_seconds)
+        state.kill_switch_enabled = kill_switch
+        state.cooldown_until = None
+        if config.kill_switch_last_trigger and config.kill_switch_cooldown_minutes:
+            state.cooldown_until = config.kill_switch_last_trigger + timedelta(minutes=config.kill_switch_cooldown_minutes)
+
+        quantity = 0.0 if position.get('_paper_initial') else float(position.get('quantity', 0.0) or 0.0)
+        cost_basis = float(position.get('cost_basis', 0.0) or 0.0)
+        if quantity != state.quantity or cost_basis != state.cost_basis:
+            # New position: the high-water mark starts over
+            state.high_water_mark = 0.0
+            state.trailing_armed = False
+        state.quantity, state.cost_basis = quantity, cost_basis
+        self._compute_triggers(state, config)
+
+        if symbol not in self._unsubscribe:
+            from app.price_feed import price_feed
+            self._unsubscribe[symbol] = price_feed.subscribe(symbol, self.on_tick)
+
+    def _compute_triggers(self, state: RiskState, config):
+        if state.quantity <= 0 or state.cost_basis <= 0:
+            state.stop_price = state.kill_price = state.tp_activation_price = None
+            state.break_even_price = 0.0
+            return
+        # P/L% = (qty * price - cost) / cost * 100  =>  price at P/L x% = cost * (1 + x/100) / qty
+        unit = state.cost_basis / state.quantity
+        state.break_even_price = unit
+        state.stop_price = (
+            unit * (1 - config.hard_stop_loss_percent / 100) if config.hard_stop_loss_percent is not None else None
+        )
+        state.tp_activation_price = (
+            unit * (1 + config.trailing_take_profit_percent / 100) if config.trailing_take_profit_percent is not None else None
+        )
+        if config.max_daily_loss is not None:
+            baseline = config.kill_switch_baseline or 0.0
+            state.kill_price = unit * (1 + (baseline - config.max_daily_loss) / 100)
+        else:
+            state.kill_price = None
+
+    def unregister(self, user_id: int):
+        for symbol in list(self.states):
+            self.states[symbol].pop(user_id, None)
+        self._release_unused_feeds()
+
+    def _release_unused_feeds(self):
+        for symbol in list(self.states):
+            if not self.states[symbol]:
+                del self.states[symbol]
+        for symbol in list(self._unsubscribe):
+            if symbol not in self.states:
+                self._unsubscribe.pop(symbol)()
+
+    def stop(self):
+        self.states.clear()
+        self._release_unused_feeds()
+
+    # ----- hot path -----
+
+    async def on_tick(self, symbol: str, ticker: dict):
+        received = time.perf_counter()
+        price = ticker.get('last') or 0.0
+        if price <= 0:
+            return
+        exits = []
+        for user_id, state in list(self.states.get(symbol, {}).items()):
+            started = time.perf_counter_ns()
+            reason = self.evaluate(state, price)
+            stats = self.stats[user_id]
+            stats.ticks += 1
+            stats.eval_ns_total += time.perf_counter_ns() - started
+            if reason:
+                state.exiting = True
+                exits.append(self._exit(state, reason, price, received))
+        if exits:
+            await asyncio.gather(*exits, return_exceptions=True)
+
+    def evaluate(self, state: RiskState, price: float) -> Optional[str]:
+        """Threshold check for one tick; returns the exit reason, if any."""
+        if state.exiting or state.quantity <= 0:
+            return None
+
+        if state.stop_price is not None and price < state.stop_price:
+            return "hard_stop_loss"
+
+        if state.kill_switch_enabled and state.kill_price is not None:
+            if state.cooldown_until is not None and datetime.utcnow() < state.cooldown_until:
+                state.breaches, state.last_breach_at = 0, None
+            elif price < state.kill_price:
+                now = time.monotonic()
+                if state.last_breach_at is None or now - state.last_breach_at >= state.breach_interval_seconds:
+                    state.breaches += 1
+                    state.last_breach_at = now
+                if state.breaches >= state.required_breaches:
+                    return "kill_switch"
+            else:
+                state.breaches, state.last_breach_at = 0, None
+
+        if state.tp_activation_price is not None:
+            if price > state.high_water_mark:
+                state.high_water_mark = price
+            if not state.trailing_armed and price >= state.tp_activation_price:
+                state.trailing_armed = True
+            elif state.trailing_armed and price <= state.trailing_exit_price():
+                return "trailing_take_profit"
+        return None
+
+    # ----- exit path -----
+
+    async def _exit(self, state: RiskState, reason: str, price: float, received: float):
+        from app.db import SessionLocal
+        from app.models import BotConfig
+
+        db = SessionLocal()
+        try:
+            config = db.query(BotConfig).filter(BotConfig.user_id == state.user_id).first()
+            if reason == "kill_switch":
+                result = await self._kill_switch(state, config, db, price)
+            else:
+                quantity = state.quantity if reason == "hard_stop_loss" else state.quantity * state.exit_step_percent / 100
+                result = await self._sell(state, db, quantity, price, reason)
+            latency_ms = (time.perf_counter() - received) * 1000.0
+            stats = self.stats[state.user_id]
+            stats.exits += 1
+            stats.latencies_ms.append(latency_ms)
+            stats.last_exit = {
+                "reason": reason,
+                "symbol": state.symbol,
+                "price": price,
+                "tick_to_exit_ms": round(latency_ms, 2),
+                "result": result,
+                "timestamp": datetime.utcnow().isoformat(),
+            }
+            print(f"🛡️ Risk engine {reason} for user {state.user_id} {state.symbol} @ {price} ({latency_ms:.1f} ms tick-to-exit)")
+
+            if reason == "kill_switch":
+                self.unregister(state.user_id)
+            elif config is not None:
+                from app.position_tracker import get_current_position
+                self.sync(state.user_id, config, get_current_position(state.user_id, state.symbol, db),
+                          kill_switch=state.kill_switch_enabled, symbol=state.symbol)
+        except Exception as e:
+            print(f"❌ Risk engine exit ({reason}) failed for user {state.user_id} {state.symbol}: {e}")
+        finally:
+            state.exiting = False
+            db.close()
+
+    async def _sell(self, state: RiskState, db, quantity: float, price: float, reason: str) -> dict:
+        from app.logging_models import Log, LogCategory, LogLevel
+        from app.bots import log_and_broadcast
+        import json
+
+        if state.paper:
+            from app.fill_simulator import record_paper_trade
+            trade, fill = await record_paper_trade(
+                db, state.user_id, state.symbol, "SELL", price, "gods_hand", quantity=quantity
+            )
+            if trade is None:
+                return {"status": "skipped", "reason": "No order book depth to fill paper order"}
+            result = {"mode": "paper", "fill": fill.to_dict()}
+        else:
+            from app.order_pipeline import order_pipeline
+            # Keyed on the position being exited, so a repeated trigger can't sell twice
+            intent_key = f"risk_engine:{state.symbol}:{reason}:{state.quantity:.8f}:{state.cost_basis:.8f}"
+            order = await order_pipeline.submit(
+                state.user_id, state.symbol, "SELL", quantity, "gods_hand", intent_key, wait=True
+            )
+            result = {"mode": "live", "order": order}
+
+        label = "STOP LOSS" if reason == "hard_stop_loss" else "TRAILING TP"
+        await log_and_broadcast(db, Log(
+            timestamp=datetime.utcnow(),
+            category=LogCategory.AI_ACTION,
+            level=LogLevel.WARNING if reason == "hard_stop_loss" else LogLevel.INFO,
+            message=f"Gods Hand {label}: sold {quantity:.8f} {state.symbol} @ {price} (risk engine)",
+            details=json.dumps({
+                "reason": reason,
+                "quantity": quantity,
+                "price": price,
+                "break_even_price": state.break_even_price,
+                "stop_price": state.stop_price,
+                "high_water_mark": state.high_water_mark,
+                "result": result,
+            }, default=str),
+            user_id=state.user_id,
+            symbol=state.symbol,
+            bot_type="gods_hand",
+            ai_recommendation="SELL",
+            ai_confidence="1.0",
+            ai_executed="yes",
+        ))
+        return result
+
+    async def _kill_switch(self, state: RiskState, config, db, price: float) -> dict:
+        from app.bots import bot_tasks, trigger_kill_switch
+
+        current_value = state.quantity * price
+        pl_percent = (current_value - state.cost_basis) / state.cost_basis * 100
+        baseline = config.kill_switch_baseline
+        await trigger_kill_switch(
+            state.user_id, config, db,
+            f"Gods Hand KILL-SWITCH: Unrealized loss {pl_percent:.2f}% exceeds limit {config.max_daily_loss}% ({state.breaches} consecutive breaches)",
+            {
+                "unrealized_pl_percent": pl_percent,
+                "effective_pl_percent": pl_percent - baseline if baseline is not None else pl_percent,
+                "baseline_pl_percent": baseline,
+                "consecutive_breaches": state.breaches,
+                "required_breaches": state.required_breaches,
+                "position_value": current_value,
+                "cost_basis": state.cost_basis,
+                "current_price": price,
+                "max_daily_loss": config.max_daily_loss,
+                "cooldown_minutes": config.kill_switch_cooldown_minutes,
+                "source": "risk_engine",
+            },
+        )
+        task = bot_tasks.pop(f"gods_hand_{state.user_id}", None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        return {"status": "stopped"}
+
+    # ----- introspection -----
+
+    def status(self, user_id: int) -> Optional[dict]:
+        states = [by_user[user_id] for by_user in self.states.values() if user_id in by_user]
+        stats = self.stats.get(user_id)
+        if not states and not stats:
+            return None
+        latencies = sorted(stats.latencies_ms) if stats else []
+        return {
+            "watching": [
+                {
+                    "symbol": s.symbol,
+                    "quantity": s.quantity,
+                    "break_even_price": round(s.break_even_price, 8),
+                    "stop_price": s.stop_price,
+                    "kill_price": s.kill_price if s.kill_switch_enabled else None,
+                    "tp_activation_price": s.tp_activation_price,
+                    "trailing_armed": s.trailing_armed,
+                    "trailing_exit_price": s.trailing_exit_price(),
+                    "high_water_mark": s.high_water_mark,
+                    "breaches": s.breaches,
+                }
+                for s in states
+            ],
+            "ticks_evaluated": stats.ticks if stats else 0,
+            "avg_eval_us": round(stats.eval_ns_total / stats.ticks / 1000, 2) if stats and stats.ticks else None,
+            "exits": stats.exits if stats else 0,
+            "tick_to_exit_ms_p50": round(latencies[len(latencies) // 2], 2) if latencies else None,
+            "tick_to_exit_ms_max": round(latencies[-1], 2) if latencies else None,
+            "last_exit": stats.last_exit if stats else None,
+        }
+
+
+risk_engine = RiskEngine()
@@ -0,0 +1,241 @@
+"""
+Gods Hand Evaluation Scheduling
+Decides when `_gods_hand_loop` wakes up next and whether an iteration needs a
+fresh AI evaluation at all.
+
+Modes (BotConfig.schedule_mode):
+- fixed:    every interval_seconds, measured from iteration start (no drift)
+- adaptive: interval scaled down when ATR/volatility is high or P/L is close
+            to the stop-loss / take-profit / kill-switch thresholds, and
+            scaled up in quiet markets
+- candle:   wake right after each 1h candle close; wakes earlier only when
+            P/L is close to a threshold
+
+Independently, BotConfig.skip_unchanged_evaluations skips the AI call when the
+market snapshot (last closed candle, price bucket, position, config version)
+is identical to the one the previous decision was made on.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+SCHEDULE_MODES = ("fixed", "adaptive", "candle")
+CANDLE_TIMEFRAME = "1h"
+CANDLE_SECONDS = 3600
+# Seconds to wait after a candle close so the exchange has published it
+CANDLE_SETTLE_SECONDS = float(os.getenv("SCHEDULE_CANDLE_SETTLE_SECONDS", "5"))
+MIN_DELAY_SECONDS = float(os.getenv("SCHEDULE_MIN_DELAY_SECONDS", "10"))
+MAX_DELAY_SECONDS = float(os.getenv("SCHEDULE_MAX_DELAY_SECONDS", "900"))
+# 1h ATR% regarded as "normal"; higher shortens the interval, lower lengthens it
+BASELINE_ATR_PERCENT = float(os.getenv("SCHEDULE_BASELINE_ATR_PERCENT", "0.8"))
+# Distance (percentage points of P/L) below which we start waking up faster
+THRESHOLD_PROXIMITY_PP = float(os.getenv("SCHEDULE_THRESHOLD_PROXIMITY_PP", "1.0"))
+# Price moves smaller than this fraction count as "unchanged" for skipping
+PRICE_BUCKET_FRACTION = float(os.getenv("SCHEDULE_PRICE_BUCKET_FRACTION", "0.001"))
+MIN_FACTOR = 0.25
+MAX_FACTOR = 4.0
+
+
+def atr_percent(candles: List[dict], period: int = 14) -> Optional[float]:
+    """Average True Range of the last `period` candles as % of the last close."""
+    if not candles or len(candles) < period + 1:
+        return None
+    highs = np.array([c['high'] for c in candles[-(period + 1):]], dtype=float)
+    lows = np.array([c['low'] for c in candles[-(period + 1):]], dtype=float)
+    closes = np.array([c['close'] for c in candles[-(period + 1):]], dtype=float)
+    prev_close = closes[:-1]
+    tr = np.maximum.reduce([
+        highs[1:] - lows[1:],
+        np.abs(highs[1:] - prev_close),
+        np.abs(lows[1:] - prev_close),
+    ])
+    last = closes[-1]
+    return float(tr.mean() / last * 100) if last > 0 else None
+
+
+def seconds_to_next_candle_close(now: Optional[float] = None, candle_seconds: int = CANDLE_SECONDS) -> float:
+    now = time.time() if now is None else now
+    return candle_seconds - (now % candle_seconds)
+
+
+class EvaluationScheduler:
+    """Per-user scheduling state and skipped/executed statistics."""
+
+    def __init__(self, user_id: int, interval_seconds: int):
+        self.user_id = user_id
+        self.interval_seconds = interval_seconds
+        self.mode = "fixed"
+        self.skip_unchanged = False
+
+        self._iteration_started = time.monotonic()
+        self._delay = float(interval_seconds)
+        self._last_snapshot: Optional[Tuple] = None
+
+        self.executed = 0
+        self.skipped = 0
+        self.last_delay_seconds = float(interval_seconds)
+        self.last_reason = "initial"
+        self.last_atr_percent: Optional[float] = None
+        self.last_evaluated_at: Optional[datetime] = None
+        self.last_skipped_at: Optional[datetime] = None
+
+    # ----- lifecycle -----
+
+    def configure(self, config):
+        mode = getattr(config, 'schedule_mode', None) or "fixed"
+        self.mode = mode if mode in SCHEDULE_MODES else "fixed"
+        self.skip_unchanged = bool(getattr(config, 'skip_unchanged_evaluations', False))
+
+    def begin_iteration(self):
+        self._iteration_started = time.monotonic()
+        self._delay = float(self.interval_seconds)
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self._iteration_started) * 1000.0
+
+    async def wait(self):
+        """Sleep until the planned deadline, measured from iteration start (no drift)."""
+        deadline = self._iteration_started + self._delay
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    # ----- skip-unchanged gating -----
+
+    @staticmethod
+    def snapshot(candles: List[dict], current_price: float, position: Dict, config) -> Tuple:
+        last_closed = candles[-2]['timestamp'] if candles and len(candles) >= 2 else None
+        bucket = None
+        if current_price and current_price > 0:
+            bucket = round(np.log(current_price) / np.log1p(PRICE_BUCKET_FRACTION))
+        updated_at = getattr(config, 'updated_at', None)
+        return (
+            last_closed,
+            bucket,
+            round(float(position.get('quantity', 0.0) or 0.0), 8),
+            updated_at.isoformat() if updated_at else None,
+        )
+
+    def should_evaluate(self, snapshot: Tuple) -> bool:
+        if not self.skip_unchanged or self._last_snapshot is None:
+            return True
+        return snapshot != self._last_snapshot
+
+    def mark_executed(self, snapshot: Optional[Tuple]):
+        self.executed += 1
+        self._last_snapshot = snapshot
+        self.last_evaluated_at = datetime.utcnow()
+
+    def mark_skipped(self):
+        self.skipped += 1
+        self.last_skipped_at = datetime.utcnow()
+
+    # ----- next wake-up -----
+
+    def _proximity_factor(self, config, pl_percent: Optional[float], has_position: bool) -> float:
+        if pl_percent is None or not has_position:
+            return MAX_FACTOR
+        distances = []
+        if config.hard_stop_loss_percent is not None:
+            distances.append(pl_percent + config.hard_stop_loss_percent)
+        if config.trailing_take_profit_percent is not None:
+            distances.append(config.trailing_take_profit_percent - pl_percent)
+        if config.max_daily_loss is not None:
+            baseline = config.kill_switch_baseline or 0.0
+            distances.append((pl_percent - baseline) + config.max_daily_loss)
+        distances = [d for d in distances if d >= 0]
+        if not distances:
+            # Already beyond a threshold: check again as soon as allowed
+            return MIN_FACTOR
+        closest = min(distances)
+        if closest >= THRESHOLD_PROXIMITY_PP:
+            return MAX_FACTOR
+        return max(MIN_FACTOR, closest / THRESHOLD_PROXIMITY_PP)
+
+    def plan(self, config, candles: Optional[List[dict]], pl_percent: Optional[float], has_position: bool) -> float:
+        """Pick the delay before the next iteration and remember why."""
+        interval = float(self.interval_seconds)
+        self.last_atr_percent = atr_percent(candles) if candles else None
+        proximity = self._proximity_factor(config, pl_percent, has_position)
+
+        if self.mode == "adaptive":
+            vol_factor = 1.0
+            if self.last_atr_percent:
+                vol_factor = min(MAX_FACTOR, max(MIN_FACTOR, BASELINE_ATR_PERCENT / self.last_atr_percent))
+            factor = min(vol_factor, proximity)
+            delay = min(MAX_DELAY_SECONDS, max(MIN_DELAY_SECONDS, interval * factor))
+            self.last_reason = (
+                f"adaptive: atr={self.last_atr_percent or 0:.2f}% vol_factor={vol_factor:.2f} "
+                f"proximity_factor={proximity:.2f}"
+            )
+        elif self.mode == "candle":
+            delay = seconds_to_next_candle_close() + CANDLE_SETTLE_SECONDS
+            if proximity < 1.0:
+                delay = min(delay, max(MIN_DELAY_SECONDS, interval * proximity))
+                self.last_reason = f"candle: near threshold (proximity_factor={proximity:.2f})"
+            else:
+                self.last_reason = "candle: aligned to next close"
+        else:
+            delay = interval
+            self.last_reason = "fixed"
+
+        # wait() counts this from iteration start, so work time doesn't add drift
+        self._delay = delay
+        self.last_delay_seconds = round(delay, 1)
+        return delay
+
+    # ----- checkpointing (see app/bot_state.py) -----
+
+    def export_state(self) -> dict:
+        return {
+            "executed": self.executed,
+            "skipped": self.skipped,
+            "last_snapshot": list(self._last_snapshot) if self._last_snapshot is not None else None,
+            "last_delay_seconds": self.last_delay_seconds,
+            "last_reason": self.last_reason,
+            "last_atr_percent": self.last_atr_percent,
+            "last_evaluated_at": self.last_evaluated_at.isoformat() if self.last_evaluated_at else None,
+        }
+
+    def restore_state(self, state: dict):
+        self.executed = state.get("executed", 0)
+        self.skipped = state.get("skipped", 0)
+        snapshot = state.get("last_snapshot")
+        self._last_snapshot = tuple(snapshot) if snapshot is not None else None
+        self.last_delay_seconds = state.get("last_delay_seconds", self.last_delay_seconds)
+        self.last_reason = state.get("last_reason", self.last_reason)
+        self.last_atr_percent = state.get("last_atr_percent")
+        if state.get("last_evaluated_at"):
+            self.last_evaluated_at = datetime.fromisoformat(state["last_evaluated_at"])
+
+    def to_dict(self) -> dict:
+        total = self.executed + self.skipped
+        return {
+            "mode": self.mode,
+            "skip_unchanged": self.skip_unchanged,
+            "interval_seconds": self.interval_seconds,
+            "evaluations_executed": self.executed,
+            "evaluations_skipped": self.skipped,
+            "skip_rate": round(self.skipped / total * 100, 1) if total else 0.0,
+            "last_delay_seconds": self.last_delay_seconds,
+            "last_reason": self.last_reason,
+            "last_atr_percent": round(self.last_atr_percent, 3) if self.last_atr_percent else None,
+            "last_evaluated_at": self.last_evaluated_at.isoformat() if self.last_evaluated_at else None,
+            "last_skipped_at": self.last_skipped_at.isoformat() if self.last_skipped_at else None,
+        }
+
+
+# user_id -> scheduler (in-memory, like bot_status)
+evaluation_schedulers: Dict[int, EvaluationScheduler] = {}
+
+
+def get_scheduler(user_id: int, interval_seconds: int) -> EvaluationScheduler:
+    scheduler = evaluation_schedulers.get(user_id)
+    if scheduler is None:
+        scheduler = EvaluationScheduler(user_id, interval_seconds)
+        evaluation_schedulers[user_id] = scheduler
+    scheduler.interval_seconds = interval_seconds
+    return scheduler
@@ -0,0 +1,244 @@
+"""
+Daily Trade Rollups
+Per user/symbol/bot/mode/day aggregates (buy/sell counts, volumes, average-cost
+realized P/L, wins/losses) kept in trade_daily_rollups, so a performance window
+is a SUM over at most one row per day instead of loading every Trade.
+
+The rollups are computed from one ordered scan of a scope's trades, folded in
+Python carrying (position, cost) for the average-cost P/L and grouped by day
+(a recursive CTE doing the same walk joins row n to row n+1 by number, which
+SQLite re-scans per step: quadratic in the trade count).
+
+Each rollup row stores the closing position/cost of its day, so a refresh after
+new trades only re-walks from the earliest day those trades touch. Edits,
+deletes, status changes or a budget change rebuild the symbol from scratch.
+Average cost follows app/performance_engine.py (including the implicit 50%
+holding for histories that start with a SELL and never BUY).
+"""
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models import BotConfig, Position, Trade, TradeDailyRollup, TradeRollupState
+from app.performance_engine import MODE_STATUSES
+
+
+_STATUS_MODE = {status: mode for mode, statuses in MODE_STATUSES.items() for status in statuses}
+_ALL_STATUSES = tuple(_STATUS_MODE)
+rollups = TradeDailyRollup.__table__
+rollup_state = TradeRollupState.__table__
+positions = Position.__table__
+
+_SUM_COLUMNS = ("buys", "sells", "buy_volume", "sell_volume", "buy_notional", "sell_notional",
+                "realized_pl", "gross_profit", "gross_loss", "winning_trades", "losing_trades")
+
+
+def _walk(conn, user_id: int, symbol: str, bot_type: str, mode: str,
+          pos0: float, cost0: float, since: Optional[datetime]) -> list:
+    """Day rows for a scope's trades (from `since`), carrying (position, cost) from (pos0, cost0)."""
+    stmt = (
+        select(Trade.timestamp, Trade.side, func.coalesce(Trade.amount, 0.0),
+               func.coalesce(Trade.filled_price, Trade.price, 0.0))
+        .where(Trade.user_id == user_id, Trade.symbol == symbol, Trade.bot_type == bot_type,
+               Trade.status.in_(MODE_STATUSES[mode]))
+        .order_by(Trade.timestamp, Trade.id)
+    )
+    if since is not None:
+        stmt = stmt.where(Trade.timestamp >= since)
+
+    days = []
+    row = None
+    pos, cost = pos0, cost0
+    for timestamp, side, qty, px in conn.execute(stmt):
+        day = timestamp.date()
+        if row is None or row["day"] != day:
+            row = dict.fromkeys(_SUM_COLUMNS, 0)
+            row["day"] = day
+            days.append(row)
+        if side == 'BUY':
+            pos += qty
+            cost += qty * px
+            row["buys"] += 1
+            row["buy_volume"] += qty
+            row["buy_notional"] += qty * px
+        elif side == 'SELL' and pos > 0:
+            avg = cost / pos
+            pl = (px - avg) * qty
+            pos -= qty
+            cost = pos * avg if pos > 0 else 0.0
+            row["sells"] += 1
+            row["sell_volume"] += qty
+            row["sell_notional"] += qty * px
+            row["realized_pl"] += pl
+            if pl > 0:
+                row["gross_profit"] += pl
+                row["winning_trades"] += 1
+            else:
+                row["gross_loss"] -= pl
+                row["losing_trades"] += 1
+        row["closing_quantity"] = pos
+        row["closing_cost"] = cost
+    return days
+
+
+def _scope_filter(user_id: int, symbol: str, bot_type: Optional[str] = None, mode: Optional[str] = None):
+    clauses = [rollups.c.user_id == user_id, rollups.c.symbol == symbol]
+    if bot_type is not None:
+        clauses += [rollups.c.bot_type == bot_type, rollups.c.mode == mode]
+    return clauses
+
+
+def _rollup_scope(conn, user_id: int, symbol: str, bot_type: str, mode: str, budget: float,
+                  since_day: Optional[date] = None, new_has_buy: bool = False):
+    """(Re)compute a scope's rows from since_day on (everything when None)."""
+    pos0, cost0, seeded = 0.0, 0.0, False
+    if since_day is not None:
+        prev = conn.execute(
+            select(rollups).where(*_scope_filter(user_id, symbol, bot_type, mode), rollups.c.day < since_day)
+            .order_by(rollups.c.day.desc()).limit(1)
+        ).mappings().first()
+        if prev is None or (prev["implicit_seed"] and new_has_buy):
+            since_day = None  # nothing to continue from / the seed no longer applies
+        else:
+            pos0, cost0, seeded = prev["closing_quantity"], prev["closing_cost"], prev["implicit_seed"]
+
+    statuses = MODE_STATUSES[mode]
+    if since_day is None:
+        scope = (Trade.user_id == user_id, Trade.symbol == symbol, Trade.bot_type == bot_type, Trade.status.in_(statuses))
+        first = conn.execute(
+            select(Trade.side, func.coalesce(Trade.filled_price, Trade.price, 0.0))
+            .where(*scope).order_by(Trade.timestamp, Trade.id).limit(1)
+        ).first()
+        has_buy = conn.execute(select(Trade.id).where(*scope, Trade.side == 'BUY').limit(1)).first() is not None
+        if first is not None and first[0] == 'SELL' and first[1] > 0 and not has_buy:
+            # Sells-only history: value it from an implicit 50% holding at the first price
+            pos0 = (budget / 2.0) / first[1]
+            cost0, seeded = pos0 * first[1], True
+        conn.execute(delete(rollups).where(*_scope_filter(user_id, symbol, bot_type, mode)))
+        since = None
+    else:
+        conn.execute(delete(rollups).where(*_scope_filter(user_id, symbol, bot_type, mode), rollups.c.day >= since_day))
+        since = datetime.combine(since_day, datetime.min.time())
+
+    rows = _walk(conn, user_id, symbol, bot_type, mode, pos0, cost0, since)
+    if rows:
+        conn.execute(insert(rollups), [
+            dict(row, user_id=user_id, symbol=symbol, bot_type=bot_type, mode=mode, implicit_seed=seeded)
+            for row in rows
+        ])
+
+
+def refresh_symbol(db: Session, user_id: int, symbol: str, budget: float) -> bool:
+    """Bring one user/symbol's rollups up to date; returns True when anything was recomputed."""
+    conn = db.connection()
+    history = (Trade.user_id == user_id, Trade.symbol == symbol, Trade.status.in_(_ALL_STATUSES), Trade.bot_type.isnot(None))
+    last_trade_id, trades_count = conn.execute(select(func.max(Trade.id), func.count(Trade.id)).where(*history)).first()
+    version = conn.execute(
+        select(positions.c.updated_at).where(positions.c.user_id == user_id, positions.c.symbol == symbol)
+    ).scalar()
+    state = conn.execute(
+        select(rollup_state).where(rollup_state.c.user_id == user_id, rollup_state.c.symbol == symbol)
+    ).mappings().first()
+    current = (last_trade_id, trades_count, version, budget)
+    if state is not None and (state["last_trade_id"], state["trades_count"], state["ledger_version"], state["budget"]) == current:
+        return False
+
+    # Pure append since the last refresh: re-walk each scope from the first day a new trade lands on
+    since_days: Optional[Dict[Tuple[str, str], Tuple[date, bool]]] = None
+    if state is not None and state["budget"] == budget and state["last_trade_id"] is not None \
+            and last_trade_id is not None and last_trade_id > state["last_trade_id"]:
+        old_count = conn.execute(
+            select(func.count(Trade.id)).where(*history, Trade.id <= state["last_trade_id"])
+        ).scalar()
+        if old_count == state["trades_count"]:
+            since_days = {}
+            for bot_type, status, first_at, buys in conn.execute(
+                select(Trade.bot_type, Trade.status, func.min(Trade.timestamp),
+                       func.sum(case((Trade.side == 'BUY', 1), else_=0)))
+                .where(*history, Trade.id > state["last_trade_id"])
+                .group_by(Trade.bot_type, Trade.status)
+            ):
+                key = (bot_type, _STATUS_MODE[status])
+                day = first_at.date()
+                prev_day, prev_buy = since_days.get(key, (day, False))
+                since_days[key] = (min(day, prev_day), prev_buy or bool(buys))
+
+    if since_days is None:
+        conn.execute(delete(rollups).where(*_scope_filter(user_id, symbol)))
+        scopes = {(bot_type, _STATUS_MODE[status]) for bot_type, status in conn.execute(
+            select(Trade.bot_type, Trade.status).where(*history).distinct()
+        )}
+        for bot_type, mode in scopes:
+            _rollup_scope(conn, user_id, symbol, bot_type, mode, budget)
+    else:
+        for (bot_type, mode), (since_day, new_has_buy) in since_days.items():
+            _rollup_scope(conn, user_id, symbol, bot_type, mode, budget, since_day, new_has_buy)
+
+    conn.execute(delete(rollup_state).where(rollup_state.c.user_id == user_id, rollup_state.c.symbol == symbol))
+    if trades_count:
+        conn.execute(insert(rollup_state).values(
+            user_id=user_id, symbol=symbol, last_trade_id=last_trade_id, trades_count=trades_count,
+            ledger_version=version, budget=budget, updated_at=datetime.utcnow(),
+        ))
+    return True
+
+
+def refresh(db: Session, user_id: int, bot_type: Optional[str] = None) -> int:
+    """Refresh every symbol the user has rollups or trades for; returns symbols recomputed."""
+    config = db.query(BotConfig).filter(BotConfig.user_id == user_id).first()
+    budget = config.budget if config else 0.0
+    trade_symbols = select(Trade.symbol).where(Trade.user_id == user_id, Trade.symbol.isnot(None))
+    if bot_type is not None:
+        trade_symbols = trade_symbols.where(Trade.bot_type == bot_type)
+    symbols = {s for (s,) in db.execute(trade_symbols.distinct())}
+    symbols |= {s for (s,) in db.execute(select(rollup_state.c.symbol).where(rollup_state.c.user_id == user_id))}
+    refreshed = 0
+    for symbol in sorted(symbols):
+        try:
+            refreshed += refresh_symbol(db, user_id, symbol, budget)
+            db.commit()
+        except Exception as e:
+            # Typically a concurrent refresh of the same symbol; its rows are just as good
+            db.rollback()
+            print(f"⚠️ Trade rollup refresh failed for user {user_id} {symbol}: {e}")
+    return refreshed
+
+
+def window(db: Session, user_id: int, bot_type: str, since_day: date) -> List[dict]:
+    """Per-symbol totals (paper and live summed) for days >= since_day."""
+    columns = [func.coalesce(func.sum(getattr(rollups.c, name)), 0).label(name) for name in _SUM_COLUMNS]
+    rows = db.execute(
+        select(rollups.c.symbol, *columns)
+        .where(rollups.c.user_id == user_id, rollups.c.bot_type == bot_type, rollups.c.day >= since_day)
+        .group_by(rollups.c.symbol)
+        .order_by(rollups.c.symbol)
+    ).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def open_positions(db: Session, user_id: int, bot_type: str) -> List[dict]:
+    """Closing position/average cost of each scope's latest day, where something is still held."""
+    latest = (
+        select(rollups.c.symbol, rollups.c.mode, func.max(rollups.c.day).label("day"))
+        .where(rollups.c.user_id == user_id, rollups.c.bot_type == bot_type)
+        .group_by(rollups.c.symbol, rollups.c.mode)
+        .subquery()
+    )
+    rows = db.execute(
+        select(rollups.c.symbol, rollups.c.mode, rollups.c.closing_quantity, rollups.c.closing_cost)
+        .join(latest, (rollups.c.symbol == latest.c.symbol) & (rollups.c.mode == latest.c.mode) & (rollups.c.day == latest.c.day))
+        .where(rollups.c.user_id == user_id, rollups.c.bot_type == bot_type, rollups.c.closing_quantity > 0)
+        .order_by(rollups.c.symbol, rollups.c.mode)
+    ).all()
+    return [
+        {'symbol': symbol, 'position': round(qty, 8), 'avg_cost': round(cost / qty, 6), 'mode': mode}
+        for symbol, mode, qty, cost in rows
+    ]
+
+
+def forget(db: Session, user_id: int):
+    """Drop a user's rollups (before deleting the user)."""
+    db.execute(delete(rollups).where(rollups.c.user_id == user_id))
+    db.execute(delete(rollup_state).where(rollup_state.c.user_id == user_id))
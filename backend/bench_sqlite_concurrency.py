@@ -0,0 +1,143 @@
+"""
+Concurrency benchmark for the SQLite profile (app/db.py).
+
+Bot threads run Gods Hand-shaped write units (read the config, insert a few
+logs, commit) while reader threads run the dashboard's log/trade queries. The
+same workload runs twice on a scratch database:
+
+- default: SQLite defaults (rollback journal), every bot commits on its own
+- profile: WAL + pragmas, bot writes through the single-writer WriteQueue
+
+and reports throughput, latency percentiles and "database is locked" errors.
+
+    python bench_sqlite_concurrency.py --bots 16 --readers 8 --seconds 10
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--bots", type=int, default=16)
+parser.add_argument("--readers", type=int, default=8)
+parser.add_argument("--seconds", type=float, default=10)
+parser.add_argument("--logs-per-write", type=int, default=3)
+parser.add_argument("--read-interval", type=float, default=0.02, help="pause between a reader's requests (s)")
+parser.add_argument("--seed-logs", type=int, default=50_000)
+args = parser.parse_args()
+
+# Keep app.db away from the real database while importing the models
+scratch_dir = tempfile.mkdtemp(prefix="gp_sqlite_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{scratch_dir}/import.db"
+
+from sqlalchemy import insert, select, func, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from app.db import Base, WriteQueue, sqlite_engine  # noqa: E402
+from app.logging_models import Log, LogCategory, LogLevel  # noqa: E402
+from app import models  # noqa: E402,F401  (registers the tables)
+
+
+def pct(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+def seed(engine):
+    Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+    rows = [{"timestamp": now, "category": LogCategory.BOT, "level": LogLevel.INFO,
+             "message": f"seed {i}", "user_id": i % 50 + 1, "symbol": "BTC/USDT", "bot_type": "gods_hand"}
+            for i in range(args.seed_logs)]
+    with engine.begin() as conn:
+        for start in range(0, len(rows), 5000):
+            conn.execute(insert(Log.__table__), rows[start:start + 5000])
+
+
+def bot_unit(session, user_id):
+    # Same shape as a bot iteration: read first, then write in the same transaction
+    session.execute(select(func.count(Log.id)).where(Log.user_id == user_id, Log.category == LogCategory.AI_ACTION)).scalar()
+    session.execute(insert(Log.__table__), [
+        {"timestamp": datetime.utcnow(), "category": LogCategory.AI_ACTION, "level": LogLevel.INFO,
+         "message": "bench", "user_id": user_id, "symbol": "BTC/USDT", "bot_type": "gods_hand"}
+        for _ in range(args.logs_per_write)
+    ])
+
+
+def run(label, profile):
+    path = os.path.join(scratch_dir, f"{label}.db")
+    url = f"sqlite:///{path}"
+    engine = sqlite_engine(url, profile=profile)
+    seed(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    queue = WriteQueue(sessionmaker(bind=sqlite_engine(url, profile=True, writer=True), autoflush=False),
+                       serialized=True) if profile else WriteQueue(Session, serialized=False)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    write_lat, read_lat = [], []
+    errors = {"write": 0, "read": 0}
+
+    def bot(user_id):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                queue.submit(bot_unit, user_id).result()
+                with lock:
+                    write_lat.append(time.perf_counter() - started)
+            except Exception:
+                with lock:
+                    errors["write"] += 1
+            time.sleep(0.005)
+
+    def reader(user_id):
+        while not stop.is_set():
+            started = time.perf_counter()
+            db = Session()
+            try:
+                db.execute(select(Log).where(Log.user_id == user_id).order_by(Log.timestamp.desc(), Log.id.desc()).limit(50)).all()
+                db.execute(select(func.count(Log.id)).where(Log.user_id == user_id)).scalar()
+                with lock:
+                    read_lat.append(time.perf_counter() - started)
+            except Exception:
+                with lock:
+                    errors["read"] += 1
+            finally:
+                db.close()
+            time.sleep(args.read_interval)
+
+    threads = [threading.Thread(target=bot, args=(i % 50 + 1,)) for i in range(args.bots)]
+    threads += [threading.Thread(target=reader, args=(i % 50 + 1,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    with engine.connect() as conn:
+        journal = conn.execute(text("PRAGMA journal_mode")).scalar()
+    engine.dispose()
+    return {
+        "label": f"{label} ({journal})",
+        "writes/s": len(write_lat) / args.seconds,
+        "write p50": pct(write_lat, 0.50), "write p99": pct(write_lat, 0.99),
+        "write errors": errors["write"],
+        "reads/s": len(read_lat) / args.seconds,
+        "read p50": pct(read_lat, 0.50), "read p99": pct(read_lat, 0.99),
+        "read max": max(read_lat) * 1000 if read_lat else 0.0,
+        "read errors": errors["read"],
+    }
+
+
+print(f"🧪 {args.bots} bot writers, {args.readers} readers, {args.seconds:g}s each, scratch dir {scratch_dir}")
+results = [run("default", profile=False), run("profile", profile=True)]
+
+print()
+print(f"{'':<22}" + "".join(f"{r['label']:>20}" for r in results))
+for key in ("writes/s", "write p50", "write p99", "write errors", "reads/s", "read p50", "read p99", "read max", "read errors"):
+    unit = " ms" if key.startswith(("write p", "read p", "read max")) else ""
+    print(f"{key + unit:<22}" + "".join(f"{r[key]:>20.1f}" for r in results))
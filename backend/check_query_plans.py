@@ -0,0 +1,183 @@
+"""
+Check that the hot queries use an index, and time them.
+
+Runs the migrations against a scratch database (never the app DB unless you
+pass it explicitly), optionally seeds it, then for each hot query prints the
+plan, asserts it searches one of the composite indexes and reports the median time.
+
+    python check_query_plans.py --seed 1000000
+    python check_query_plans.py --database-url postgresql://... --seed 1000000
+    python check_query_plans.py --compare   # also time with the composite indexes dropped
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--database-url", default="sqlite:///query_plan_check.db")
+parser.add_argument("--seed", type=int, default=0, help="trades and logs to insert first")
+parser.add_argument("--users", type=int, default=1000)
+parser.add_argument("--runs", type=int, default=20)
+parser.add_argument("--compare", action="store_true", help="also time without the composite indexes")
+args = parser.parse_args()
+
+# app.db reads DATABASE_URL at import time
+os.environ["DATABASE_URL"] = args.database_url
+
+from sqlalchemy import insert, text  # noqa: E402
+from app.db import Base, engine  # noqa: E402
+from app.logging_models import Log, LogCategory, LogLevel  # noqa: E402
+from app.models import Trade, User  # noqa: E402
+from app.paper_trading_tracker import PaperTradingSnapshot  # noqa: E402
+from app.migration import ACTIVE_INDEXES, run_db_migrations  # noqa: E402
+
+SYMBOLS = ["BTC/USDT", "ETH/USDT", "BNB/USDT", "SOL/USDT", "XRP/USDT"]
+BOT_TYPES = ["gods_hand", "grid", "dca", "manual"]
+STATUSES = ["completed_paper", "completed", "failed", "pending"]
+CATEGORIES = list(LogCategory)
+POSTGRES = engine.dialect.name == "postgresql"
+
+
+def seed(n: int):
+    print(f"🌱 Seeding {n:,} trades, {n:,} logs and {n // 10:,} snapshots over {args.users} users...")
+    now = datetime.utcnow()
+    rnd = random.Random(42)
+    with engine.begin() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM users")).scalar()
+        if existing < args.users:
+            conn.execute(insert(User.__table__), [
+                {"username": f"plan_user_{i}", "hashed_password": "x", "is_active": True, "is_admin": False}
+                for i in range(existing, args.users)
+            ])
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users"))]
+    chunk = 50_000
+    started = time.perf_counter()
+    for offset in range(0, n, chunk):
+        size = min(chunk, n - offset)
+        with engine.begin() as conn:
+            conn.execute(insert(Trade.__table__), [{
+                "user_id": rnd.choice(user_ids), "symbol": rnd.choice(SYMBOLS),
+                "side": rnd.choice(("BUY", "SELL")), "amount": rnd.uniform(0.001, 0.1),
+                "price": rnd.uniform(20_000, 70_000), "status": rnd.choice(STATUSES),
+                "bot_type": rnd.choice(BOT_TYPES), "timestamp": now - timedelta(minutes=rnd.randint(0, 525_600)),
+            } for _ in range(size)])
+            conn.execute(insert(Log.__table__), [{
+                "user_id": rnd.choice(user_ids), "category": rnd.choice(CATEGORIES), "level": LogLevel.INFO,
+                "message": "seeded", "symbol": rnd.choice(SYMBOLS), "bot_type": rnd.choice(BOT_TYPES),
+                "timestamp": now - timedelta(minutes=rnd.randint(0, 525_600)),
+            } for _ in range(size)])
+            conn.execute(insert(PaperTradingSnapshot.__table__), [{
+                "user_id": rnd.choice(user_ids), "symbol": rnd.choice(SYMBOLS), "bot_type": rnd.choice(BOT_TYPES),
+                "timestamp": now - timedelta(minutes=rnd.randint(0, 525_600)), "current_balance": 10_000.0,
+            } for _ in range(size // 10)])
+        print(f"   {offset + size:,} rows ({time.perf_counter() - started:.0f}s)")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+# (name, sql, params) - the shapes the API issues on every poll
+since = datetime.utcnow() - timedelta(days=7)
+HOT_QUERIES = [
+    ("trades by user/symbol/bot/status/time",
+     "SELECT id, side, amount, price, timestamp FROM trades WHERE user_id = :u AND symbol = :s AND bot_type = :b "
+     "AND status IN ('completed_paper', 'completed') AND timestamp >= :since ORDER BY timestamp",
+     {"u": 7, "s": "BTC/USDT", "b": "gods_hand", "since": since}),
+    ("trade replay for a symbol",
+     "SELECT id, side, amount, price, timestamp FROM trades WHERE user_id = :u AND symbol = :s "
+     "AND status IN ('completed_paper', 'completed') ORDER BY timestamp, id",
+     {"u": 7, "s": "BTC/USDT"}),
+    ("trade history",
+     "SELECT * FROM trades WHERE user_id = :u ORDER BY timestamp DESC, id DESC LIMIT 51", {"u": 7}),
+    ("trade history, deep keyset page",
+     "SELECT * FROM trades WHERE user_id = :u AND (timestamp, id) < (:ts, :id) "
+     "ORDER BY timestamp DESC, id DESC LIMIT 51", {"u": 7, "ts": since - timedelta(days=300), "id": 10**9}),
+    ("logs by user/category/time",
+     "SELECT * FROM logs WHERE user_id = :u AND category = :c ORDER BY timestamp DESC, id DESC LIMIT 51",
+     {"u": 7, "c": LogCategory.AI_ACTION.name}),
+    ("logs by user/time",
+     "SELECT * FROM logs WHERE user_id = :u ORDER BY timestamp DESC, id DESC LIMIT 101", {"u": 7}),
+    ("logs by user/time, deep keyset page",
+     "SELECT * FROM logs WHERE user_id = :u AND (timestamp, id) < (:ts, :id) "
+     "ORDER BY timestamp DESC, id DESC LIMIT 101", {"u": 7, "ts": since - timedelta(days=300), "id": 10**9}),
+    ("paper snapshots by user/symbol/bot/time",
+     "SELECT timestamp, current_balance FROM paper_trading_snapshots WHERE user_id = :u AND symbol = :s "
+     "AND bot_type = :b AND timestamp >= :since ORDER BY timestamp",
+     {"u": 7, "s": "BTC/USDT", "b": "gods_hand", "since": since}),
+]
+
+
+def plan(conn, sql: str, params: dict) -> str:
+    if POSTGRES:
+        return "\n".join(row[0] for row in conn.execute(text("EXPLAIN " + sql), params))
+    return "\n".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params))
+
+
+def uses_index(plan_text: str) -> bool:
+    """An index scan on one of the composite hot-path indexes (a full scan via a single-column index doesn't count)."""
+    if not any(name in plan_text for name, _, _ in ACTIVE_INDEXES):
+        return False
+    if POSTGRES:
+        return any(k in plan_text for k in ("Index Scan", "Index Only Scan", "Bitmap Index Scan"))
+    return "SEARCH" in plan_text and "SCAN " not in plan_text
+
+
+def timing(conn, sql: str, params: dict) -> float:
+    samples = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        conn.execute(text(sql), params).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def run_checks(label: str, assert_index: bool) -> dict:
+    print(f"\n=== {label} ===")
+    results, failures = {}, []
+    with engine.connect() as conn:
+        for name, sql, params in HOT_QUERIES:
+            plan_text = plan(conn, sql, params)
+            ms = timing(conn, sql, params)
+            ok = uses_index(plan_text)
+            results[name] = ms
+            print(f"{'✅' if ok else '❌'} {name}: {ms:.2f} ms (median of {args.runs})")
+            for line in plan_text.splitlines():
+                print(f"      {line}")
+            if assert_index and not ok:
+                failures.append(name)
+    if failures:
+        print(f"\n❌ No index scan for: {', '.join(failures)}")
+        sys.exit(1)
+    return results
+
+
+Base.metadata.create_all(bind=engine)
+run_db_migrations()
+with engine.connect() as conn:
+    trades = conn.execute(text("SELECT COUNT(*) FROM trades")).scalar()
+    logs = conn.execute(text("SELECT COUNT(*) FROM logs")).scalar()
+print(f"📦 {engine.dialect.name}: {trades:,} trades, {logs:,} logs")
+if args.seed:
+    seed(args.seed)
+
+with_indexes = run_checks("with composite indexes", assert_index=True)
+
+if args.compare:
+    with engine.begin() as conn:
+        for name, table, columns in ACTIVE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    engine.dispose()  # no cached statements planned against the dropped indexes
+    try:
+        without = run_checks("without composite indexes", assert_index=False)
+    finally:
+        with engine.begin() as conn:
+            for name, table, columns in ACTIVE_INDEXES:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+    print("\n=== speedup ===")
+    for name, ms in with_indexes.items():
+        print(f"{name}: {without[name]:.2f} ms -> {ms:.2f} ms ({without[name] / max(ms, 1e-6):.1f}x)")
+
+print("\n✅ All hot queries use a composite index")
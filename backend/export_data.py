@@ -0,0 +1,56 @@
+"""
+Export trades, logs, decisions or paper trading snapshots to a file (or stdout)
+as NDJSON, CSV or Parquet, streamed in chunks so memory stays flat whatever
+the row count (see app/export.py). Use this instead of querying gods_ping.db
+directly from analysis scripts.
+
+    python export_data.py trades --user-id 1 --since 2026-01-01 -o trades.ndjson
+    python export_data.py logs --format csv --gzip -o logs.csv.gz
+    python export_data.py decisions --format parquet -o decisions.parquet
+    python export_data.py snapshots --database-url postgresql://... | head
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("dataset", choices=["trades", "logs", "decisions", "snapshots"])
+parser.add_argument("--format", default="ndjson", choices=["ndjson", "csv", "parquet"])
+parser.add_argument("--user-id", type=int, default=None, help="only this user's rows (default: all users)")
+parser.add_argument("--since", type=datetime.fromisoformat, default=None, help="UTC, inclusive (e.g. 2026-01-01)")
+parser.add_argument("--until", type=datetime.fromisoformat, default=None, help="UTC, exclusive")
+parser.add_argument("--gzip", action="store_true", help="gzip the output on the fly")
+parser.add_argument("--chunk-rows", type=int, default=None, help="rows fetched and encoded per chunk")
+parser.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+parser.add_argument("--database-url", default=None, help="defaults to DATABASE_URL / the app database")
+args = parser.parse_args()
+
+# app.db reads DATABASE_URL at import time
+if args.database_url:
+    os.environ["DATABASE_URL"] = args.database_url
+
+from app import export  # noqa: E402
+from app import models  # noqa: E402,F401  (registers the tables)
+
+try:
+    export.check(args.dataset, args.format)
+except export.ExportError as e:
+    sys.exit(f"❌ {e}")
+
+options = {"chunk_rows": args.chunk_rows} if args.chunk_rows else {}
+started = time.perf_counter()
+written = 0
+out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+try:
+    for part in export.export(args.dataset, args.format, user_id=args.user_id, since=args.since,
+                              until=args.until, gzip=args.gzip, **options):
+        out.write(part)
+        written += len(part)
+finally:
+    if out is not sys.stdout.buffer:
+        out.close()
+
+print(f"✅ Exported {args.dataset} ({args.format}{', gzip' if args.gzip else ''}): "
+      f"{written / 1024:.1f} KB in {time.perf_counter() - started:.2f}s", file=sys.stderr)
@@ -0,0 +1,148 @@
+"""
+Load-test the DB-backed API endpoints in-process and report latency percentiles.
+
+Seeds a scratch database (never the app DB unless you pass it explicitly),
+then fires a mixed workload of authenticated requests at the ASGI app with a
+fixed concurrency. Besides per-endpoint p50/p99 it reports event-loop lag: how
+late a timer fires while the load runs, i.e. how long bot loops and websockets
+stall behind handlers that block the loop.
+
+    python load_test_db.py --requests 3000 --concurrency 64
+    python load_test_db.py --database-url postgresql://... --trades 200000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--database-url", default="sqlite:///load_test.db")
+parser.add_argument("--users", type=int, default=20)
+parser.add_argument("--trades", type=int, default=20_000, help="trades to seed (if the DB is empty)")
+parser.add_argument("--logs", type=int, default=50_000, help="logs to seed (if the DB is empty)")
+parser.add_argument("--requests", type=int, default=2000)
+parser.add_argument("--concurrency", type=int, default=50)
+args = parser.parse_args()
+
+# app.db reads DATABASE_URL at import time
+os.environ["DATABASE_URL"] = args.database_url
+
+import httpx  # noqa: E402
+from sqlalchemy import insert, text  # noqa: E402
+from app.main import app  # noqa: E402
+from app.db import Base, engine  # noqa: E402
+from app.auth import create_access_token  # noqa: E402
+from app.logging_models import Log, LogCategory, LogLevel  # noqa: E402
+from app.models import BotConfig, Trade, User  # noqa: E402
+from app.paper_trading_tracker import PaperTradingSnapshot  # noqa: E402
+from app.migration import run_db_migrations  # noqa: E402
+
+ENDPOINTS = [
+    "/api/health",
+    "/api/settings/bot-config",
+    "/api/trade/history",
+    "/api/logs?limit=50",
+    "/api/logs/ai-actions",
+    "/api/paper-trading/history?days=7&resolution=raw",
+    "/api/bot/positions/verify",
+]
+
+
+def seed():
+    now = datetime.utcnow()
+    rnd = random.Random(42)
+    with engine.begin() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM users WHERE username LIKE 'load_user_%'")).scalar()
+        if existing < args.users:
+            conn.execute(insert(User.__table__), [
+                {"username": f"load_user_{i}", "hashed_password": "x", "is_active": True, "is_admin": False}
+                for i in range(existing, args.users)
+            ])
+        users = [row[0] for row in conn.execute(text("SELECT id FROM users WHERE username LIKE 'load_user_%'"))]
+        if conn.execute(text("SELECT COUNT(*) FROM trades")).scalar():
+            return users
+        print(f"🌱 Seeding {args.trades:,} trades and {args.logs:,} logs over {len(users)} users...")
+        conn.execute(insert(BotConfig.__table__), [
+            {"user_id": u, "symbol": "BTC/USDT", "budget": 10_000.0, "paper_trading": True} for u in users
+        ])
+        conn.execute(insert(Trade.__table__), [{
+            "user_id": rnd.choice(users), "symbol": "BTC/USDT", "side": rnd.choice(("BUY", "SELL")),
+            "amount": rnd.uniform(0.001, 0.01), "price": rnd.uniform(20_000, 70_000), "status": "completed_paper",
+            "bot_type": "gods_hand", "timestamp": now - timedelta(minutes=rnd.randint(0, 525_600)),
+        } for _ in range(args.trades)])
+        categories = [LogCategory.AI_THINKING, LogCategory.AI_ACTION, LogCategory.BOT, LogCategory.TRADING]
+        conn.execute(insert(Log.__table__), [{
+            "user_id": rnd.choice(users), "category": rnd.choice(categories), "level": LogLevel.INFO,
+            "message": "seeded", "symbol": "BTC/USDT", "bot_type": "gods_hand",
+            "timestamp": now - timedelta(minutes=rnd.randint(0, 10_080)),
+        } for _ in range(args.logs)])
+        conn.execute(insert(PaperTradingSnapshot.__table__), [{
+            "user_id": u, "symbol": "BTC/USDT", "bot_type": "gods_hand", "current_balance": 10_000.0 + i,
+            "timestamp": now - timedelta(minutes=10 * i),
+        } for u in users for i in range(1000)])
+    return users
+
+
+async def run(users):
+    tokens = {u: create_access_token({"user_id": u, "username": f"load_user_{u}"}) for u in users}
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    rnd = random.Random(7)
+    plan = [(rnd.choice(ENDPOINTS), rnd.choice(users)) for _ in range(args.requests)]
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120) as client:
+        async def worker():
+            while not queue.empty():
+                path, user_id = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path, headers={"Authorization": f"Bearer {tokens[user_id]}"})
+                latencies[path].append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors[path] += 1
+
+        # Event-loop lag: how late a 10 ms timer fires while the workload runs. Bot loops,
+        # websockets and every other request wait this long whenever a handler blocks.
+        lag = []
+
+        async def probe():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag.append((time.perf_counter() - started) * 1000 - 10)
+
+        # Warm up connections and caches before measuring
+        for path in ENDPOINTS:
+            await client.get(path, headers={"Authorization": f"Bearer {tokens[users[0]]}"})
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        prober.cancel()
+
+    def pct(samples, q):
+        return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+    print(f"\n{args.requests} requests, concurrency {args.concurrency}: {elapsed:.1f}s ({args.requests / elapsed:.0f} req/s)")
+    print(f"{'endpoint':<52}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    everything = []
+    for path in ENDPOINTS:
+        samples = latencies[path]
+        everything += samples
+        if samples:
+            print(f"{path:<52}{len(samples):>6}{pct(samples, 50):>10.1f}{pct(samples, 99):>10.1f}{errors[path]:>8}")
+    print(f"{'all':<52}{len(everything):>6}{pct(everything, 50):>10.1f}{pct(everything, 99):>10.1f}{sum(errors.values()):>8}")
+    print(f"\nevent-loop lag: p50 {pct(lag, 50):.1f} ms, p99 {pct(lag, 99):.1f} ms, max {max(lag):.1f} ms")
+
+
+Base.metadata.create_all(bind=engine)
+run_db_migrations()
+print(f"📦 {engine.dialect.name}: {args.database_url}")
+asyncio.run(run(seed()))